@@ -21,9 +21,17 @@ sys.path.insert(
 )
 
 from config_utils import get_config
+from habitat import make_dataset
 from habitat.core.env import Env
 
 from home_robot.agent.objectnav_agent.objectnav_agent import ObjectNavAgent
+from home_robot.utils.episode_shards import (
+    EpisodeResultsLog,
+    get_shard_suffix,
+    in_shard,
+    merge_results_logs,
+    parse_shard,
+)
 from home_robot_sim.env.habitat_objectnav_env.habitat_objectnav_env import (
     HabitatObjectNavEnv,
 )
@@ -42,6 +50,22 @@ if __name__ == "__main__":
         default="projects/habitat_objectnav/configs/agent/hm3d_eval.yaml",
         help="Path to config yaml",
     )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="Evaluate the i-th of N shards of the episodes, as i/N",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the episodes already in the results log of the shard",
+    )
+    parser.add_argument(
+        "--merge_shards",
+        action="store_true",
+        help="Merge the results of all shards of the evaluation instead of evaluating",
+    )
     parser.add_argument(
         "opts",
         default=None,
@@ -59,13 +83,37 @@ if __name__ == "__main__":
     config.PRINT_IMAGES = 1
     config.habitat.dataset.split = "val"
 
-    agent = ObjectNavAgent(config=config)
-    env = HabitatObjectNavEnv(Env(config=config), config=config)
-
     results_dir = os.path.join(config.DUMP_LOCATION, "results", config.EXP_NAME)
     os.makedirs(results_dir, exist_ok=True)
-    episode_metrics = {}
-    for i in range(len(env.habitat_env.episodes)):
+    if args.merge_shards:
+        episode_metrics = merge_results_logs(results_dir)
+        print(f"Merged results of {len(episode_metrics)} episodes")
+        with open(f"{results_dir}/episode_results.json", "w") as f:
+            json.dump(episode_metrics, f, indent=4)
+        sys.exit(0)
+
+    # Evaluate the episodes of the shard not in its results log yet when resuming,
+    # filtering the dataset before creating the environment so that its episode
+    # iterator only goes through them
+    shard = parse_shard(args.shard)
+    results_log = EpisodeResultsLog(results_dir, shard)
+    episode_metrics = results_log.start(args.resume)
+    dataset = make_dataset(config.habitat.dataset.type, config=config.habitat.dataset)
+    episodes = [
+        episode
+        for episode in dataset.episodes
+        if in_shard(episode.scene_id + "_" + episode.episode_id, shard)
+        and episode.scene_id + "_" + episode.episode_id not in episode_metrics
+    ]
+    print(f"{len(episodes)} episodes left to evaluate in {results_log.path}")
+    if len(episodes) == 0:
+        sys.exit(0)
+    dataset.episodes = episodes
+
+    agent = ObjectNavAgent(config=config)
+    env = HabitatObjectNavEnv(Env(config=config, dataset=dataset), config=config)
+
+    for i in range(len(episodes)):
         agent.reset()
         env.reset()
         scene_id = env.habitat_env.current_episode.scene_id
@@ -80,5 +128,8 @@ if __name__ == "__main__":
         metrics = env.get_episode_metrics()
         metrics["num_steps"] = t
         episode_metrics[scene_id + "_" + episode_id] = metrics
-        with open(f"{results_dir}/episode_results.json", "w") as f:
+        results_log.append(scene_id + "_" + episode_id, metrics)
+        with open(
+            f"{results_dir}/episode_results{get_shard_suffix(shard)}.json", "w"
+        ) as f:
             json.dump(episode_metrics, f, indent=4)
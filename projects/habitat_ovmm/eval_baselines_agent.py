@@ -6,8 +6,10 @@
 
 import argparse
 import os
+import sys
 
 from evaluator import OVMMEvaluator
+from omegaconf import open_dict, read_write
 from utils.config_utils import (
     get_habitat_config,
     get_ovmm_baseline_config,
@@ -50,6 +52,22 @@ if __name__ == "__main__":
         choices=["baseline", "random"],
         help="Agent to evaluate",
     )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="Evaluate the i-th of N shards of the episodes, as i/N",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the episodes already in the results log of the shard",
+    )
+    parser.add_argument(
+        "--merge_shards",
+        action="store_true",
+        help="Merge the results of all shards of the evaluation instead of evaluating",
+    )
     parser.add_argument(
         "overrides",
         default=None,
@@ -72,6 +90,18 @@ if __name__ == "__main__":
     # merge habitat and baseline configs
     eval_config = merge_configs(habitat_config, baseline_config)
 
+    if args.shard is not None:
+        with read_write(eval_config), open_dict(eval_config):
+            eval_config.EVAL_SHARD = args.shard
+
+    if args.resume:
+        with read_write(eval_config), open_dict(eval_config):
+            eval_config.EVAL_RESUME = 1
+
+    if args.merge_shards:
+        OVMMEvaluator(eval_config).merge_shard_results()
+        sys.exit(0)
+
     # create agent
     if args.agent_type == "random":
         agent = RandomAgent(eval_config)
@@ -8,16 +8,26 @@ import json
 import os
 import time
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from enum import Enum
-from typing import TYPE_CHECKING, Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from habitat_baselines.rl.ppo.ppo_trainer import PPOTrainer
 from omegaconf import DictConfig
 from tqdm import tqdm
-from utils.env_utils import create_ovmm_env_fn
-from utils.metrics_utils import get_stats_from_episode_metrics
+from utils.env_utils import create_ovmm_env_fn, get_episode_key
+from utils.metrics_utils import StreamingMetrics, get_stats_from_episode_metrics
+
+from home_robot.utils.binary_transport import RemoteEnvClient, get_array_codecs
+from home_robot.utils.episode_shards import (
+    EpisodeResultsLog,
+    get_shard_suffix,
+    merge_results_logs,
+    parse_shard,
+)
+from home_robot.utils.profiler import configure_profiler
 
 if TYPE_CHECKING:
     from habitat.core.vector_env import VectorEnv
@@ -36,12 +46,24 @@ class OVMMEvaluator(PPOTrainer):
 
     def __init__(self, eval_config: DictConfig) -> None:
         self.metrics_save_freq = eval_config.EVAL_VECTORIZED.metrics_save_freq
+        self.async_stepping = eval_config.EVAL_VECTORIZED.get("async_stepping", 0)
         self.results_dir = os.path.join(
             eval_config.DUMP_LOCATION, "results", eval_config.EXP_NAME
         )
         self.videos_dir = eval_config.habitat_baselines.video_dir
         os.makedirs(self.results_dir, exist_ok=True)
         os.makedirs(self.videos_dir, exist_ok=True)
+        # Shard of the episodes to evaluate, and log of the finished episodes of the
+        # shard, to resume from if EVAL_RESUME is set
+        self.shard = parse_shard(eval_config.get("EVAL_SHARD"))
+        self.results_log = EpisodeResultsLog(self.results_dir, self.shard)
+        self.resume = bool(eval_config.get("EVAL_RESUME", 0))
+        self.streaming_metrics = StreamingMetrics()
+        # Timing of agent stages, written per episode to the results directory
+        self.profiler = configure_profiler(eval_config)
+        self.profiler_chrome_trace = (eval_config.get("PROFILER") or {}).get(
+            "chrome_trace", True
+        )
 
         super().__init__(eval_config)
 
@@ -72,6 +94,94 @@ class OVMMEvaluator(PPOTrainer):
             print(f"{k}: {v}")
         print("=" * 50)
 
+    def _load_results_log(self) -> Dict[str, Dict]:
+        """Metrics of the episodes already evaluated when resuming, else starts a new
+        results log. Restarts the running metrics from these episodes."""
+        episode_metrics = self.results_log.start(self.resume)
+        self.streaming_metrics = StreamingMetrics()
+        for metrics in episode_metrics.values():
+            self.streaming_metrics.add_episode(metrics)
+        return episode_metrics
+
+    def _add_finished_episode(self, episode_key: str, metrics: Dict):
+        """Appends a finished episode to the results log and the running metrics, writes
+        the profile of the episode if profiling, and writes a summary of the running
+        metrics every metrics_save_freq episodes"""
+        self.results_log.append(episode_key, metrics)
+        self.streaming_metrics.add_episode(metrics)
+        if self.profiler is not None:
+            # With several environments, spans since the previous finished episode
+            self.profiler.write(
+                self.results_dir, episode_key, chrome_trace=self.profiler_chrome_trace
+            )
+        if self.streaming_metrics.num_episodes % self.metrics_save_freq == 0:
+            self._write_running_summary()
+
+    def _write_running_summary(self):
+        """Writes and prints aggregated metrics of the episodes finished so far. Metrics
+        of each episode are in the results log."""
+        suffix = get_shard_suffix(self.shard)
+        with open(f"{self.results_dir}/aggregated_results{suffix}.json", "w") as f:
+            json.dump(self.streaming_metrics.aggregate(), f, indent=4)
+        self._print_summary(self.streaming_metrics.summarize())
+
+    def _update_episode_metrics(
+        self,
+        episode_metrics: Dict[str, Dict],
+        episode_key: str,
+        info: Dict,
+        hab_info: Dict,
+        episode_end: bool,
+    ):
+        """Records metrics of an environment after a step: after each skill finishes, and
+        at the end of the episode, in which case the episode is added to the results log
+        and running metrics."""
+        if episode_key not in episode_metrics:
+            episode_metrics[episode_key] = {}
+        # Record metrics after each skill finishes. This is useful for debugging.
+        if "skill_done" in info and info["skill_done"] != "":
+            metrics = self._extract_scalars_from_info(hab_info)
+            metrics_at_skill_end = {
+                f"{info['skill_done']}." + k: v for k, v in metrics.items()
+            }
+            episode_metrics[episode_key] = {
+                **metrics_at_skill_end,
+                **episode_metrics[episode_key],
+            }
+            if "goal_name" in episode_metrics[episode_key]:
+                episode_metrics[episode_key]["goal_name"] = info["goal_name"]
+        if episode_end:
+            metrics = self._extract_scalars_from_info(hab_info)
+            metrics_at_episode_end = {"END." + k: v for k, v in metrics.items()}
+            episode_metrics[episode_key] = {
+                **metrics_at_episode_end,
+                **episode_metrics[episode_key],
+            }
+            if "goal_name" in episode_metrics[episode_key]:
+                episode_metrics[episode_key]["goal_name"] = info["goal_name"]
+            self._add_finished_episode(episode_key, episode_metrics[episode_key])
+
+    def _skip_completed_episodes(
+        self,
+        envs: "VectorEnv",
+        e: int,
+        obs,
+        episode_idxs: List[int],
+        num_episodes_per_env: List[int],
+        completed: set,
+    ):
+        """Resets environment e until its current episode is not in the results log,
+        counting skipped episodes as evaluated. Returns observations of the current
+        episode."""
+        while episode_idxs[e] < num_episodes_per_env[e]:
+            episode = envs.call_at(e, "get_current_episode")
+            if get_episode_key(episode) not in completed:
+                break
+            episode_idxs[e] += 1
+            if episode_idxs[e] < num_episodes_per_env[e]:
+                obs = envs.call_at(e, "reset")
+        return obs
+
     def _evaluate_vectorized(
         self,
         agent: "OpenVocabManipAgent",
@@ -88,7 +198,16 @@ class OVMMEvaluator(PPOTrainer):
         else:
             num_episodes_per_env = [num_episodes_per_env] * envs.num_envs
 
-        episode_metrics = {}
+        # Resume from the episodes already evaluated, if resuming
+        episode_metrics = self._load_results_log()
+        completed = set(episode_metrics)
+        if len(completed) > 0:
+            print(f"Skipping {len(completed)} episodes in {self.results_log.path}")
+
+        if self.async_stepping:
+            return self._evaluate_vectorized_async(
+                agent, envs, num_episodes_per_env, episode_metrics
+            )
 
         def stop():
             return all(
@@ -101,12 +220,18 @@ class OVMMEvaluator(PPOTrainer):
         start_time = time.time()
         episode_idxs = [0] * envs.num_envs
         obs = envs.call(["reset"] * envs.num_envs)
+        for e in range(envs.num_envs):
+            obs[e] = self._skip_completed_episodes(
+                envs, e, obs[e], episode_idxs, num_episodes_per_env, completed
+            )
 
-        agent.reset_vectorized(self.envs.current_episodes())
+        agent.reset_vectorized(envs.current_episodes())
         while not stop():
-            current_episodes_info = self.envs.current_episodes()
-            # TODO: Currently agent can work with only 1 env, Parallelize act across envs
-            actions, infos, _ = zip(*[agent.act(ob) for ob in obs])
+            current_episodes_info = envs.current_episodes()
+            if hasattr(agent, "act_vectorized"):
+                actions, infos, _ = zip(*agent.act_vectorized(obs))
+            else:
+                actions, infos, _ = zip(*[agent.act(ob) for ob in obs])
 
             outputs = envs.call(
                 ["apply_action"] * envs.num_envs,
@@ -115,51 +240,124 @@ class OVMMEvaluator(PPOTrainer):
 
             obs, dones, hab_infos = [list(x) for x in zip(*outputs)]
             for e, (done, info, hab_info) in enumerate(zip(dones, infos, hab_infos)):
-                episode_key = (
-                    f"{current_episodes_info[e].scene_id.split('/')[-1].split('.')[0]}_"
-                    f"{current_episodes_info[e].episode_id}"
+                episode_key = get_episode_key(current_episodes_info[e])
+                # environment times out
+                episode_end = done and episode_idxs[e] < num_episodes_per_env[e]
+                self._update_episode_metrics(
+                    episode_metrics, episode_key, info, hab_info, episode_end
                 )
-                if episode_key not in episode_metrics:
-                    episode_metrics[episode_key] = {}
-                # Record metrics after each skill finishes. This is useful for debugging.
-                if "skill_done" in info and info["skill_done"] != "":
-                    metrics = self._extract_scalars_from_info(hab_info)
-                    metrics_at_skill_end = {
-                        f"{info['skill_done']}." + k: v for k, v in metrics.items()
-                    }
-                    episode_metrics[episode_key] = {
-                        **metrics_at_skill_end,
-                        **episode_metrics[episode_key],
-                    }
-                    if "goal_name" in episode_metrics[episode_key]:
-                        episode_metrics[episode_key]["goal_name"] = info["goal_name"]
-                if done:  # environment times out
-                    metrics = self._extract_scalars_from_info(hab_info)
-                    if episode_idxs[e] < num_episodes_per_env[e]:
-                        metrics_at_episode_end = {
-                            f"END." + k: v for k, v in metrics.items()
-                        }
-                        episode_metrics[episode_key] = {
-                            **metrics_at_episode_end,
-                            **episode_metrics[episode_key],
-                        }
-                        if "goal_name" in episode_metrics[episode_key]:
-                            episode_metrics[episode_key]["goal_name"] = info[
-                                "goal_name"
-                            ]
-                        episode_idxs[e] += 1
-                        print(
-                            f"Episode indexes {episode_idxs[e]} / {num_episodes_per_env[e]} "
-                            f"after {round(time.time() - start_time, 2)} seconds"
+                if episode_end:
+                    episode_idxs[e] += 1
+                    print(
+                        f"Episode indexes {episode_idxs[e]} / {num_episodes_per_env[e]} "
+                        f"after {round(time.time() - start_time, 2)} seconds"
+                    )
+                if done and not stop():
+                    obs[e] = self._skip_completed_episodes(
+                        envs,
+                        e,
+                        envs.call_at(e, "reset"),
+                        episode_idxs,
+                        num_episodes_per_env,
+                        completed,
+                    )
+                    agent.reset_vectorized_for_env(
+                        e, envs.call_at(e, "get_current_episode")
+                    )
+
+        envs.close()
+
+        aggregated_metrics = self._aggregate_metrics(episode_metrics)
+        self._write_results(episode_metrics, aggregated_metrics)
+        return aggregated_metrics
+
+    def _evaluate_vectorized_async(
+        self,
+        agent: "OpenVocabManipAgent",
+        envs: "VectorEnv",
+        num_episodes_per_env: List[int],
+        episode_metrics: Dict[str, Dict],
+    ):
+        """Same as _evaluate_vectorized, without waiting for all environments at each step.
+
+        Each environment steps in its own thread, so that the agent acts in the environments
+        that are done simulating while the others are still simulating. Environments stop
+        once they have finished their episodes instead of running until all are done.
+        """
+        completed = set(episode_metrics)
+        episode_idxs = [0] * envs.num_envs
+        start_time = time.time()
+
+        obs = envs.call(["reset"] * envs.num_envs)
+        for e in range(envs.num_envs):
+            obs[e] = self._skip_completed_episodes(
+                envs, e, obs[e], episode_idxs, num_episodes_per_env, completed
+            )
+        current_episodes = list(envs.current_episodes())
+        agent.reset_vectorized(current_episodes)
+        # Observations of the environments waiting for an action
+        ready = {
+            e: obs[e]
+            for e in range(envs.num_envs)
+            if episode_idxs[e] < num_episodes_per_env[e]
+        }
+        # Environments being simulated, and the info of their last action
+        pending: Dict[Future, Tuple[int, Dict]] = {}
+
+        with ThreadPoolExecutor(max_workers=envs.num_envs) as executor:
+            while len(ready) > 0 or len(pending) > 0:
+                if len(ready) > 0:
+                    env_ids = sorted(ready)
+                    if hasattr(agent, "act_vectorized"):
+                        outputs = agent.act_vectorized(
+                            [ready[e] for e in env_ids], env_ids=env_ids
+                        )
+                    else:
+                        outputs = [agent.act(ready[e]) for e in env_ids]
+                    ready = {}
+                    for e, (action, info, _) in zip(env_ids, outputs):
+                        # Only the thread of an environment uses its connection, and
+                        # only while the environment is pending
+                        future = executor.submit(
+                            envs.call_at,
+                            e,
+                            "apply_action",
+                            {"action": action, "info": info},
                         )
-                    if len(episode_metrics) % self.metrics_save_freq == 0:
-                        aggregated_metrics = self._aggregate_metrics(episode_metrics)
-                        self._write_results(episode_metrics, aggregated_metrics)
-                    if not stop():
-                        obs[e] = envs.call_at(e, "reset")
-                        agent.reset_vectorized_for_env(
-                            e, self.envs.current_episodes()[e]
+                        pending[future] = (e, info)
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    e, info = pending.pop(future)
+                    obs_e, done, hab_info = future.result()
+                    episode_key = get_episode_key(current_episodes[e])
+                    self._update_episode_metrics(
+                        episode_metrics, episode_key, info, hab_info, done
+                    )
+                    if not done:
+                        ready[e] = obs_e
+                        continue
+
+                    episode_idxs[e] += 1
+                    print(
+                        f"Environment {e}: episode indexes {episode_idxs[e]} / "
+                        f"{num_episodes_per_env[e]} after "
+                        f"{round(time.time() - start_time, 2)} seconds"
+                    )
+                    if episode_idxs[e] < num_episodes_per_env[e]:
+                        obs_e = self._skip_completed_episodes(
+                            envs,
+                            e,
+                            envs.call_at(e, "reset"),
+                            episode_idxs,
+                            num_episodes_per_env,
+                            completed,
                         )
+                    # Skipping evaluated episodes may have finished the environment
+                    if episode_idxs[e] < num_episodes_per_env[e]:
+                        ready[e] = obs_e
+                        current_episodes[e] = envs.call_at(e, "get_current_episode")
+                        agent.reset_vectorized_for_env(e, current_episodes[e])
 
         envs.close()
 
@@ -200,16 +398,31 @@ class OVMMEvaluator(PPOTrainer):
         return aggregated_metrics
 
     def _write_results(
-        self, episode_metrics: Dict[str, Dict], aggregated_metrics: Dict[str, float]
+        self,
+        episode_metrics: Dict[str, Dict],
+        aggregated_metrics: Dict[str, float],
+        suffix: Optional[str] = None,
     ) -> None:
-        """Writes metrics tracked by environment to a file."""
-        with open(f"{self.results_dir}/aggregated_results.json", "w") as f:
+        """Writes metrics tracked by environment to a file. Files of a shard end with the
+        suffix of the shard unless another suffix is given."""
+        if suffix is None:
+            suffix = get_shard_suffix(self.shard)
+        with open(f"{self.results_dir}/aggregated_results{suffix}.json", "w") as f:
             json.dump(aggregated_metrics, f, indent=4)
-        with open(f"{self.results_dir}/episode_results.json", "w") as f:
+        with open(f"{self.results_dir}/episode_results{suffix}.json", "w") as f:
             json.dump(episode_metrics, f, indent=4)
         summary = self._summarize_metrics(episode_metrics)
         self._print_summary(summary)
 
+    def merge_shard_results(self) -> Dict[str, float]:
+        """Merges the results logs of all shards of the evaluation, and writes the
+        metrics of all episodes as if they had been evaluated in a single run."""
+        episode_metrics = merge_results_logs(self.results_dir)
+        print(f"Merged results of {len(episode_metrics)} episodes")
+        aggregated_metrics = self._aggregate_metrics(episode_metrics)
+        self._write_results(episode_metrics, aggregated_metrics, suffix="")
+        return aggregated_metrics
+
     def local_evaluate(
         self, agent, num_episodes: Optional[int] = None
     ) -> Dict[str, float]:
@@ -232,7 +445,9 @@ class OVMMEvaluator(PPOTrainer):
 
         assert num_episodes > 0, "num_episodes should be greater than 0"
 
-        episode_metrics: Dict = {}
+        # Resume from the episodes already evaluated, if resuming
+        episode_metrics: Dict = self._load_results_log()
+        completed = set(episode_metrics)
 
         count_episodes: int = 0
 
@@ -240,12 +455,13 @@ class OVMMEvaluator(PPOTrainer):
         while count_episodes < num_episodes:
             observations, done = self._env.reset(), False
             current_episode = self._env.get_current_episode()
+            current_episode_key = get_episode_key(current_episode)
+            if current_episode_key in completed:
+                count_episodes += 1
+                pbar.update(1)
+                continue
             agent.reset_vectorized([current_episode])
 
-            current_episode_key = (
-                f"{current_episode.scene_id.split('/')[-1].split('.')[0]}_"
-                f"{current_episode.episode_id}"
-            )
             current_episode_metrics = {}
 
             while not done:
@@ -274,9 +490,7 @@ class OVMMEvaluator(PPOTrainer):
                 current_episode_metrics["goal_name"] = info["goal_name"]
 
             episode_metrics[current_episode_key] = current_episode_metrics
-            if len(episode_metrics) % self.metrics_save_freq == 0:
-                aggregated_metrics = self._aggregate_metrics(episode_metrics)
-                self._write_results(episode_metrics, aggregated_metrics)
+            self._add_finished_episode(current_episode_key, current_episode_metrics)
 
             count_episodes += 1
             pbar.update(1)
@@ -317,10 +531,16 @@ class OVMMEvaluator(PPOTrainer):
         def grpc_loads(entity):
             return pickle.loads(entity)
 
+        remote_config = self.config.get("REMOTE_EVAL", {})
+        binary_transport = remote_config.get("transport", "pickle") == "binary"
+
         env_address_port = os.environ.get("EVALENV_ADDPORT", "localhost:8085")
         channel = grpc.insecure_channel(
             target=env_address_port,
-            compression=grpc.Compression.Gzip,
+            # Binary messages are already compressed where it pays off
+            compression=grpc.Compression.NoCompression
+            if binary_transport
+            else grpc.Compression.Gzip,
             options=[
                 (
                     "grpc.max_receive_message_length",
@@ -332,6 +552,11 @@ class OVMMEvaluator(PPOTrainer):
 
         stub.init_env(evaluation_pb2.Package())
 
+        if binary_transport:
+            return self._remote_evaluate_binary(
+                agent, stub, evaluation_pb2, remote_config, num_episodes
+            )
+
         env_num_episodes = grpc_loads(
             stub.number_of_episodes(evaluation_pb2.Package()).SerializedEntity
         )
@@ -345,7 +570,9 @@ class OVMMEvaluator(PPOTrainer):
 
         assert num_episodes > 0, "num_episodes should be greater than 0"
 
-        episode_metrics: Dict = {}
+        # Resume from the episodes already evaluated, if resuming
+        episode_metrics: Dict = self._load_results_log()
+        completed = set(episode_metrics)
 
         count_episodes: int = 0
 
@@ -358,12 +585,13 @@ class OVMMEvaluator(PPOTrainer):
             current_episode = grpc_loads(
                 stub.get_current_episode(evaluation_pb2.Package()).SerializedEntity
             )
+            current_episode_key = get_episode_key(current_episode)
+            if current_episode_key in completed:
+                count_episodes += 1
+                pbar.update(1)
+                continue
             agent.reset_vectorized([current_episode])
 
-            current_episode_key = (
-                f"{current_episode.scene_id.split('/')[-1].split('.')[0]}_"
-                f"{current_episode.episode_id}"
-            )
             current_episode_metrics = {}
 
             while not done:
@@ -399,9 +627,7 @@ class OVMMEvaluator(PPOTrainer):
                 current_episode_metrics["goal_name"] = info["goal_name"]
 
             episode_metrics[current_episode_key] = current_episode_metrics
-            if len(episode_metrics) % self.metrics_save_freq == 0:
-                aggregated_metrics = self._aggregate_metrics(episode_metrics)
-                self._write_results(episode_metrics, aggregated_metrics)
+            self._add_finished_episode(current_episode_key, current_episode_metrics)
 
             count_episodes += 1
             pbar.update(1)
@@ -438,3 +664,39 @@ class OVMMEvaluator(PPOTrainer):
             raise ValueError(
                 "Invalid evaluation type. Please choose from 'local', 'local_vectorized', 'remote'"
             )
+
+    def _remote_evaluate_binary(
+        self,
+        agent,
+        stub,
+        evaluation_pb2,
+        remote_config: DictConfig,
+        num_episodes: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """Evaluates the agent in remote environments served by a
+        home_robot.utils.binary_transport.RemoteEnvServer: observations and actions are
+        typed binary messages, and each message steps all the environments of the
+        server."""
+        num_envs = remote_config.get("num_environments", 1)
+
+        def send(method: str, message: bytes) -> bytes:
+            request = evaluation_pb2.Package(SerializedEntity=message)
+            return getattr(stub, method)(request).SerializedEntity
+
+        envs = RemoteEnvClient(
+            send,
+            num_envs=num_envs,
+            array_codecs=get_array_codecs(
+                remote_config.get("rgb_codec", "RAW"),
+                remote_config.get("compress_depth_semantic", 1),
+            ),
+            jpeg_quality=remote_config.get("jpeg_quality", 90),
+        )
+        num_episodes_per_env = None
+        if num_episodes is not None:
+            num_episodes_per_env = -(-num_episodes // num_envs)
+        aggregated_metrics = self._evaluate_vectorized(
+            agent, envs, num_episodes_per_env=num_episodes_per_env
+        )
+        stub.evalai_update_submission(evaluation_pb2.Package())
+        return aggregated_metrics
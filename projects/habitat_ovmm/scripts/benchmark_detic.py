@@ -0,0 +1,69 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import argparse
+import time
+
+import numpy as np
+
+from home_robot.core.interfaces import Observations
+from home_robot.perception.detection.detic.detic_perception import DeticPerception
+
+
+def make_observations(num: int, height: int, width: int) -> list:
+    """random frames standing in for observations of vectorized environments"""
+    rng = np.random.default_rng(0)
+    return [
+        Observations(
+            rgb=rng.integers(0, 255, (height, width, 3), dtype=np.uint8),
+            depth=rng.uniform(0.5, 5.0, (height, width)).astype(np.float32),
+            gps=np.zeros(2),
+            compass=np.zeros(1),
+            task_observations={},
+        )
+        for _ in range(num)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare per-frame and batched Detic throughput"
+    )
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--num_batches", type=int, default=3)
+    parser.add_argument("--height", type=int, default=640)
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument(
+        "--gpu_id", type=int, default=-1, help="GPU ID to run on, -1 for CPU"
+    )
+    parser.add_argument("--vocabulary", default="chair,table,cup,bed,sofa,sink")
+    args = parser.parse_args()
+
+    detic = DeticPerception(
+        vocabulary="custom", custom_vocabulary=args.vocabulary, sem_gpu_id=args.gpu_id
+    )
+    # Warm up
+    detic.predict(make_observations(1, args.height, args.width)[0])
+
+    for batch_size in args.batch_sizes:
+        obs_list = make_observations(batch_size, args.height, args.width)
+        t0 = time.time()
+        for _ in range(args.num_batches):
+            for obs in obs_list:
+                detic.predict(obs, depth_threshold=0.5, draw_instance_predictions=False)
+        t_single = time.time() - t0
+        t0 = time.time()
+        for _ in range(args.num_batches):
+            detic.predict_batch(
+                obs_list, depth_threshold=0.5, draw_instance_predictions=False
+            )
+        t_batch = time.time() - t0
+        num_frames = batch_size * args.num_batches
+        print(
+            f"batch size {batch_size:3d}: "
+            f"per-frame {num_frames / t_single:6.2f} fps, "
+            f"batched {num_frames / t_batch:6.2f} fps"
+        )
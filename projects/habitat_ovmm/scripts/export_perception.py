@@ -0,0 +1,134 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from home_robot.core.interfaces import Observations
+from home_robot.perception.detection.exported_backbone import load_exported_backbone
+
+
+def load_frames(frames_dir: str, num_frames: int) -> list:
+    """recorded RGB frames, as observations"""
+    paths = sorted(
+        glob.glob(os.path.join(frames_dir, "*.png"))
+        + glob.glob(os.path.join(frames_dir, "*.jpg"))
+    )[:num_frames]
+    assert len(paths) > 0, f"No frames found in {frames_dir}"
+    observations = []
+    for path in paths:
+        rgb = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        observations.append(
+            Observations(
+                rgb=rgb,
+                depth=None,
+                gps=np.zeros(2),
+                compass=np.zeros(1),
+                task_observations={},
+            )
+        )
+    return observations
+
+
+def run(predict, observations: list) -> tuple:
+    """semantic predictions and mean latency in seconds, after one warm up frame"""
+    predict(observations[0])
+    semantics, latencies = [], []
+    for obs in observations:
+        t0 = time.time()
+        semantics.append(predict(obs))
+        latencies.append(time.time() - t0)
+    return semantics, np.mean(latencies)
+
+
+def mean_iou(predictions: list, references: list) -> float:
+    """mean over frames and classes of the IoU of exported versus eager predictions"""
+    ious = []
+    for pred, ref in zip(predictions, references):
+        for c in np.union1d(np.unique(pred), np.unique(ref)):
+            ious.append(
+                np.mean((pred == c) & (ref == c)) / np.mean((pred == c) | (ref == c))
+            )
+    return float(np.mean(ious))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the backbone of a segmentation model and compare the exported "
+        "model to the eager one"
+    )
+    parser.add_argument("--model", choices=["detic", "maskrcnn"], default="detic")
+    parser.add_argument(
+        "--frames_dir", required=True, help="directory of recorded frames"
+    )
+    parser.add_argument("--num_frames", type=int, default=20)
+    parser.add_argument(
+        "--output",
+        default="data/checkpoints/detic_backbone.pt",
+        help=".pt or .onnx file",
+    )
+    parser.add_argument(
+        "--quantize", action="store_true", help="int8 dynamic quantization"
+    )
+    parser.add_argument(
+        "--gpu_id", type=int, default=-1, help="GPU ID to run on, -1 for CPU"
+    )
+    parser.add_argument("--vocabulary", default="chair,table,cup,bed,sofa,sink")
+    args = parser.parse_args()
+
+    observations = load_frames(args.frames_dir, args.num_frames)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+
+    if args.model == "detic":
+        from home_robot.perception.detection.detic.detic_perception import (
+            DeticPerception,
+        )
+
+        detic = DeticPerception(
+            vocabulary="custom",
+            custom_vocabulary=args.vocabulary,
+            sem_gpu_id=args.gpu_id,
+        )
+        model = detic.predictor.model
+
+        def predict(obs):
+            obs = detic.predict(obs, draw_instance_predictions=False)
+            return obs.semantic
+
+        detic.export_backbone(args.output, observations[0], quantize=args.quantize)
+    else:
+        from home_robot.perception.detection.coco_maskrcnn.coco_maskrcnn import (
+            COCOMaskRCNN,
+        )
+
+        maskrcnn = COCOMaskRCNN(0.9, args.gpu_id, visualize=False)
+        model = maskrcnn.segmentation_model.demo.predictor.model
+
+        def predict(obs):
+            image = cv2.cvtColor(obs.rgb, cv2.COLOR_RGB2BGR)[None]
+            one_hot, _ = maskrcnn.get_prediction(image)
+            return np.where(one_hot[0].any(-1), one_hot[0].argmax(-1) + 1, 0)
+
+        maskrcnn.export_backbone(
+            args.output,
+            cv2.cvtColor(observations[0].rgb, cv2.COLOR_RGB2BGR),
+            quantize=args.quantize,
+        )
+
+    eager_semantics, eager_latency = run(predict, observations)
+    load_exported_backbone(model, args.output)
+    exported_semantics, exported_latency = run(predict, observations)
+
+    print(f"Exported backbone to {args.output} (quantized: {args.quantize})")
+    print(f"eager latency:    {eager_latency * 1000:7.1f} ms/frame")
+    print(f"exported latency: {exported_latency * 1000:7.1f} ms/frame")
+    print(f"speedup:          {eager_latency / exported_latency:7.2f}x")
+    print(f"mean IoU vs eager: {mean_iou(exported_semantics, eager_semantics):.3f}")
@@ -10,6 +10,7 @@ from habitat import make_dataset
 from habitat.core.environments import get_env_class
 from habitat.utils.gym_definitions import _get_env_name
 
+from home_robot.utils.episode_shards import in_shard, parse_shard
 from home_robot_sim.env.habitat_ovmm_env.habitat_ovmm_env import (
     HabitatOpenVocabManipEnv,
 )
@@ -18,17 +19,31 @@ if TYPE_CHECKING:
     from omegaconf import DictConfig
 
 
+def get_episode_key(episode) -> str:
+    """key of an episode in evaluation results"""
+    return f"{episode.scene_id.split('/')[-1].split('.')[0]}_{episode.episode_id}"
+
+
 def create_ovmm_env_fn(config: "DictConfig") -> HabitatOpenVocabManipEnv:
     """
     Creates an environment for the OVMM task.
 
     Creates habitat environment from config and wraps it into HabitatOpenVocabManipEnv.
+    If config.EVAL_SHARD is set to "i/N", only the episodes of the i-th of N shards are
+    kept.
 
     :param config: configuration for the environment.
     :return: environment instance.
     """
     habitat_config = config.habitat
     dataset = make_dataset(habitat_config.dataset.type, config=habitat_config.dataset)
+    shard = parse_shard(config.get("EVAL_SHARD"))
+    if shard is not None:
+        dataset.episodes = [
+            episode
+            for episode in dataset.episodes
+            if in_shard(get_episode_key(episode), shard)
+        ]
     env_class_name = _get_env_name(config)
     env_class = get_env_class(env_class_name)
     habitat_env = env_class(config=habitat_config, dataset=dataset)
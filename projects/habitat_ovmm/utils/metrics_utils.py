@@ -4,7 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
 
@@ -111,3 +111,92 @@ def get_stats_from_episode_metrics(
     aggregated_metrics = aggregate_metrics(episode_metrics)
     stats = compute_stats(aggregated_metrics)
     return stats
+
+
+class StreamingMetrics:
+    """Running count, sum, min and max of each metric over finished episodes.
+
+    Updated once per episode, so that intermediate results cost O(number of metrics)
+    instead of O(number of episodes). Metrics after each skill keep their skill prefix
+    (e.g. "NAV_TO_OBJ.ovmm_dist_to_pick_goal"), metrics at the end of the episode
+    the "END." prefix.
+    """
+
+    def __init__(self):
+        self.num_episodes = 0
+        # metric -> [count, sum, min, max]
+        self._stats: Dict[str, List[float]] = {}
+        # Per-episode measures of get_stats_from_episode_metrics
+        self._derived_stats: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def _update(stats: Dict[str, List[float]], key: str, value: float):
+        if key not in stats:
+            stats[key] = [1, value, value, value]
+            return
+        s = stats[key]
+        s[0] += 1
+        s[1] += value
+        s[2] = min(s[2], value)
+        s[3] = max(s[3], value)
+
+    def add_episode(self, episode_metrics: Dict[str, Any]):
+        """adds the metrics of a finished episode"""
+        self.num_episodes += 1
+        for k, v in episode_metrics.items():
+            if k != "goal_name":
+                self._update(self._stats, k, float(v))
+
+        # Success without robot collisions, and partial success
+        if "END.ovmm_place_success" not in episode_metrics:
+            return
+        overall_success = float(
+            episode_metrics.get("END.robot_collisions.robot_scene_colls") == 0
+            and episode_metrics["END.ovmm_place_success"] == 1
+        )
+        self._update(self._derived_stats, "overall_success", overall_success)
+        phases = [
+            "END.ovmm_find_object_phase_success",
+            "END.ovmm_pick_object_phase_success",
+            "END.ovmm_find_recep_phase_success",
+        ]
+        if all(k in episode_metrics for k in phases):
+            partial_success = (
+                sum(episode_metrics[k] for k in phases) + overall_success
+            ) / 4.0
+            self._update(self._derived_stats, "partial_success", partial_success)
+
+    def aggregate(self) -> Dict[str, float]:
+        """mean, min and max of each metric, in the format of
+        OVMMEvaluator._aggregate_metrics"""
+        aggregated_metrics = {}
+        for k, (count, total, min_value, max_value) in self._stats.items():
+            aggregated_metrics[f"{k}/total/mean"] = total / count
+            aggregated_metrics[f"{k}/total/min"] = min_value
+            aggregated_metrics[f"{k}/total/max"] = max_value
+        return dict(sorted(aggregated_metrics.items()))
+
+    def summarize(self) -> dict:
+        """Running version of the statistics of get_stats_from_episode_metrics, over the
+        episodes added so far. Metrics no episode has are left out."""
+
+        def mean(stats, k):
+            return stats[k][1] / stats[k][0]
+
+        stats = {}
+        if "END.ovmm_place_success" in self._stats:
+            stats["episode_count"] = self._stats["END.ovmm_place_success"][0]
+        if "END.does_want_terminate" in self._stats:
+            stats["does_want_terminate"] = mean(self._stats, "END.does_want_terminate")
+        if "END.num_steps" in self._stats:
+            stats["num_steps"] = mean(self._stats, "END.num_steps")
+        for k in self._stats:
+            if (
+                "phase_success" in k
+                and "END" in k
+                and k != "END.ovmm_place_object_phase_success"
+            ):
+                stats[k.replace("END.ovmm_", "")] = mean(self._stats, k)
+        for k in self._derived_stats:
+            stats[k] = mean(self._derived_stats, k)
+        return stats
@@ -32,6 +32,8 @@ from home_robot.mapping.semantic.categorical_2d_semantic_map_module import (
 from home_robot.mapping.semantic.categorical_2d_semantic_map_state import (
     Categorical2DSemanticMapState,
 )
+from home_robot.perception.cached_perception import CachedPerception
+from home_robot.perception.detection.deferred_visualization import get_visualization
 from home_robot.perception.detection.detic.detic_perception import DeticPerception
 
 # Semantic segmentation categories predicted from frames and projected in the map
@@ -208,7 +210,9 @@ def get_semantic_map_vis(
 
     # Draw semantic frame
     # vis_image[50:530, 15:655] = cv2.resize(semantic_frame[:, :, ::-1], (640, 480))
-    vis_image[50:530, 15:655] = cv2.resize(semantic_frame, (640, 480))
+    vis_image[50:530, 15:655] = cv2.resize(
+        get_visualization(semantic_frame), (640, 480)
+    )
 
     # Draw depth frame
     vis_image[50:530, 670:1310] = cv2.resize(depth_frame, (640, 480))
@@ -258,7 +262,18 @@ def create_video(images, output_file, fps):
     "--legend_path",
     default=f"{str(Path(__file__).resolve().parent)}/coco_categories_legend.png",
 )
-def main(input_trajectory_dir: str, output_visualization_dir: str, legend_path: str):
+@click.option(
+    "--perception_cache_dir",
+    default=None,
+    help="directory to cache segmentation predictions in, to skip Detic on frames "
+    "it already segmented",
+)
+def main(
+    input_trajectory_dir: str,
+    output_visualization_dir: str,
+    legend_path: str,
+    perception_cache_dir: str,
+):
     # --------------------------------------------------------------------------------------------
     # Load trajectory of home_robot Observations
     # --------------------------------------------------------------------------------------------
@@ -279,12 +294,16 @@ def main(input_trajectory_dir: str, output_visualization_dir: str, legend_path:
         custom_vocabulary=",".join(categories),
         sem_gpu_id=0,
     )
+    if perception_cache_dir is not None:
+        segmentation = CachedPerception(segmentation, perception_cache_dir)
     observations = [
         segmentation.predict(obs, depth_threshold=None) for obs in observations
     ]
     for obs in observations:
         obs.semantic[obs.semantic == 0] = len(categories) - 1
         obs.semantic = obs.semantic - 1
+    if perception_cache_dir is not None:
+        print("Perception cache:", segmentation.get_stats())
 
     print()
     print("home_robot observations:")
@@ -81,22 +81,23 @@ class IINAgentModule(nn.Module):
         score_func = self.goal_policy_config.score_function
         assert score_func in ["confidence_sum", "match_count"]
 
-        for e in range(confidence.shape[0]):
-            # if the goal category is empty, the goal can't be found
-            if not local_map[e, -1].any().item():
-                continue
-
-            if score_func == "confidence_sum":
-                score = confidence[e][matches[e] != -1].sum()
-            else:  # match_count
-                score = (matches[e] != -1).sum()
-
-            if score < self.goal_policy_config.score_thresh:
-                continue
-
-            found_goal[e] = True
-            # Set goal_map to the last channel of the local semantic map
-            goal_map[e, 0] = local_map[e, -1]
+        device = local_map.device
+        matches = torch.as_tensor(matches, device=device)
+        confidence = torch.as_tensor(confidence, device=device)
+        is_match = matches != -1
+
+        if score_func == "confidence_sum":
+            score = (confidence * is_match).sum(dim=1)
+        else:  # match_count
+            score = is_match.sum(dim=1)
+
+        # if the goal category is empty, the goal can't be found
+        has_goal = local_map[:, -1].flatten(1).any(dim=1)
+        found = has_goal & (score >= self.goal_policy_config.score_thresh)
+
+        found_goal[found] = True
+        # Set goal_map to the last channel of the local semantic map
+        goal_map[found, 0] = local_map[found, -1]
 
         return goal_map, found_goal
 
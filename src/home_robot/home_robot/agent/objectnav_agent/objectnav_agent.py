@@ -3,7 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -16,6 +16,8 @@ from home_robot.mapping.semantic.categorical_2d_semantic_map_state import (
     Categorical2DSemanticMapState,
 )
 from home_robot.navigation_planner.discrete_planner import DiscretePlanner
+from home_robot.utils.frame_sink import configure_frame_sink
+from home_robot.utils.profiler import profiler
 
 from .objectnav_agent_module import ObjectNavAgentModule
 
@@ -63,24 +65,31 @@ class ObjectNavAgent(Agent):
         agent_cell_radius = int(
             np.ceil(agent_radius_cm / config.AGENT.SEMANTIC_MAP.map_resolution)
         )
-        self.planner = DiscretePlanner(
-            turn_angle=config.ENVIRONMENT.turn_angle,
-            collision_threshold=config.AGENT.PLANNER.collision_threshold,
-            step_size=config.AGENT.PLANNER.step_size,
-            obs_dilation_selem_radius=config.AGENT.PLANNER.obs_dilation_selem_radius,
-            goal_dilation_selem_radius=config.AGENT.PLANNER.goal_dilation_selem_radius,
-            map_size_cm=config.AGENT.SEMANTIC_MAP.map_size_cm,
-            map_resolution=config.AGENT.SEMANTIC_MAP.map_resolution,
-            visualize=config.VISUALIZE,
-            print_images=config.PRINT_IMAGES,
-            dump_location=config.DUMP_LOCATION,
-            exp_name=config.EXP_NAME,
-            agent_cell_radius=agent_cell_radius,
-            min_obs_dilation_selem_radius=config.AGENT.PLANNER.min_obs_dilation_selem_radius,
-            map_downsample_factor=config.AGENT.PLANNER.map_downsample_factor,
-            map_update_frequency=config.AGENT.PLANNER.map_update_frequency,
-            discrete_actions=config.AGENT.PLANNER.discrete_actions,
-        )
+        # Planner snapshots are written in the background of the agent process
+        configure_frame_sink(config)
+        # Planners keep collision and visited maps, so each environment has its own
+        self.planners = [
+            DiscretePlanner(
+                turn_angle=config.ENVIRONMENT.turn_angle,
+                collision_threshold=config.AGENT.PLANNER.collision_threshold,
+                step_size=config.AGENT.PLANNER.step_size,
+                obs_dilation_selem_radius=config.AGENT.PLANNER.obs_dilation_selem_radius,
+                goal_dilation_selem_radius=config.AGENT.PLANNER.goal_dilation_selem_radius,
+                map_size_cm=config.AGENT.SEMANTIC_MAP.map_size_cm,
+                map_resolution=config.AGENT.SEMANTIC_MAP.map_resolution,
+                visualize=config.VISUALIZE,
+                print_images=config.PRINT_IMAGES,
+                dump_location=config.DUMP_LOCATION,
+                exp_name=config.EXP_NAME,
+                agent_cell_radius=agent_cell_radius,
+                min_obs_dilation_selem_radius=config.AGENT.PLANNER.min_obs_dilation_selem_radius,
+                map_downsample_factor=config.AGENT.PLANNER.map_downsample_factor,
+                map_update_frequency=config.AGENT.PLANNER.map_update_frequency,
+                discrete_actions=config.AGENT.PLANNER.discrete_actions,
+            )
+            for _ in range(self.num_environments)
+        ]
+        self.planner = self.planners[0]
         self.one_hot_encoding = torch.eye(
             config.AGENT.SEMANTIC_MAP.num_sem_categories, device=self.device
         )
@@ -107,6 +116,7 @@ class ObjectNavAgent(Agent):
         end_recep_goal_category: torch.Tensor = None,
         nav_to_recep: torch.Tensor = None,
         camera_pose: torch.Tensor = None,
+        env_ids: Optional[List[int]] = None,
     ) -> Tuple[List[dict], List[dict]]:
         """Prepare low-level planner inputs from an observation - this is
         the main inference function of the agent that lets it interact with
@@ -123,6 +133,8 @@ class ObjectNavAgent(Agent):
             start_recep_goal_category: semantic category of start receptacle goals
             end_recep_goal_category: semantic category of end receptacle goals
             camera_pose: camera extrinsic pose of shape (num_environments, 4, 4)
+            env_ids: if given, only the maps of these environments are updated, and inputs
+             have len(env_ids) instead of num_environments as first dimension
 
         Returns:
             planner_inputs: list of num_environments planner inputs dicts containing
@@ -137,12 +149,17 @@ class ObjectNavAgent(Agent):
                 semantic_map: (M, M) np.ndarray containing local semantic map
                  predictions
         """
-        dones = torch.tensor([False] * self.num_environments)
+        if env_ids is None:
+            env_ids = list(range(self.num_environments))
+        # Maps of a subset of environments are gathered, updated and scattered back
+        all_envs = env_ids == list(range(self.num_environments))
+
+        def select(x: torch.Tensor) -> torch.Tensor:
+            return x if all_envs else x[env_ids]
+
+        dones = torch.tensor([False] * len(env_ids))
         update_global = torch.tensor(
-            [
-                self.timesteps_before_goal_update[e] == 0
-                for e in range(self.num_environments)
-            ]
+            [self.timesteps_before_goal_update[e] == 0 for e in env_ids]
         )
 
         if object_goal_category is not None:
@@ -155,8 +172,8 @@ class ObjectNavAgent(Agent):
             goal_map,
             found_goal,
             frontier_map,
-            self.semantic_map.local_map,
-            self.semantic_map.global_map,
+            local_map,
+            global_map,
             seq_local_pose,
             seq_global_pose,
             seq_lmb,
@@ -167,39 +184,47 @@ class ObjectNavAgent(Agent):
             dones.unsqueeze(1),
             update_global.unsqueeze(1),
             camera_pose,
-            self.semantic_map.local_map,
-            self.semantic_map.global_map,
-            self.semantic_map.local_pose,
-            self.semantic_map.global_pose,
-            self.semantic_map.lmb,
-            self.semantic_map.origins,
+            select(self.semantic_map.local_map),
+            select(self.semantic_map.global_map),
+            select(self.semantic_map.local_pose),
+            select(self.semantic_map.global_pose),
+            select(self.semantic_map.lmb),
+            select(self.semantic_map.origins),
             seq_object_goal_category=object_goal_category,
             seq_start_recep_goal_category=start_recep_goal_category,
             seq_end_recep_goal_category=end_recep_goal_category,
             seq_nav_to_recep=nav_to_recep,
         )
 
-        self.semantic_map.local_pose = seq_local_pose[:, -1]
-        self.semantic_map.global_pose = seq_global_pose[:, -1]
-        self.semantic_map.lmb = seq_lmb[:, -1]
-        self.semantic_map.origins = seq_origins[:, -1]
+        if all_envs:
+            self.semantic_map.local_map = local_map
+            self.semantic_map.global_map = global_map
+            self.semantic_map.local_pose = seq_local_pose[:, -1]
+            self.semantic_map.global_pose = seq_global_pose[:, -1]
+            self.semantic_map.lmb = seq_lmb[:, -1]
+            self.semantic_map.origins = seq_origins[:, -1]
+        else:
+            self.semantic_map.local_map[env_ids] = local_map
+            self.semantic_map.global_map[env_ids] = global_map
+            self.semantic_map.local_pose[env_ids] = seq_local_pose[:, -1]
+            self.semantic_map.global_pose[env_ids] = seq_global_pose[:, -1]
+            self.semantic_map.lmb[env_ids] = seq_lmb[:, -1]
+            self.semantic_map.origins[env_ids] = seq_origins[:, -1]
 
         goal_map = goal_map.squeeze(1).cpu().numpy()
         found_goal = found_goal.squeeze(1).cpu()
 
-        for e in range(self.num_environments):
-            self.semantic_map.update_frontier_map(e, frontier_map[e][0].cpu().numpy())
-            if found_goal[e]:
-                self.semantic_map.update_global_goal_for_env(e, goal_map[e])
+        for i, e in enumerate(env_ids):
+            self.semantic_map.update_frontier_map(e, frontier_map[i][0].cpu().numpy())
+            if found_goal[i]:
+                self.semantic_map.update_global_goal_for_env(e, goal_map[i])
             elif self.timesteps_before_goal_update[e] == 0:
-                self.semantic_map.update_global_goal_for_env(e, goal_map[e])
+                self.semantic_map.update_global_goal_for_env(e, goal_map[i])
                 self.timesteps_before_goal_update[e] = self.goal_update_steps
 
-        self.timesteps = [self.timesteps[e] + 1 for e in range(self.num_environments)]
-        self.timesteps_before_goal_update = [
-            self.timesteps_before_goal_update[e] - 1
-            for e in range(self.num_environments)
-        ]
+        for e in env_ids:
+            self.timesteps[e] += 1
+            self.timesteps_before_goal_update[e] -= 1
 
         if debug_frontier_map:
             import matplotlib.pyplot as plt
@@ -207,7 +232,7 @@ class ObjectNavAgent(Agent):
             plt.subplot(131)
             plt.imshow(self.semantic_map.get_frontier_map(e))
             plt.subplot(132)
-            plt.imshow(frontier_map[e][0])
+            plt.imshow(frontier_map[i][0])
             plt.subplot(133)
             plt.imshow(self.semantic_map.get_goal_map(e))
             plt.show()
@@ -218,9 +243,9 @@ class ObjectNavAgent(Agent):
                 "goal_map": self.semantic_map.get_goal_map(e),
                 "frontier_map": self.semantic_map.get_frontier_map(e),
                 "sensor_pose": self.semantic_map.get_planner_pose_inputs(e),
-                "found_goal": found_goal[e].item(),
+                "found_goal": found_goal[i].item(),
             }
-            for e in range(self.num_environments)
+            for i, e in enumerate(env_ids)
         ]
         if self.visualize:
             vis_inputs = [
@@ -230,10 +255,10 @@ class ObjectNavAgent(Agent):
                     "been_close_map": self.semantic_map.get_been_close_map(e),
                     "timestep": self.timesteps[e],
                 }
-                for e in range(self.num_environments)
+                for e in env_ids
             ]
         else:
-            vis_inputs = [{} for e in range(self.num_environments)]
+            vis_inputs = [{} for e in env_ids]
 
         return planner_inputs, vis_inputs
 
@@ -243,8 +268,11 @@ class ObjectNavAgent(Agent):
         self.timesteps_before_goal_update = [0] * self.num_environments
         self.last_poses = [np.zeros(3)] * self.num_environments
         self.semantic_map.init_map_and_pose()
-        self.episode_panorama_start_steps = self.panorama_start_steps
-        self.planner.reset()
+        self.episode_panorama_start_steps = [
+            self.panorama_start_steps
+        ] * self.num_environments
+        for planner in self.planners:
+            planner.reset()
 
     def reset_vectorized_for_env(self, e: int):
         """Initialize agent state for a specific environment."""
@@ -252,8 +280,8 @@ class ObjectNavAgent(Agent):
         self.timesteps_before_goal_update[e] = 0
         self.last_poses[e] = np.zeros(3)
         self.semantic_map.init_map_and_pose_for_env(e)
-        self.episode_panorama_start_steps = self.panorama_start_steps
-        self.planner.reset()
+        self.episode_panorama_start_steps[e] = self.panorama_start_steps
+        self.planners[e].reset()
 
     # ---------------------------------------------------------------------
     # Inference methods to interact with the robot or a single un-vectorized
@@ -270,23 +298,38 @@ class ObjectNavAgent(Agent):
 
     def act(self, obs: Observations) -> Tuple[DiscreteNavigationAction, Dict[str, Any]]:
         """Act end-to-end."""
-        # t0 = time.time()
-
+        return self._act_in_envs([obs], [0])[0]
+
+    def act_vectorized(
+        self, obs_list: List[Observations], env_ids: Optional[List[int]] = None
+    ) -> List[Tuple[DiscreteNavigationAction, Dict[str, Any]]]:
+        """Act end-to-end in all environments, given one observation per environment, or
+        in the environments env_ids only. Semantic maps of these environments are updated
+        together."""
+        if env_ids is None:
+            env_ids = list(range(self.num_environments))
+        return self._act_in_envs(obs_list, env_ids)
+
+    def _act_in_envs(
+        self, obs_list: List[Observations], env_ids: List[int]
+    ) -> List[Tuple[DiscreteNavigationAction, Dict[str, Any]]]:
+        """Act end-to-end in a subset of environments, with one observation each."""
         # 1 - Obs preprocessing
-        (
-            obs_preprocessed,
-            pose_delta,
-            object_goal_category,
-            start_recep_goal_category,
-            end_recep_goal_category,
-            goal_name,
-            camera_pose,
-        ) = self._preprocess_obs(obs)
-
-        # t1 = time.time()
-        # print(f"[Agent] Obs preprocessing time: {t1 - t0:.2f}")
+        with profiler.span("preprocess"):
+            (
+                obs_preprocessed,
+                pose_delta,
+                object_goal_category,
+                start_recep_goal_category,
+                end_recep_goal_category,
+                goal_name,
+                camera_pose,
+            ) = self._preprocess_obs_batch(obs_list, env_ids)
 
         # 2 - Semantic mapping + policy
+        nav_to_recep = self.get_nav_to_recep()
+        if nav_to_recep is not None:
+            nav_to_recep = nav_to_recep[env_ids]
         planner_inputs, vis_inputs = self.prepare_planner_inputs(
             obs_preprocessed,
             pose_delta,
@@ -294,58 +337,84 @@ class ObjectNavAgent(Agent):
             start_recep_goal_category=start_recep_goal_category,
             end_recep_goal_category=end_recep_goal_category,
             camera_pose=camera_pose,
-            nav_to_recep=self.get_nav_to_recep(),
+            nav_to_recep=nav_to_recep,
+            env_ids=env_ids,
         )
 
-        # t2 = time.time()
-        # print(f"[Agent] Semantic mapping and policy time: {t2 - t1:.2f}")
-
         # 3 - Planning
-        closest_goal_map = None
-        short_term_goal = None
-        dilated_obstacle_map = None
-        if planner_inputs[0]["found_goal"]:
-            self.episode_panorama_start_steps = 0
-        if self.timesteps[0] < self.episode_panorama_start_steps:
-            action = DiscreteNavigationAction.TURN_RIGHT
-        elif self.timesteps[0] > self.max_steps:
-            action = DiscreteNavigationAction.STOP
-        else:
-            (
-                action,
-                closest_goal_map,
-                short_term_goal,
-                dilated_obstacle_map,
-            ) = self.planner.plan(
-                **planner_inputs[0],
-                use_dilation_for_stg=self.use_dilation_for_stg,
-                timestep=self.timesteps[0],
-                debug=self.verbose,
-            )
+        outputs = []
+        for obs, e, planner_input, vis_input in zip(
+            obs_list, env_ids, planner_inputs, vis_inputs
+        ):
+            closest_goal_map = None
+            short_term_goal = None
+            dilated_obstacle_map = None
+            if planner_input["found_goal"]:
+                self.episode_panorama_start_steps[e] = 0
+            if self.timesteps[e] < self.episode_panorama_start_steps[e]:
+                action = DiscreteNavigationAction.TURN_RIGHT
+            elif self.timesteps[e] > self.max_steps:
+                action = DiscreteNavigationAction.STOP
+            else:
+                (
+                    action,
+                    closest_goal_map,
+                    short_term_goal,
+                    dilated_obstacle_map,
+                ) = self.planners[e].plan(
+                    **planner_input,
+                    use_dilation_for_stg=self.use_dilation_for_stg,
+                    timestep=self.timesteps[e],
+                    debug=self.verbose,
+                )
+
+            vis_input["goal_name"] = obs.task_observations["goal_name"]
+            if self.visualize:
+                vis_input["semantic_frame"] = obs.task_observations["semantic_frame"]
+                vis_input["closest_goal_map"] = closest_goal_map
+                vis_input["third_person_image"] = obs.third_person_image
+                vis_input["short_term_goal"] = None
+                vis_input["dilated_obstacle_map"] = dilated_obstacle_map
+            outputs.append((action, {**planner_input, **vis_input}))
+        return outputs
+
+    def _preprocess_obs_batch(self, obs_list: List[Observations], env_ids: List[int]):
+        """_preprocess_obs for observations of several environments, stacked along the
+        first dimension"""
+        if len(obs_list) == 1:
+            return self._preprocess_obs(obs_list[0], env_ids[0])
+        (
+            obs_preprocessed,
+            pose_delta,
+            object_goal_category,
+            start_recep_goal_category,
+            end_recep_goal_category,
+            goal_name,
+            camera_pose,
+        ) = zip(*[self._preprocess_obs(obs, e) for obs, e in zip(obs_list, env_ids)])
 
-        # t3 = time.time()
-        # print(f"[Agent] Planning time: {t3 - t2:.2f}")
-        # print(f"[Agent] Total time: {t3 - t0:.2f}")
-        # print()
+        def cat(tensors):
+            return None if any(t is None for t in tensors) else torch.cat(tensors)
 
-        vis_inputs[0]["goal_name"] = obs.task_observations["goal_name"]
-        if self.visualize:
-            vis_inputs[0]["semantic_frame"] = obs.task_observations["semantic_frame"]
-            vis_inputs[0]["closest_goal_map"] = closest_goal_map
-            vis_inputs[0]["third_person_image"] = obs.third_person_image
-            vis_inputs[0]["short_term_goal"] = None
-            vis_inputs[0]["dilated_obstacle_map"] = dilated_obstacle_map
-        info = {**planner_inputs[0], **vis_inputs[0]}
-        return action, info
-
-    def _preprocess_obs(self, obs: Observations):
-        """Take a home-robot observation, preprocess it to put it into the correct format for the
-        semantic map."""
+        return (
+            torch.cat(obs_preprocessed),
+            torch.cat(pose_delta),
+            cat(object_goal_category),
+            cat(start_recep_goal_category),
+            cat(end_recep_goal_category),
+            [name for names in goal_name for name in names],
+            cat(camera_pose),
+        )
+
+    def _preprocess_obs(self, obs: Observations, e: int = 0):
+        """Take a home-robot observation of environment e, preprocess it to put it into the
+        correct format for the semantic map."""
         rgb = torch.from_numpy(obs.rgb).to(self.device)
         depth = (
             torch.from_numpy(obs.depth).unsqueeze(-1).to(self.device) * 100.0
         )  # m to cm
-        semantic = np.full_like(obs.semantic, 4)
+        # Index into the one-hot encoding, whatever the dtype of obs.semantic
+        semantic = np.full(obs.semantic.shape, 4, dtype=np.int64)
         obj_goal_idx, start_recep_idx, end_recep_idx = 1, 2, 3
         semantic[obs.semantic == obs.task_observations["object_goal"]] = obj_goal_idx
         if "start_recep_goal" in obs.task_observations:
@@ -362,9 +431,9 @@ class ObjectNavAgent(Agent):
 
         curr_pose = np.array([obs.gps[0], obs.gps[1], obs.compass[0]])
         pose_delta = torch.tensor(
-            pu.get_rel_pose_change(curr_pose, self.last_poses[0])
+            pu.get_rel_pose_change(curr_pose, self.last_poses[e])
         ).unsqueeze(0)
-        self.last_poses[0] = curr_pose
+        self.last_poses[e] = curr_pose
         object_goal_category = None
         end_recep_goal_category = None
         if (
@@ -3,9 +3,6 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-
-import time
-
 import torch.nn as nn
 
 from home_robot.mapping.semantic.categorical_2d_semantic_map_module import (
@@ -14,6 +11,7 @@ from home_robot.mapping.semantic.categorical_2d_semantic_map_module import (
 from home_robot.navigation_policy.object_navigation.objectnav_frontier_exploration_policy import (
     ObjectNavFrontierExplorationPolicy,
 )
+from home_robot.utils.profiler import profiler
 
 # Do we need to visualize the frontier as we explore?
 debug_frontier_map = False
@@ -121,60 +119,61 @@ class ObjectNavAgentModule(nn.Module):
             seq_origins: sequence of local map origins of shape
              (batch_size, sequence_length, 3)
         """
-        # t0 = time.time()
-
         # Update map with observations and generate map features
         batch_size, sequence_length = seq_obs.shape[:2]
-        (
-            seq_map_features,
-            final_local_map,
-            final_global_map,
-            seq_local_pose,
-            seq_global_pose,
-            seq_lmb,
-            seq_origins,
-        ) = self.semantic_map_module(
-            seq_obs,
-            seq_pose_delta,
-            seq_dones,
-            seq_update_global,
-            seq_camera_poses,
-            init_local_map,
-            init_global_map,
-            init_local_pose,
-            init_global_pose,
-            init_lmb,
-            init_origins,
-        )
-
-        # t1 = time.time()
-        # print(f"[Semantic mapping] Total time: {t1 - t0:.2f}")
-
-        # Predict high-level goals from map features
-        # batched across sequence length x num environments
-        map_features = seq_map_features.flatten(0, 1)
-        if seq_object_goal_category is not None:
-            seq_object_goal_category = seq_object_goal_category.flatten(0, 1)
-        if seq_start_recep_goal_category is not None:
-            seq_start_recep_goal_category = seq_start_recep_goal_category.flatten(0, 1)
-        if seq_end_recep_goal_category is not None:
-            seq_end_recep_goal_category = seq_end_recep_goal_category.flatten(0, 1)
-        # Compute the goal map
-        goal_map, found_goal = self.policy(
-            map_features,
-            seq_object_goal_category,
-            seq_start_recep_goal_category,
-            seq_end_recep_goal_category,
-            seq_nav_to_recep,
-        )
-        seq_goal_map = goal_map.view(batch_size, sequence_length, *goal_map.shape[-2:])
-        seq_found_goal = found_goal.view(batch_size, sequence_length)
-
-        # Compute the frontier map here
-        frontier_map = self.policy.get_frontier_map(map_features)
-        seq_frontier_map = frontier_map.view(
-            batch_size, sequence_length, *frontier_map.shape[-2:]
-        )
+        with profiler.span("mapping"):
+            (
+                seq_map_features,
+                final_local_map,
+                final_global_map,
+                seq_local_pose,
+                seq_global_pose,
+                seq_lmb,
+                seq_origins,
+            ) = self.semantic_map_module(
+                seq_obs,
+                seq_pose_delta,
+                seq_dones,
+                seq_update_global,
+                seq_camera_poses,
+                init_local_map,
+                init_global_map,
+                init_local_pose,
+                init_global_pose,
+                init_lmb,
+                init_origins,
+            )
+
+        with profiler.span("policy"):
+            # Predict high-level goals from map features
+            # batched across sequence length x num environments
+            map_features = seq_map_features.flatten(0, 1)
+            if seq_object_goal_category is not None:
+                seq_object_goal_category = seq_object_goal_category.flatten(0, 1)
+            if seq_start_recep_goal_category is not None:
+                seq_start_recep_goal_category = seq_start_recep_goal_category.flatten(
+                    0, 1
+                )
+            if seq_end_recep_goal_category is not None:
+                seq_end_recep_goal_category = seq_end_recep_goal_category.flatten(0, 1)
+            # Compute the goal map
+            goal_map, found_goal = self.policy(
+                map_features,
+                seq_object_goal_category,
+                seq_start_recep_goal_category,
+                seq_end_recep_goal_category,
+                seq_nav_to_recep,
+            )
+            seq_goal_map = goal_map.view(
+                batch_size, sequence_length, *goal_map.shape[-2:]
+            )
+            seq_found_goal = found_goal.view(batch_size, sequence_length)
+
+            # Compute the frontier map here
+            frontier_map = self.policy.get_frontier_map(map_features)
+            seq_frontier_map = frontier_map.view(
+                batch_size, sequence_length, *frontier_map.shape[-2:]
+            )
         if debug_frontier_map:
             import matplotlib.pyplot as plt
 
@@ -184,8 +183,6 @@ class ObjectNavAgentModule(nn.Module):
             plt.imshow(goal_map[0].numpy())
             plt.show()
             breakpoint()
-        # t2 = time.time()
-        # print(f"[Policy] Total time: {t2 - t1:.2f}")
 
         return (
             seq_goal_map,
@@ -6,7 +6,7 @@
 
 from datetime import datetime
 from enum import IntEnum, auto
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -21,6 +21,7 @@ from home_robot.agent.ovmm_agent.ppo_agent import PPOAgent
 from home_robot.core.interfaces import DiscreteNavigationAction, Observations
 from home_robot.manipulation import HeuristicPickPolicy, HeuristicPlacePolicy
 from home_robot.perception.constants import RearrangeBasicCategories
+from home_robot.utils.profiler import profiler
 
 
 class Skill(IntEnum):
@@ -69,10 +70,19 @@ class OpenVocabManipAgent(ObjectNavAgent):
             self.obj_name_to_id, self.rec_name_to_id = read_category_map_file(
                 config.ENVIRONMENT.category_map_file
             )
+        # Heuristic policies keep the state of the episode, one per environment
         if config.AGENT.SKILLS.PICK.type == "heuristic" and not self.skip_skills.pick:
-            self.pick_policy = HeuristicPickPolicy(config, self.device)
+            self.pick_policies = [
+                HeuristicPickPolicy(config, self.device)
+                for _ in range(self.num_environments)
+            ]
+            self.pick_policy = self.pick_policies[0]
         if config.AGENT.SKILLS.PLACE.type == "heuristic" and not self.skip_skills.place:
-            self.place_policy = HeuristicPlacePolicy(config, self.device)
+            self.place_policies = [
+                HeuristicPlacePolicy(config, self.device)
+                for _ in range(self.num_environments)
+            ]
+            self.place_policy = self.place_policies[0]
         elif config.AGENT.SKILLS.PLACE.type == "rl" and not self.skip_skills.place:
             self.place_agent = PPOAgent(
                 config,
@@ -107,16 +117,16 @@ class OpenVocabManipAgent(ObjectNavAgent):
         self._fall_wait_steps = getattr(config.AGENT, "fall_wait_steps", 0)
         self.config = config
 
-    def _get_info(self, obs: Observations) -> Dict[str, torch.Tensor]:
+    def _get_info(self, obs: Observations, e: int = 0) -> Dict[str, torch.Tensor]:
         """Get inputs for visual skill."""
         use_detic_viz = self.config.ENVIRONMENT.use_detic_viz
 
         if self.config.GROUND_TRUTH_SEMANTICS == 1 or use_detic_viz:
             semantic_category_mapping = None  # Visualizer handles mapping
-        elif self.semantic_sensor.current_vocabulary_id == SemanticVocab.SIMPLE:
+        elif self.semantic_sensor.get_current_vocabulary_id(e) == SemanticVocab.SIMPLE:
             semantic_category_mapping = RearrangeBasicCategories()
         else:
-            semantic_category_mapping = self.semantic_sensor.current_vocabulary
+            semantic_category_mapping = self.semantic_sensor.get_current_vocabulary(e)
 
         if use_detic_viz:
             semantic_frame = obs.task_observations["semantic_frame"]
@@ -130,12 +140,12 @@ class OpenVocabManipAgent(ObjectNavAgent):
             "semantic_category_mapping": semantic_category_mapping,
             "goal_name": obs.task_observations["goal_name"],
             "third_person_image": obs.third_person_image,
-            "timestep": self.timesteps[0],
-            "curr_skill": Skill(self.states[0].item()).name,
+            "timestep": self.timesteps[e],
+            "curr_skill": Skill(self.states[e].item()).name,
             "skill_done": "",  # Set if skill gets done
         }
         # only the current skill has corresponding value as 1
-        info = {**info, **get_skill_as_one_hot_dict(self.states[0].item())}
+        info = {**info, **get_skill_as_one_hot_dict(self.states[e].item())}
         return info
 
     def reset_vectorized(self, episodes=None):
@@ -144,12 +154,14 @@ class OpenVocabManipAgent(ObjectNavAgent):
 
         if episodes is None:
             now = datetime.now()
-            self.planner.set_vis_dir("real_world", now.strftime("%Y_%m_%d_%H_%M_%S"))
+            for planner in self.planners:
+                planner.set_vis_dir("real_world", now.strftime("%Y_%m_%d_%H_%M_%S"))
         else:
-            self.planner.set_vis_dir(
-                episodes[0].scene_id.split("/")[-1].split(".")[0],
-                episodes[0].episode_id,
-            )
+            for planner, episode in zip(self.planners, episodes):
+                planner.set_vis_dir(
+                    episode.scene_id.split("/")[-1].split(".")[0],
+                    episode.episode_id,
+                )
         if self.gaze_agent is not None:
             self.gaze_agent.reset_vectorized()
         if self.nav_to_obj_agent is not None:
@@ -180,11 +192,11 @@ class OpenVocabManipAgent(ObjectNavAgent):
         self.is_gaze_done[e] = 0
         self.place_done[e] = 0
         if self.config.AGENT.SKILLS.PLACE.type == "heuristic":
-            self.place_policy.reset()
+            self.place_policies[e].reset()
         if self.config.AGENT.SKILLS.PICK.type == "heuristic":
-            self.pick_policy.reset()
+            self.pick_policies[e].reset()
         super().reset_vectorized_for_env(e)
-        self.planner.set_vis_dir(
+        self.planners[e].set_vis_dir(
             episode.scene_id.split("/")[-1].split(".")[0], episode.episode_id
         )
         if self.gaze_agent is not None:
@@ -196,21 +208,21 @@ class OpenVocabManipAgent(ObjectNavAgent):
         if self.nav_to_rec_agent is not None:
             self.nav_to_rec_agent.reset_vectorized_for_env(e)
 
-    def _init_episode(self, obs: Observations):
+    def _init_episode(self, obs: Observations, e: int = 0):
         """
         This method is called at the first timestep of every episode before any action is taken.
         """
         if self.verbose:
             print("Initializing episode...")
         if self.config.GROUND_TRUTH_SEMANTICS == 0:
-            self._update_semantic_vocabs(obs)
+            self._update_semantic_vocabs(obs, e)
             if (
                 self.config.AGENT.SKILLS.NAV_TO_OBJ.type == "rl"
                 and not self.skip_skills.nav_to_obj
             ):
-                self._set_semantic_vocab(SemanticVocab.FULL, force_set=True)
+                self._set_semantic_vocab(SemanticVocab.FULL, force_set=True, e=e)
             else:
-                self._set_semantic_vocab(SemanticVocab.SIMPLE, force_set=True)
+                self._set_semantic_vocab(SemanticVocab.SIMPLE, force_set=True, e=e)
 
     def _switch_to_next_skill(
         self, e: int, next_skill: Skill, info: Dict[str, Any]
@@ -227,7 +239,7 @@ class OpenVocabManipAgent(ObjectNavAgent):
             # action = DiscreteNavigationAction.NAVIGATION_MODE
             pass
         elif next_skill == Skill.GAZE_AT_OBJ:
-            self._set_semantic_vocab(SemanticVocab.SIMPLE, force_set=False)
+            self._set_semantic_vocab(SemanticVocab.SIMPLE, force_set=False, e=e)
             self.gaze_at_obj_start_step[e] = self.timesteps[e]
         elif next_skill == Skill.PICK:
             self.pick_start_step[e] = self.timesteps[e]
@@ -236,9 +248,9 @@ class OpenVocabManipAgent(ObjectNavAgent):
             if not self.skip_skills.nav_to_rec:
                 action = DiscreteNavigationAction.NAVIGATION_MODE
                 if self.config.AGENT.SKILLS.NAV_TO_OBJ.type == "rl":
-                    self._set_semantic_vocab(SemanticVocab.FULL, force_set=False)
+                    self._set_semantic_vocab(SemanticVocab.FULL, force_set=False, e=e)
         elif next_skill == Skill.GAZE_AT_REC:
-            self._set_semantic_vocab(SemanticVocab.SIMPLE, force_set=False)
+            self._set_semantic_vocab(SemanticVocab.SIMPLE, force_set=False, e=e)
             # We reuse gaze agent between pick and place
             if self.gaze_agent is not None:
                 self.gaze_agent.reset_vectorized_for_env(e)
@@ -249,7 +261,7 @@ class OpenVocabManipAgent(ObjectNavAgent):
         self.states[e] = next_skill
         return action
 
-    def _update_semantic_vocabs(self, obs: Observations):
+    def _update_semantic_vocabs(self, obs: Observations, e: int = 0):
         """
         Sets vocabularies for semantic sensor at the start of episode.
         """
@@ -265,34 +277,57 @@ class OpenVocabManipAgent(ObjectNavAgent):
         simple_vocab = build_vocab_from_category_map(
             obj_id_to_name, simple_rec_id_to_name
         )
-        self.semantic_sensor.update_vocubulary_list(simple_vocab, SemanticVocab.SIMPLE)
+        self.semantic_sensor.update_vocubulary_list(
+            simple_vocab, SemanticVocab.SIMPLE, e
+        )
 
         # Full vocabulary contains the object and all receptacles
         full_vocab = build_vocab_from_category_map(obj_id_to_name, self.rec_name_to_id)
-        self.semantic_sensor.update_vocubulary_list(full_vocab, SemanticVocab.FULL)
+        self.semantic_sensor.update_vocubulary_list(full_vocab, SemanticVocab.FULL, e)
 
-    def _set_semantic_vocab(self, vocab_id: SemanticVocab, force_set: bool):
+    def _set_semantic_vocab(self, vocab_id: SemanticVocab, force_set: bool, e: int = 0):
         """
         Set active vocabulary for semantic sensor to use to the given ID.
         """
         if self.config.GROUND_TRUTH_SEMANTICS == 0 and (
-            force_set or self.semantic_sensor.current_vocabulary_id != vocab_id
+            force_set or self.semantic_sensor.get_current_vocabulary_id(e) != vocab_id
         ):
-            self.semantic_sensor.set_vocabulary(vocab_id)
+            self.semantic_sensor.set_vocabulary(vocab_id, e)
+
+    @staticmethod
+    def _act_with_agent(
+        agent: PPOAgent,
+        idcs: List[int],
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[Any, Dict[str, Any], bool]]:
+        """Run a PPO skill in the environments at positions idcs, all at once"""
+        if len(idcs) == 0:
+            return []
+        return agent.act_vectorized(
+            [obs_list[i] for i in idcs],
+            [infos[i] for i in idcs],
+            [env_ids[i] for i in idcs],
+        )
 
     def _heuristic_nav(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any]:
-        action, planner_info = super().act(obs)
-        # info overwrites planner_info entries for keys with same name
-        info = {**planner_info, **info}
-        self.timesteps[0] -= 1  # objectnav agent increments timestep
-        info["timestep"] = self.timesteps[0]
-        if action == DiscreteNavigationAction.STOP:
-            terminate = True
-        else:
-            terminate = False
-        return action, info, terminate
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, bool]]:
+        """Heuristic navigation; semantic maps of all environments are updated at once"""
+        outputs = []
+        nav_outputs = super()._act_in_envs(obs_list, env_ids)
+        for e, info, (action, planner_info) in zip(env_ids, infos, nav_outputs):
+            # info overwrites planner_info entries for keys with same name
+            info = {**planner_info, **info}
+            self.timesteps[e] -= 1  # objectnav agent increments timestep
+            info["timestep"] = self.timesteps[e]
+            terminate = action == DiscreteNavigationAction.STOP
+            outputs.append((action, info, terminate))
+        return outputs
 
     def _heuristic_pick(
         self, obs: Observations, info: Dict[str, Any]
@@ -305,11 +340,11 @@ class OpenVocabManipAgent(ObjectNavAgent):
             info = self._switch_to_next_skill(e=0, info=info)
         return action, info
 
-    def _hardcoded_place(self):
+    def _hardcoded_place(self, e: int = 0):
         """Hardcoded place skill execution
         Orients the agent's arm and camera towards the recetacle, extends arm and releases the object
         """
-        place_step = self.timesteps[0] - self.place_start_step[0]
+        place_step = self.timesteps[e] - self.place_start_step[e]
         forward_steps = 0
         if place_step < forward_steps:
             # for experimentation (TODO: Remove. ideally nav should drop us close)
@@ -326,228 +361,336 @@ class OpenVocabManipAgent(ObjectNavAgent):
             action = DiscreteNavigationAction.STOP
         else:
             raise ValueError(
-                f"Something is wrong. Episode should have ended. Place step: {place_step}, Timestep: {self.timesteps[0]}"
+                f"Something is wrong. Episode should have ended. Place step: {place_step}, Timestep: {self.timesteps[e]}"
             )
         return action
 
-    def _rl_place(self, obs: Observations, info: Dict[str, Any]):
-        place_step = self.timesteps[0] - self.place_start_step[0]
-        if place_step == 0:
-            action = DiscreteNavigationAction.POST_NAV_MODE
-        elif self.place_done[0] == 1:
-            action = DiscreteNavigationAction.STOP
-            self.place_done[0] = 0
-        else:
-            action, info, terminate = self.place_agent.act(obs, info)
+    def _rl_place(
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[Any, Dict[str, Any]]]:
+        outputs = [None] * len(env_ids)
+        to_act = []
+        for i, e in enumerate(env_ids):
+            place_step = self.timesteps[e] - self.place_start_step[e]
+            if place_step == 0:
+                outputs[i] = (DiscreteNavigationAction.POST_NAV_MODE, infos[i])
+            elif self.place_done[e] == 1:
+                outputs[i] = (DiscreteNavigationAction.STOP, infos[i])
+                self.place_done[e] = 0
+            else:
+                to_act.append(i)
+        agent_outputs = self._act_with_agent(
+            self.place_agent, to_act, env_ids, obs_list, infos
+        )
+        for i, (action, info, terminate) in zip(to_act, agent_outputs):
             if terminate:
                 action = DiscreteNavigationAction.DESNAP_OBJECT
-                self.place_done[0] = 1
-        return action, info
+                self.place_done[env_ids[i]] = 1
+            outputs[i] = (action, info)
+        return outputs
 
     """
     The following methods each correspond to a skill/state this agent can execute.
-    They take sensor observations as input and return the action to take and
-    the state to transition to. Either the action has a value and the new state doesn't,
-    or the action has no value and the new state does. The latter case indicates
-    a state transition.
+    They take the sensor observations of the environments currently executing the skill
+    as input, and return for each of them the action to take and the state to transition to.
+    Either the action has a value and the new state doesn't, or the action has no value and
+    the new state does. The latter case indicates a state transition.
     """
 
-    def _nav_to_obj(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
-        nav_to_obj_type = self.config.AGENT.SKILLS.NAV_TO_OBJ.type
-        if self.skip_skills.nav_to_obj:
-            terminate = True
-        elif nav_to_obj_type == "heuristic":
+    def _nav(
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, Optional[Skill]]]:
+        """Navigation to objects and to receptacles"""
+        # skip, type, agent and next skill of both navigation skills
+        nav_skills = {
+            Skill.NAV_TO_OBJ: (
+                self.skip_skills.nav_to_obj,
+                self.config.AGENT.SKILLS.NAV_TO_OBJ.type,
+                self.nav_to_obj_agent,
+                Skill.GAZE_AT_OBJ,
+            ),
+            Skill.NAV_TO_REC: (
+                self.skip_skills.nav_to_rec,
+                self.config.AGENT.SKILLS.NAV_TO_REC.type,
+                self.nav_to_rec_agent,
+                Skill.GAZE_AT_REC,
+            ),
+        }
+        skills = [Skill(self.states[e].item()) for e in env_ids]
+        infos = list(infos)
+        actions = [None] * len(env_ids)
+        terminate = [False] * len(env_ids)
+        heuristic = []
+        rl = {skill: [] for skill in nav_skills}
+        for i, skill in enumerate(skills):
+            skip, nav_type, _, _ = nav_skills[skill]
+            if skip:
+                terminate[i] = True
+            elif nav_type == "heuristic":
+                heuristic.append(i)
+            elif nav_type == "rl":
+                rl[skill].append(i)
+            else:
+                raise ValueError(
+                    f"Got unexpected value for {skill.name}.type: {nav_type}"
+                )
+
+        if len(heuristic) > 0:
             if self.verbose:
                 print("[OVMM AGENT] step heuristic nav policy")
-            action, info, terminate = self._heuristic_nav(obs, info)
-        elif nav_to_obj_type == "rl":
-            action, info, terminate = self.nav_to_obj_agent.act(obs, info)
-        else:
-            raise ValueError(
-                f"Got unexpected value for NAV_TO_OBJ.type: {nav_to_obj_type}"
+            nav_outputs = self._heuristic_nav(
+                [env_ids[i] for i in heuristic],
+                [obs_list[i] for i in heuristic],
+                [infos[i] for i in heuristic],
             )
-        new_state = None
-        if terminate:
-            action = None
-            new_state = Skill.GAZE_AT_OBJ
-        return action, info, new_state
+            for i, (action, info, done) in zip(heuristic, nav_outputs):
+                actions[i], infos[i], terminate[i] = action, info, done
+        for skill, idcs in rl.items():
+            agent = nav_skills[skill][2]
+            agent_outputs = self._act_with_agent(agent, idcs, env_ids, obs_list, infos)
+            for i, (action, info, done) in zip(idcs, agent_outputs):
+                actions[i], infos[i], terminate[i] = action, info, done
+
+        outputs = []
+        for i, skill in enumerate(skills):
+            if terminate[i]:
+                outputs.append((None, infos[i], nav_skills[skill][3]))
+            else:
+                outputs.append((actions[i], infos[i], None))
+        return outputs
 
     def _gaze_at_obj(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
-        gaze_step = self.timesteps[0] - self.gaze_at_obj_start_step[0]
-        if self.skip_skills.gaze_at_obj:
-            terminate = True
-        elif gaze_step == 0:
-            return DiscreteNavigationAction.POST_NAV_MODE, info, None
-        else:
-            action, info, terminate = self.gaze_agent.act(obs, info)
-        new_state = None
-        if terminate:
-            # action = (
-            #     {}
-            # )  # TODO: update after simultaneous gripping/motion is supported
-            # action["grip_action"] = [1]  # grasp the object when gaze is done
-            # self.is_pick_done[0] = 1
-            action = None
-            new_state = Skill.PICK
-        return action, info, new_state
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, Optional[Skill]]]:
+        outputs = [None] * len(env_ids)
+        to_act = []
+        for i, e in enumerate(env_ids):
+            gaze_step = self.timesteps[e] - self.gaze_at_obj_start_step[e]
+            if self.skip_skills.gaze_at_obj:
+                outputs[i] = (None, infos[i], Skill.PICK)
+            elif gaze_step == 0:
+                outputs[i] = (DiscreteNavigationAction.POST_NAV_MODE, infos[i], None)
+            else:
+                to_act.append(i)
+        agent_outputs = self._act_with_agent(
+            self.gaze_agent, to_act, env_ids, obs_list, infos
+        )
+        for i, (action, info, terminate) in zip(to_act, agent_outputs):
+            if terminate:
+                # action = (
+                #     {}
+                # )  # TODO: update after simultaneous gripping/motion is supported
+                # action["grip_action"] = [1]  # grasp the object when gaze is done
+                # self.is_pick_done[0] = 1
+                outputs[i] = (None, info, Skill.PICK)
+            else:
+                outputs[i] = (action, info, None)
+        return outputs
 
     def _pick(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, Optional[Skill]]]:
         """Handle picking policies, either in sim or on the real robot."""
-        if self.skip_skills.pick:
-            action = None
-        elif self.config.AGENT.SKILLS.PICK.type == "oracle":
-            pick_step = self.timesteps[0] - self.pick_start_step[0]
-            if pick_step == 0:
-                action = DiscreteNavigationAction.MANIPULATION_MODE
-            elif pick_step == 1:
-                action = DiscreteNavigationAction.SNAP_OBJECT
-            elif pick_step == 2:
+        outputs = []
+        for e, obs, info in zip(env_ids, obs_list, infos):
+            if self.skip_skills.pick:
                 action = None
-            else:
-                raise ValueError(
-                    "Still in oracle pick. Should've transitioned to next skill."
-                )
-        elif self.config.AGENT.SKILLS.PICK.type == "heuristic":
-            action, info = self.pick_policy(obs, info)
-        elif self.config.AGENT.SKILLS.PICK.type == "hw":
-            # use the hardware pick skill
-            pick_step = self.timesteps[0] - self.pick_start_step[0]
-            if pick_step == 0:
-                action = DiscreteNavigationAction.MANIPULATION_MODE
-            elif pick_step < self.max_pick_attempts:
-                # If we have not seen an object mask to try to grasp...
-                if not obs.task_observations["prev_grasp_success"]:
-                    action = DiscreteNavigationAction.PICK_OBJECT
+            elif self.config.AGENT.SKILLS.PICK.type == "oracle":
+                pick_step = self.timesteps[e] - self.pick_start_step[e]
+                if pick_step == 0:
+                    action = DiscreteNavigationAction.MANIPULATION_MODE
+                elif pick_step == 1:
+                    action = DiscreteNavigationAction.SNAP_OBJECT
+                elif pick_step == 2:
+                    action = None
                 else:
+                    raise ValueError(
+                        "Still in oracle pick. Should've transitioned to next skill."
+                    )
+            elif self.config.AGENT.SKILLS.PICK.type == "heuristic":
+                action, info = self.pick_policies[e](obs, info)
+            elif self.config.AGENT.SKILLS.PICK.type == "hw":
+                # use the hardware pick skill
+                pick_step = self.timesteps[e] - self.pick_start_step[e]
+                if pick_step == 0:
+                    action = DiscreteNavigationAction.MANIPULATION_MODE
+                elif pick_step < self.max_pick_attempts:
+                    # If we have not seen an object mask to try to grasp...
+                    if not obs.task_observations["prev_grasp_success"]:
+                        action = DiscreteNavigationAction.PICK_OBJECT
+                    else:
+                        action = None
+                else:
+                    # We have tried too many times and we're going to quit
                     action = None
             else:
-                # We have tried too many times and we're going to quit
+                raise NotImplementedError(
+                    f"pick type not supported: {self.config.AGENT.SKILLS.PICK.type}"
+                )
+            new_state = None
+            if action in [None, DiscreteNavigationAction.STOP]:
+                new_state = Skill.NAV_TO_REC
                 action = None
-        else:
-            raise NotImplementedError(
-                f"pick type not supported: {self.config.AGENT.SKILLS.PICK.type}"
-            )
-        new_state = None
-        if action in [None, DiscreteNavigationAction.STOP]:
-            new_state = Skill.NAV_TO_REC
-            action = None
-        return action, info, new_state
-
-    def _nav_to_rec(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
-        nav_to_rec_type = self.config.AGENT.SKILLS.NAV_TO_REC.type
-        if self.skip_skills.nav_to_rec:
-            terminate = True
-        elif nav_to_rec_type == "heuristic":
-            action, info, terminate = self._heuristic_nav(obs, info)
-        elif nav_to_rec_type == "rl":
-            action, info, terminate = self.nav_to_rec_agent.act(obs, info)
-        else:
-            raise ValueError(
-                f"Got unexpected value for NAV_TO_REC.type: {nav_to_rec_type}"
-            )
-        new_state = None
-        if terminate:
-            action = None
-            new_state = Skill.GAZE_AT_REC
-        return action, info, new_state
+            outputs.append((action, info, new_state))
+        return outputs
 
     def _gaze_at_rec(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, Optional[Skill]]]:
         if self.skip_skills.gaze_at_rec:
-            terminate = True
-        else:
-            action, info, terminate = self.gaze_agent.act(obs, info)
-        new_state = None
-        if terminate:
-            action = None
-            new_state = Skill.PLACE
-        return action, info, new_state
+            return [(None, info, Skill.PLACE) for info in infos]
+        agent_outputs = self._act_with_agent(
+            self.gaze_agent, list(range(len(env_ids))), env_ids, obs_list, infos
+        )
+        return [
+            (None, info, Skill.PLACE) if terminate else (action, info, None)
+            for action, info, terminate in agent_outputs
+        ]
 
     def _place(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, Optional[Skill]]]:
         place_type = self.config.AGENT.SKILLS.PLACE.type
         if self.skip_skills.place:
-            action = DiscreteNavigationAction.STOP
+            place_outputs = [(DiscreteNavigationAction.STOP, info) for info in infos]
         elif place_type == "hardcoded":
-            action = self._hardcoded_place()
+            place_outputs = [
+                (self._hardcoded_place(e), info) for e, info in zip(env_ids, infos)
+            ]
         elif place_type == "heuristic":
-            action, info = self.place_policy(obs, info)
+            place_outputs = [
+                self.place_policies[e](obs, info)
+                for e, obs, info in zip(env_ids, obs_list, infos)
+            ]
         elif place_type == "rl":
-            action, info = self._rl_place(obs, info)
+            place_outputs = self._rl_place(env_ids, obs_list, infos)
         else:
             raise ValueError(f"Got unexpected value for PLACE.type: {place_type}")
-        new_state = None
-        if action == DiscreteNavigationAction.STOP:
-            action = None
-            new_state = Skill.FALL_WAIT
-        return action, info, new_state
+        outputs = []
+        for action, info in place_outputs:
+            if action == DiscreteNavigationAction.STOP:
+                outputs.append((None, info, Skill.FALL_WAIT))
+            else:
+                outputs.append((action, info, None))
+        return outputs
 
     def _fall_wait(
-        self, obs: Observations, info: Dict[str, Any]
-    ) -> Tuple[DiscreteNavigationAction, Any, Optional[Skill]]:
-        if self.timesteps[0] - self.fall_wait_start_step[0] < self._fall_wait_steps:
-            action = DiscreteNavigationAction.EMPTY_ACTION
-        else:
-            action = DiscreteNavigationAction.STOP
-        return action, info, None
+        self,
+        env_ids: List[int],
+        obs_list: List[Observations],
+        infos: List[Dict[str, Any]],
+    ) -> List[Tuple[DiscreteNavigationAction, Any, Optional[Skill]]]:
+        outputs = []
+        for e, info in zip(env_ids, infos):
+            if self.timesteps[e] - self.fall_wait_start_step[e] < self._fall_wait_steps:
+                action = DiscreteNavigationAction.EMPTY_ACTION
+            else:
+                action = DiscreteNavigationAction.STOP
+            outputs.append((action, info, None))
+        return outputs
 
     def act(
         self, obs: Observations
     ) -> Tuple[DiscreteNavigationAction, Dict[str, Any], Observations]:
         """State machine"""
-        if self.timesteps[0] == 0:
-            self._init_episode(obs)
+        return self._act_in_envs([obs], [0])[0]
 
-        if self.config.GROUND_TRUTH_SEMANTICS == 0:
-            obs = self.semantic_sensor(obs)
-        else:
-            obs.task_observations["semantic_frame"] = None
-        info = self._get_info(obs)
+    def act_vectorized(
+        self, obs_list: List[Observations], env_ids: Optional[List[int]] = None
+    ) -> List[Tuple[DiscreteNavigationAction, Dict[str, Any], Observations]]:
+        """State machine of all environments, given one observation per environment.
 
-        self.timesteps[0] += 1
+        Observations of all environments are segmented together, semantic maps of all
+        environments navigating with the heuristic policy are updated together, and each
+        skill runs once on all environments currently executing it.
 
-        action = None
-        while action is None:
-            if self.states[0] == Skill.NAV_TO_OBJ:
-                action, info, new_state = self._nav_to_obj(obs, info)
-            elif self.states[0] == Skill.GAZE_AT_OBJ:
-                action, info, new_state = self._gaze_at_obj(obs, info)
-            elif self.states[0] == Skill.PICK:
-                action, info, new_state = self._pick(obs, info)
-            elif self.states[0] == Skill.NAV_TO_REC:
-                action, info, new_state = self._nav_to_rec(obs, info)
-            elif self.states[0] == Skill.GAZE_AT_REC:
-                action, info, new_state = self._gaze_at_rec(obs, info)
-            elif self.states[0] == Skill.PLACE:
-                action, info, new_state = self._place(obs, info)
-            elif self.states[0] == Skill.FALL_WAIT:
-                action, info, new_state = self._fall_wait(obs, info)
-            else:
-                raise ValueError
-
-            # Since heuristic nav is not properly vectorized, this agent currently only supports 1 env
-            # _switch_to_next_skill is thus invoked with e=0
-            if new_state:
-                # mark the current skill as done
-                info["skill_done"] = info["curr_skill"]
-                assert (
-                    action is None
-                ), f"action must be None when switching states, found {action} instead"
-                action = self._switch_to_next_skill(0, new_state, info)
-        # update the curr skill to the new skill whose action will be executed
-        info["curr_skill"] = Skill(self.states[0].item()).name
-        if self.verbose:
-            print(
-                f'Executing skill {info["curr_skill"]} at timestep {self.timesteps[0]}'
-            )
-        return action, info, obs
+        Arguments:
+            obs_list: observations of the environments
+            env_ids: environment of each observation, to act in a subset of environments;
+             defaults to all environments
+        """
+        if env_ids is None:
+            env_ids = list(range(self.num_environments))
+        return self._act_in_envs(obs_list, env_ids)
+
+    def _act_in_envs(
+        self, obs_list: List[Observations], env_ids: List[int]
+    ) -> List[Tuple[DiscreteNavigationAction, Dict[str, Any], Observations]]:
+        """State machine of a subset of environments, with one observation each"""
+        for obs, e in zip(obs_list, env_ids):
+            if self.timesteps[e] == 0:
+                self._init_episode(obs, e)
+
+        if self.config.GROUND_TRUTH_SEMANTICS == 0:
+            with profiler.span("perception"):
+                obs_list = self.semantic_sensor.forward_batch(obs_list, env_ids)
+        else:
+            for obs in obs_list:
+                obs.task_observations["semantic_frame"] = None
+        infos = [self._get_info(obs, e) for obs, e in zip(obs_list, env_ids)]
+
+        for e in env_ids:
+            self.timesteps[e] += 1
+
+        # Both navigation skills share semantic mapping, so they run together
+        skill_groups = [
+            ((Skill.NAV_TO_OBJ, Skill.NAV_TO_REC), self._nav),
+            ((Skill.GAZE_AT_OBJ,), self._gaze_at_obj),
+            ((Skill.PICK,), self._pick),
+            ((Skill.GAZE_AT_REC,), self._gaze_at_rec),
+            ((Skill.PLACE,), self._place),
+            ((Skill.FALL_WAIT,), self._fall_wait),
+        ]
+        actions = [None] * len(env_ids)
+        while any(action is None for action in actions):
+            for skills, run_skill in skill_groups:
+                idcs = [
+                    i
+                    for i, e in enumerate(env_ids)
+                    if actions[i] is None and Skill(self.states[e].item()) in skills
+                ]
+                if len(idcs) == 0:
+                    continue
+                outputs = run_skill(
+                    [env_ids[i] for i in idcs],
+                    [obs_list[i] for i in idcs],
+                    [infos[i] for i in idcs],
+                )
+                for i, (action, info, new_state) in zip(idcs, outputs):
+                    if new_state:
+                        # mark the current skill as done
+                        info["skill_done"] = info["curr_skill"]
+                        assert (
+                            action is None
+                        ), f"action must be None when switching states, found {action} instead"
+                        action = self._switch_to_next_skill(env_ids[i], new_state, info)
+                    actions[i], infos[i] = action, info
+
+        outputs = []
+        for i, e in enumerate(env_ids):
+            # update the curr skill to the new skill whose action will be executed
+            infos[i]["curr_skill"] = Skill(self.states[e].item()).name
+            if self.verbose:
+                print(
+                    f'Executing skill {infos[i]["curr_skill"]} at timestep {self.timesteps[e]}'
+                )
+            outputs.append((actions[i], infos[i], obs_list[i]))
+        return outputs
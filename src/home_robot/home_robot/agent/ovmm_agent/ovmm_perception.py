@@ -5,11 +5,15 @@
 
 
 import json
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+
+import home_robot.utils.depth as du
 from home_robot.core.interfaces import Observations
 from home_robot.perception.constants import RearrangeDETICCategories
 from home_robot.perception.detection.detic.detic_perception import DeticPerception
+from home_robot.perception.keyframe_segmentation import KeyframeSegmentation
 
 
 def read_category_map_file(
@@ -56,14 +60,28 @@ class OvmmPerception:
     Wrapper around DETIC for use in OVMM Agent.
     It performs some preprocessing of observations necessary for OVMM skills.
     It also maintains a list of vocabularies to use in segmentation and can switch between them at runtime.
+    Vocabularies are kept separately for each environment, as episodes running in parallel
+    look for different objects.
     """
 
     def __init__(self, config, gpu_device_id: int = 0, verbose: bool = False):
         self.config = config
+        self.num_environments = getattr(config, "NUM_ENVIRONMENTS", 1)
         self._use_detic_viz = config.ENVIRONMENT.use_detic_viz
-        self._vocabularies: Dict[int, RearrangeDETICCategories] = {}
-        self._current_vocabulary: RearrangeDETICCategories = None
-        self._current_vocabulary_id: int = None
+        self._vocabularies: List[Dict[int, RearrangeDETICCategories]] = [
+            {} for _ in range(self.num_environments)
+        ]
+        self._current_vocabulary: List[Optional[RearrangeDETICCategories]] = [
+            None
+        ] * self.num_environments
+        self._current_vocabulary_id: List[Optional[int]] = [
+            None
+        ] * self.num_environments
+        self._vocabulary_name_to_id: List[Dict[str, int]] = [
+            {} for _ in range(self.num_environments)
+        ]
+        # Vocabulary DETIC currently segments with
+        self._detic_vocab: Optional[Tuple[str, ...]] = None
         self.verbose = verbose
         # TODO Specify confidence threshold as a parameter
         self._segmentation = DeticPerception(
@@ -71,70 +89,159 @@ class OvmmPerception:
             custom_vocabulary=".",
             sem_gpu_id=gpu_device_id,
             verbose=verbose,
+            visualization_workers=getattr(
+                config.ENVIRONMENT, "detic_visualization_workers", 0
+            ),
+            backbone_file=getattr(config.ENVIRONMENT, "detic_backbone_file", None),
         )
+        # One keyframe segmentation per environment, as keyframes are warped along a
+        # single trajectory
+        self._keyframe_segmentation = None
+        keyframe_config = getattr(config.AGENT, "KEYFRAME_SEGMENTATION", None)
+        if keyframe_config is not None and keyframe_config.enabled:
+            camera_matrix = du.get_camera_matrix(
+                config.ENVIRONMENT.frame_width,
+                config.ENVIRONMENT.frame_height,
+                config.ENVIRONMENT.hfov,
+            )
+            self._keyframe_segmentation = [
+                KeyframeSegmentation(
+                    self._segment,
+                    camera_matrix,
+                    keyframe_interval=keyframe_config.keyframe_interval,
+                    max_translation=keyframe_config.max_translation,
+                    max_rotation=np.deg2rad(keyframe_config.max_rotation),
+                    max_hole_fraction=keyframe_config.max_hole_fraction,
+                    max_photometric_error=keyframe_config.max_photometric_error,
+                )
+                for _ in range(self.num_environments)
+            ]
 
     @property
     def current_vocabulary_id(self) -> int:
-        return self._current_vocabulary_id
+        return self._current_vocabulary_id[0]
 
     @property
     def current_vocabulary(self) -> RearrangeDETICCategories:
-        return self._current_vocabulary
+        return self._current_vocabulary[0]
+
+    @property
+    def vocabulary_name_to_id(self) -> Dict[str, int]:
+        return self._vocabulary_name_to_id[0]
+
+    def get_current_vocabulary_id(self, env_id: int = 0) -> int:
+        return self._current_vocabulary_id[env_id]
+
+    def get_current_vocabulary(self, env_id: int = 0) -> RearrangeDETICCategories:
+        return self._current_vocabulary[env_id]
 
     def update_vocubulary_list(
-        self, vocabulary: RearrangeDETICCategories, vocabulary_id: int
+        self,
+        vocabulary: RearrangeDETICCategories,
+        vocabulary_id: int,
+        env_id: int = 0,
     ):
         """
         Update/insert a given vocabulary for the given ID.
+        Its classifier is built right away, so that switching to it later is instant.
         """
-        self._vocabularies[vocabulary_id] = vocabulary
+        self._vocabularies[env_id][vocabulary_id] = vocabulary
+        self._segmentation.register_vocab(self._get_detic_vocab(vocabulary))
+
+    @staticmethod
+    def _get_detic_vocab(vocabulary: RearrangeDETICCategories) -> List[str]:
+        """list of class names passed to DETIC for a vocabulary"""
+        return ["."] + list(vocabulary.goal_id_to_goal_name.values()) + ["other"]
 
-    def set_vocabulary(self, vocabulary_id: int):
+    def set_vocabulary(self, vocabulary_id: int, env_id: int = 0):
         """
         Set given vocabulary ID to be the active vocabulary that the segmentation model uses.
         """
-        vocabulary = self._vocabularies[vocabulary_id]
-        self._segmentation.reset_vocab(
-            ["."] + list(vocabulary.goal_id_to_goal_name.values()) + ["other"]
-        )
-        self.vocabulary_name_to_id = {
+        vocabulary = self._vocabularies[env_id][vocabulary_id]
+        self._set_detic_vocab(vocabulary)
+        self._vocabulary_name_to_id[env_id] = {
             name: id for id, name in vocabulary.goal_id_to_goal_name.items()
         }
-        self._current_vocabulary = vocabulary
-        self._current_vocabulary_id = vocabulary_id
-
-    def _process_obs(self, obs: Observations):
+        self._current_vocabulary[env_id] = vocabulary
+        self._current_vocabulary_id[env_id] = vocabulary_id
+        # Propagated masks use the ids of the previous vocabulary
+        if self._keyframe_segmentation is not None:
+            self._keyframe_segmentation[env_id].reset()
+
+    def _set_detic_vocab(self, vocabulary: RearrangeDETICCategories):
+        """switch DETIC to a vocabulary, if it does not already use it"""
+        detic_vocab = tuple(self._get_detic_vocab(vocabulary))
+        if detic_vocab != self._detic_vocab:
+            self._segmentation.reset_vocab(list(detic_vocab))
+            self._detic_vocab = detic_vocab
+
+    def _process_obs(self, obs: Observations, env_id: int = 0):
         """
         Process observations. Add pointers to objects and other metadata in segmentation mask.
         """
-        obs.semantic[obs.semantic == 0] = (
-            self._current_vocabulary.num_sem_categories - 1
-        )
-        obs.task_observations["recep_idx"] = (
-            self._current_vocabulary.num_sem_obj_categories + 1
-        )
-        obs.task_observations["semantic_max_val"] = (
-            self._current_vocabulary.num_sem_categories - 1
-        )
-        obs.task_observations["start_recep_goal"] = self.vocabulary_name_to_id[
+        vocabulary = self._current_vocabulary[env_id]
+        vocabulary_name_to_id = self._vocabulary_name_to_id[env_id]
+        obs.semantic[obs.semantic == 0] = vocabulary.num_sem_categories - 1
+        obs.task_observations["recep_idx"] = vocabulary.num_sem_obj_categories + 1
+        obs.task_observations["semantic_max_val"] = vocabulary.num_sem_categories - 1
+        obs.task_observations["start_recep_goal"] = vocabulary_name_to_id[
             obs.task_observations["start_recep_name"]
         ]
-        obs.task_observations["end_recep_goal"] = self.vocabulary_name_to_id[
+        obs.task_observations["end_recep_goal"] = vocabulary_name_to_id[
             obs.task_observations["place_recep_name"]
         ]
-        obs.task_observations["object_goal"] = self.vocabulary_name_to_id[
+        obs.task_observations["object_goal"] = vocabulary_name_to_id[
             obs.task_observations["object_name"]
         ]
 
-    def __call__(self, obs: Observations) -> Observations:
-        return self.forward(obs)
+    def __call__(self, obs: Observations, env_id: int = 0) -> Observations:
+        return self.forward(obs, env_id)
 
-    def forward(self, obs: Observations) -> Observations:
+    def forward(self, obs: Observations, env_id: int = 0) -> Observations:
         """
         Run segmentation model and preprocess observations for OVMM skills
         """
-        obs = self._segmentation.predict(
+        self._set_detic_vocab(self._current_vocabulary[env_id])
+        if self._keyframe_segmentation is not None:
+            obs = self._keyframe_segmentation[env_id](obs)
+        else:
+            obs = self._segment(obs)
+        self._process_obs(obs, env_id)
+        return obs
+
+    def _segment(self, obs: Observations) -> Observations:
+        return self._segmentation.predict(
             obs, depth_threshold=0.5, draw_instance_predictions=self._use_detic_viz
         )
-        self._process_obs(obs)
-        return obs
+
+    def forward_batch(
+        self, obs_list: List[Observations], env_ids: Optional[List[int]] = None
+    ) -> List[Observations]:
+        """
+        Run segmentation model on observations from several environments, once for all
+        environments which use the same vocabulary
+        """
+        if env_ids is None:
+            env_ids = list(range(len(obs_list)))
+        if self._keyframe_segmentation is not None:
+            # Keyframes are decided per environment
+            return [self.forward(obs, e) for obs, e in zip(obs_list, env_ids)]
+
+        obs_list = list(obs_list)
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for i, e in enumerate(env_ids):
+            detic_vocab = tuple(self._get_detic_vocab(self._current_vocabulary[e]))
+            groups.setdefault(detic_vocab, []).append(i)
+        # Start with the vocabulary DETIC already uses
+        for detic_vocab in sorted(groups, key=lambda v: v != self._detic_vocab):
+            idcs = groups[detic_vocab]
+            self._set_detic_vocab(self._current_vocabulary[env_ids[idcs[0]]])
+            predictions = self._segmentation.predict_batch(
+                [obs_list[i] for i in idcs],
+                depth_threshold=0.5,
+                draw_instance_predictions=self._use_detic_viz,
+            )
+            for i, obs in zip(idcs, predictions):
+                self._process_obs(obs, env_ids[i])
+                obs_list[i] = obs
+        return obs_list
@@ -8,7 +8,7 @@
 import copy
 import random
 from collections import OrderedDict
-from typing import Any, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import gym.spaces as spaces
 import numba
@@ -27,7 +27,6 @@ from habitat_baselines.common.obs_transformers import (
     get_active_obs_transforms,
 )
 from habitat_baselines.config.default import get_config as get_habitat_config
-from habitat_baselines.utils.common import batch_obs
 
 import home_robot.utils.pose as pu
 from home_robot.agent.ovmm_agent.complete_obs_space import get_complete_obs_space
@@ -41,6 +40,7 @@ from home_robot.utils.constants import (
     MAX_DEPTH_REPLACEMENT_VALUE,
     MIN_DEPTH_REPLACEMENT_VALUE,
 )
+from home_robot.utils.profiler import profiler
 
 random_generator = np.random.RandomState()
 
@@ -103,6 +103,8 @@ class PPOAgent(Agent):
                 )
             ]
         self.device_id = device_id
+        # Recurrent state and skill start pose are kept for each environment
+        self.num_environments = getattr(config, "NUM_ENVIRONMENTS", 1)
         self.device = (
             torch.device(f"cuda:{self.device_id}")
             if torch.cuda.is_available()
@@ -210,37 +212,46 @@ class PPOAgent(Agent):
             )
         self.terminate_condition = skill_config.terminate_condition
         self.show_rl_obs = getattr(config, "SHOW_RL_OBS", False)
-        self.manip_mode_called = False
-        self.skill_start_gps = None
-        self.skill_start_compass = None
+        self.manip_mode_called = [False] * self.num_environments
+        self.skill_start_gps = [None] * self.num_environments
+        self.skill_start_compass = [None] * self.num_environments
+        # Device buffers reused across steps to build batches of observations
+        self._buffers: Dict[str, torch.Tensor] = {}
 
     def reset(self) -> None:
         self.test_recurrent_hidden_states = torch.zeros(
-            1,
+            self.num_environments,
             self.actor_critic.num_recurrent_layers,
             self.hidden_size,
             device=self.device,
             dtype=torch.float32,
         )
-        self.not_done_masks = torch.zeros(1, 1, device=self.device, dtype=torch.bool)
+        self.not_done_masks = torch.zeros(
+            self.num_environments, 1, device=self.device, dtype=torch.bool
+        )
 
         self.prev_actions = torch.zeros(
-            1,
+            self.num_environments,
             self.actions_dim,
             dtype=torch.float32 if self.continuous_actions else torch.long,
             device=self.device,
         )
-        self.manip_mode_called = False
-        self.skill_start_gps = None
-        self.skill_start_compass = None
+        self.manip_mode_called = [False] * self.num_environments
+        self.skill_start_gps = [None] * self.num_environments
+        self.skill_start_compass = [None] * self.num_environments
 
     def reset_vectorized(self):
         """Initialize agent state."""
         self.reset()
 
     def reset_vectorized_for_env(self, e: int):
-        """Initialize agent state."""
-        self.reset()
+        """Initialize agent state for a specific environment."""
+        self.test_recurrent_hidden_states[e] = 0
+        self.not_done_masks[e] = False
+        self.prev_actions[e] = 0
+        self.manip_mode_called[e] = False
+        self.skill_start_gps[e] = None
+        self.skill_start_compass[e] = None
 
     def does_want_terminate(self, observations, action) -> bool:
         if not self.continuous_actions and self.terminate_condition == "discrete_stop":
@@ -290,8 +301,31 @@ class PPOAgent(Agent):
         rec_seg = seg_map[rec_seg]
         return rec_seg[..., np.newaxis].astype(np.int32)
 
+    def _get_state_obs(self, obs: Observations, e: int = 0) -> "OrderedDict[str, Any]":
+        """observations of the policy other than images, as numpy arrays"""
+        rel_pos = pu.get_rel_pose_change(
+            [obs.gps[0], obs.gps[1], obs.compass],
+            [
+                self.skill_start_gps[e][0],
+                self.skill_start_gps[e][1],
+                self.skill_start_compass[e],
+            ],
+        )
+        return OrderedDict(
+            {
+                "object_embedding": obs.task_observations["object_embedding"],
+                "joint": obs.joint,
+                "relative_resting_position": obs.relative_resting_position,
+                "is_holding": np.array(obs.task_observations["prev_grasp_success"]),
+                "robot_start_gps": np.array((rel_pos[1].item(), rel_pos[0].item())),
+                "robot_start_compass": pu.normalize_radians(rel_pos[2]),
+                "start_receptacle": np.array(obs.task_observations["start_receptacle"]),
+                "goal_receptacle": np.array(obs.task_observations["goal_receptacle"]),
+            }
+        )
+
     def convert_to_habitat_obs_space(
-        self, obs: Observations
+        self, obs: Observations, e: int = 0
     ) -> "OrderedDict[str, Any]":
         # normalize depth
         min_depth = self.config.ENVIRONMENT.min_depth
@@ -301,35 +335,20 @@ class PPOAgent(Agent):
         normalized_depth[normalized_depth == MAX_DEPTH_REPLACEMENT_VALUE] = max_depth
         normalized_depth = np.clip(normalized_depth, min_depth, max_depth)
         normalized_depth = (normalized_depth - min_depth) / (max_depth - min_depth)
-        rel_pos = pu.get_rel_pose_change(
-            [obs.gps[0], obs.gps[1], obs.compass],
-            [
-                self.skill_start_gps[0],
-                self.skill_start_gps[1],
-                self.skill_start_compass,
-            ],
-        )
         hab_obs = OrderedDict(
             {
                 "robot_head_depth": np.expand_dims(normalized_depth, -1).astype(
                     np.float32
                 ),
-                "object_embedding": obs.task_observations["object_embedding"],
                 "object_segmentation": np.expand_dims(
                     obs.semantic == obs.task_observations["object_goal"], -1
                 ).astype(np.uint8),
                 "goal_recep_segmentation": np.expand_dims(
                     obs.semantic == obs.task_observations["end_recep_goal"], -1
                 ).astype(np.uint8),
-                "joint": obs.joint,
-                "relative_resting_position": obs.relative_resting_position,
-                "is_holding": np.array(obs.task_observations["prev_grasp_success"]),
-                "robot_start_gps": np.array((rel_pos[1].item(), rel_pos[0].item())),
-                "robot_start_compass": pu.normalize_radians(rel_pos[2]),
-                "start_receptacle": np.array(obs.task_observations["start_receptacle"]),
-                "goal_receptacle": np.array(obs.task_observations["goal_receptacle"]),
             }
         )
+        hab_obs.update(self._get_state_obs(obs, e))
 
         if "ovmm_nav_goal_segmentation" in self.skill_obs_keys:
             hab_obs["ovmm_nav_goal_segmentation"] = self._get_goal_segmentation(obs)
@@ -337,6 +356,132 @@ class PPOAgent(Agent):
             hab_obs["receptacle_segmentation"] = self._get_receptacle_segmentation(obs)
         return hab_obs
 
+    def _get_buffer(
+        self, name: str, shape: Sequence[int], dtype: torch.dtype
+    ) -> torch.Tensor:
+        """view of shape `shape` of a device buffer kept across steps, reallocated only
+        when the frame size or type changes"""
+        buffer = self._buffers.get(name)
+        if (
+            buffer is None
+            or buffer.dtype != dtype
+            or buffer.shape[1:] != tuple(shape[1:])
+            or buffer.shape[0] < shape[0]
+        ):
+            buffer = torch.empty(
+                (max(shape[0], self.num_environments), *shape[1:]),
+                dtype=dtype,
+                device=self.device,
+            )
+            self._buffers[name] = buffer
+        return buffer[: shape[0]]
+
+    def _task_ids(self, obs_list: Sequence[Observations], key: str) -> torch.Tensor:
+        """(B, 1, 1) tensor of a task observation of each environment, to compare with
+        semantic frames"""
+        return torch.tensor(
+            [int(obs.task_observations[key]) for obs in obs_list], device=self.device
+        ).view(-1, 1, 1)
+
+    def _get_habitat_obs_batch(
+        self, obs_list: Sequence[Observations], env_ids: Sequence[int]
+    ) -> Dict[str, torch.Tensor]:
+        """Batch of the observations of the policy on device, for several environments.
+
+        Same as convert_to_habitat_obs_space followed by batch_obs, restricted to the
+        observations the skill uses. Frames are copied once to device buffers and depth
+        normalization and segmentation masks are computed there, in place.
+        """
+        batch_size = len(obs_list)
+        height, width = obs_list[0].depth.shape[:2]
+        batch = {}
+
+        if "robot_head_depth" in self.skill_obs_keys:
+            min_depth = self.config.ENVIRONMENT.min_depth
+            max_depth = self.config.ENVIRONMENT.max_depth
+            depth = self._get_buffer(
+                "robot_head_depth", (batch_size, height, width, 1), torch.float32
+            )
+            for i, obs in enumerate(obs_list):
+                depth[i, ..., 0].copy_(torch.from_numpy(np.asarray(obs.depth)))
+            # Missing values too close to the camera are set to min_depth; clipping
+            # already sets those too far to max_depth
+            too_close = torch.eq(
+                depth,
+                MIN_DEPTH_REPLACEMENT_VALUE,
+                out=self._get_buffer("too_close", depth.shape, torch.bool),
+            )
+            depth.clamp_(min_depth, max_depth).sub_(min_depth)
+            depth.div_(max_depth - min_depth).masked_fill_(too_close, 0.0)
+            batch["robot_head_depth"] = depth
+
+        segmentation_keys = [
+            "object_segmentation",
+            "goal_recep_segmentation",
+            "ovmm_nav_goal_segmentation",
+            "receptacle_segmentation",
+        ]
+        if any(k in self.skill_obs_keys for k in segmentation_keys):
+            semantic = self._get_buffer(
+                "semantic", (batch_size, height, width), torch.int64
+            )
+            for i, obs in enumerate(obs_list):
+                semantic[i].copy_(torch.from_numpy(np.asarray(obs.semantic)))
+            mask = self._get_buffer("mask", semantic.shape, torch.bool)
+
+            def get_mask(name: str, goal_keys: List[str]) -> torch.Tensor:
+                output = self._get_buffer(
+                    name, (batch_size, height, width, len(goal_keys)), torch.uint8
+                )
+                for c, goal_key in enumerate(goal_keys):
+                    torch.eq(semantic, self._task_ids(obs_list, goal_key), out=mask)
+                    output[..., c].copy_(mask)
+                return output
+
+            if "object_segmentation" in self.skill_obs_keys:
+                batch["object_segmentation"] = get_mask(
+                    "object_segmentation", ["object_goal"]
+                )
+            if "goal_recep_segmentation" in self.skill_obs_keys:
+                batch["goal_recep_segmentation"] = get_mask(
+                    "goal_recep_segmentation", ["end_recep_goal"]
+                )
+            if "ovmm_nav_goal_segmentation" in self.skill_obs_keys:
+                goal_keys = (
+                    ["end_recep_goal"]
+                    if self.nav_goal_seg_channels == 1
+                    else ["object_goal", "start_recep_goal"]
+                )
+                batch["ovmm_nav_goal_segmentation"] = get_mask(
+                    "ovmm_nav_goal_segmentation", goal_keys
+                )
+            if "receptacle_segmentation" in self.skill_obs_keys:
+                # Receptacles are numbered from 1, other categories are 0
+                recep_idx = self._task_ids(obs_list, "recep_idx")
+                max_val = self._task_ids(obs_list, "semantic_max_val")
+                output = self._get_buffer(
+                    "receptacle_segmentation",
+                    (batch_size, height, width, 1),
+                    torch.int32,
+                )
+                is_receptacle = self._get_buffer(
+                    "is_receptacle", mask.shape, torch.bool
+                )
+                torch.ge(semantic, recep_idx, out=mask)
+                mask.logical_and_(torch.lt(semantic, max_val, out=is_receptacle))
+                torch.sub(semantic, recep_idx - 1, out=output[..., 0])
+                output.mul_(mask.unsqueeze(-1))
+                batch["receptacle_segmentation"] = output
+
+        state_obs = [self._get_state_obs(obs, e) for e, obs in zip(env_ids, obs_list)]
+        for k in self.skill_obs_keys:
+            if k not in batch:
+                batch[k] = torch.as_tensor(
+                    np.stack([np.asarray(obs[k]) for obs in state_obs]),
+                    device=self.device,
+                )
+        return batch
+
     def act(
         self, observations: Observations, info
     ) -> Tuple[
@@ -345,84 +490,109 @@ class PPOAgent(Agent):
             ContinuousNavigationAction,
             DiscreteNavigationAction,
         ],
+        Any,
         bool,
     ]:
+        """action, info and whether the skill wants to terminate, in the first environment"""
+        return self.act_vectorized([observations], [info], env_ids=[0])[0]
+
+    def act_vectorized(
+        self,
+        obs_list: List[Observations],
+        infos: List[Any],
+        env_ids: Optional[List[int]] = None,
+    ) -> List[Tuple[Any, Any, bool]]:
+        """Same as act, for observations of several environments, each with its own
+        recurrent state. Observations are collated into a single forward pass of the
+        policy.
+
+        Arguments:
+            obs_list: observations of the environments
+            infos: info dicts of the environments
+            env_ids: environment of each observation; defaults to the first len(obs_list)
+        """
+        if env_ids is None:
+            env_ids = list(range(len(obs_list)))
         sample_random_seed()
-        if self.skill_start_gps is None:
-            self.skill_start_gps = observations.gps
-        if self.skill_start_compass is None:
-            self.skill_start_compass = observations.compass
-        obs = self.convert_to_habitat_obs_space(observations)
-        viz_obs = {k: obs[k] for k in self.skill_obs_keys}
-        batch = batch_obs([obs], device=self.device)
+        for e, observations in zip(env_ids, obs_list):
+            if self.skill_start_gps[e] is None:
+                self.skill_start_gps[e] = observations.gps
+            if self.skill_start_compass[e] is None:
+                self.skill_start_compass[e] = observations.compass
+        with profiler.span("preprocess"):
+            batch = self._get_habitat_obs_batch(obs_list, env_ids)
+        # Transforms may update the batch in place
+        untransformed_batch = dict(batch)
         batch = apply_obs_transforms_batch(batch, self.obs_transforms)
-        for k in self.skill_obs_keys:
-            viz_obs[k + "_resized"] = batch[k][0].cpu().numpy()
-        batch = OrderedDict([(k, batch[k]) for k in self.skill_obs_keys])
-
         if self.show_rl_obs:
-            frame = observations_to_image(viz_obs, info={})
-            info["rl_obs_frame"] = frame
+            for i, info in enumerate(infos):
+                viz_obs = {}
+                for k in self.skill_obs_keys:
+                    viz_obs[k] = untransformed_batch[k][i].cpu().numpy()
+                    viz_obs[k + "_resized"] = batch[k][i].cpu().numpy()
+                frame = observations_to_image(viz_obs, info={})
+                info["rl_obs_frame"] = frame
+        batch = OrderedDict([(k, batch[k]) for k in self.skill_obs_keys])
 
-        with torch.no_grad():
+        # Recurrent state slots of the environments in the batch
+        slots = torch.tensor(env_ids, device=self.device)
+        with torch.no_grad(), profiler.span("policy"):
             action_data = self.actor_critic.act(
                 batch,
-                self.test_recurrent_hidden_states,
-                self.prev_actions,
-                self.not_done_masks,
+                self.test_recurrent_hidden_states[slots],
+                self.prev_actions[slots],
+                self.not_done_masks[slots],
                 deterministic=False,
             )
-            (
-                _,
-                actions,
-                _,
-                self.test_recurrent_hidden_states,
-            ) = action_data
+            _, actions, _, hidden_states = action_data
+            self.test_recurrent_hidden_states[slots] = hidden_states
 
             #  Make masks not done till reset (end of episode) will be called
-            self.not_done_masks.fill_(True)
-            self.prev_actions.copy_(actions)  # type: ignore
-            if self.continuous_actions:
-                # Clipping actions to the specified limits
-                act = np.clip(
-                    actions.cpu().numpy(),
-                    self.vector_action_space.low,
-                    self.vector_action_space.high,
-                )
+            self.not_done_masks[slots] = True
+            self.prev_actions[slots] = actions
+
+        outputs = []
+        if self.continuous_actions:
+            # Clipping actions to the specified limits
+            act = np.clip(
+                actions.cpu().numpy(),
+                self.vector_action_space.low,
+                self.vector_action_space.high,
+            )
+            for i, (e, observations, info) in enumerate(zip(env_ids, obs_list, infos)):
                 step_action = continuous_vector_action_to_hab_dict(
-                    self.filtered_action_space, self.vector_action_space, act[0]
+                    self.filtered_action_space, self.vector_action_space, act[i]
                 )
-
                 robot_action = self._map_continuous_habitat_actions(
-                    step_action["action_args"]
+                    step_action["action_args"], e
                 )
                 does_want_terminate = self.does_want_terminate(
                     observations, step_action["action_args"]
                 )
-                return (
-                    robot_action,
-                    info,
-                    does_want_terminate,
-                )
-            else:
+                outputs.append((robot_action, info, does_want_terminate))
+        else:
+            for i, (observations, info) in enumerate(zip(obs_list, infos)):
                 step_action = self._map_discrete_habitat_actions(
-                    actions.item(), self.skill_actions
+                    actions[i].item(), self.skill_actions
                 )
-                return (
-                    step_action,
-                    info,
-                    self.does_want_terminate(observations, step_action),
+                outputs.append(
+                    (
+                        step_action,
+                        info,
+                        self.does_want_terminate(observations, step_action),
+                    )
                 )
+        return outputs
 
-    def _map_continuous_habitat_actions(self, cont_action):
+    def _map_continuous_habitat_actions(self, cont_action, e: int = 0):
         """Map habitat continuous actions to home-robot continuous actions"""
         # TODO: add home-robot support for simultaneous gripping
         if (
-            not self.manip_mode_called
+            not self.manip_mode_called[e]
             and "manipulation_mode" in cont_action
             and cont_action["manipulation_mode"] >= self.manip_mode_threshold
         ):
-            self.manip_mode_called = True
+            self.manip_mode_called[e] = True
             # Todo, look at the order in which hab-lab updates actions
             return DiscreteNavigationAction.MANIPULATION_MODE
         waypoint, turn, sel = cont_action[
@@ -440,7 +610,7 @@ class PPOAgent(Agent):
                 absolute_turn = 0
             xyt = np.array([0, 0, absolute_turn])  # turn
 
-        if self.manip_mode_called and self.constraint_base_in_manip_mode:
+        if self.manip_mode_called[e] and self.constraint_base_in_manip_mode:
             xyt = np.array([0, 0, 0])
 
         joints = None
@@ -45,6 +45,7 @@ class VisionLanguage2DSemanticMapModule(nn.Module):
         du_scale: int,
         exp_pred_threshold: float,
         map_pred_threshold: float,
+        lseg_scale_factor: float = 1.0,
     ):
         """
         Arguments:
@@ -66,6 +67,8 @@ class VisionLanguage2DSemanticMapModule(nn.Module):
              consider it as explored
             map_pred_threshold: number of depth points to be in bin to
              consider it as obstacle
+            lseg_scale_factor: frame downscaling before LSeg encoding; features
+             are then interpolated to the point cloud resolution
         """
         super().__init__()
 
@@ -77,6 +80,7 @@ class VisionLanguage2DSemanticMapModule(nn.Module):
             lseg_checkpoint_path, torch.device("cpu"), visualize=False
         )
         self.lseg_features_dim = lseg_features_dim
+        self.lseg_scale_factor = lseg_scale_factor
 
         self.map_size_parameters = mu.MapSizeParameters(
             map_resolution, map_size_cm, global_downscaling
@@ -277,9 +281,20 @@ class VisionLanguage2DSemanticMapModule(nn.Module):
         )
 
         # TODO Batch LSeg inference across time
-        pixel_features = self.lseg.encode(rgb.permute((0, 2, 3, 1)))
+        pixel_features = self.lseg.encode(
+            rgb.permute((0, 2, 3, 1)), scale_factor=self.lseg_scale_factor
+        )
+        if pixel_features.shape[-2:] == (h, w):
+            pixel_features = nn.AvgPool2d(self.du_scale)(pixel_features)
+        else:
+            pixel_features = F.interpolate(
+                pixel_features,
+                size=(h // self.du_scale, w // self.du_scale),
+                mode="bilinear",
+                align_corners=False,
+            )
 
-        feat[:, 1:, :] = nn.AvgPool2d(self.du_scale)(pixel_features).view(
+        feat[:, 1:, :] = pixel_features.view(
             batch_size, self.lseg_features_dim, h // self.du_scale * w // self.du_scale
         )
 
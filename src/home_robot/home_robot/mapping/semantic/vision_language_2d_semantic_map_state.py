@@ -152,14 +152,11 @@ class VisionLanguage2DSemanticMapState:
         """Get local map of semantic categories for an environment - decode CLIP
         features to label set."""
         assert labels[-1] == "other"
-        one_hot_categories, _ = lseg.decode(self.local_map[[e], 5:, :, :], labels)
-        one_hot_categories = one_hot_categories.squeeze(0)
+        semantic_map = lseg.decode_labels(self.local_map[[e], 5:, :, :], labels)[0]
+        # Cells without features are "other", the last category
         empty_mask = self.local_map[e, 5:].sum(0) == 0
-        one_hot_categories[empty_mask, :] = 0
-        one_hot_categories = one_hot_categories.cpu().float().numpy()
-        one_hot_categories[:, :, -1] = 1e-5  # Last category is "other"
-        semantic_map = one_hot_categories.argmax(-1)
-        return semantic_map
+        semantic_map[empty_mask] = len(labels) - 1
+        return semantic_map.cpu().numpy()
 
     def get_planner_pose_inputs(self, e) -> np.ndarray:
         """Get local planner pose inputs for an environment.
@@ -0,0 +1,268 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import itertools
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pinocchio
+from scipy.spatial.transform import Rotation as R
+
+from home_robot.motion.pinocchio_ik_solver import PinocchioIKSolver
+
+# Tolerance used to accept solutions which are at the boundary of the reachable set
+ANALYTIC_IK_EPS = 1e-9
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """cross product of two 3d vectors; much cheaper than np.cross for a single pair"""
+    return np.array(
+        [
+            a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0],
+        ]
+    )
+
+
+def _rotate(axis: np.ndarray, theta: float) -> np.ndarray:
+    """rotation matrix of angle theta about a unit axis (Rodrigues' formula)"""
+    x, y, z = axis
+    skew = np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+    return np.eye(3) + np.sin(theta) * skew + (1 - np.cos(theta)) * (skew @ skew)
+
+
+def _rotation_to(axis: np.ndarray, p: np.ndarray, q: np.ndarray) -> float:
+    """angle which rotates vector p about a unit axis onto vector q (Paden-Kahan subproblem 1)"""
+    p_perp = p - axis * axis.dot(p)
+    q_perp = q - axis * axis.dot(q)
+    return np.arctan2(axis.dot(_cross(p_perp, q_perp)), p_perp.dot(q_perp))
+
+
+def _two_rotations_to(
+    axis1: np.ndarray, axis2: np.ndarray, p: np.ndarray, q: np.ndarray
+) -> List[Tuple[float, float]]:
+    """all (theta1, theta2) such that rot(axis1, theta1) @ rot(axis2, theta2) @ p = q (Paden-Kahan
+    subproblem 2). The axes must not be parallel; returns zero, one or two solutions."""
+    cos12 = axis1.dot(axis2)
+    denom = cos12**2 - 1
+    alpha = (cos12 * axis2.dot(p) - axis1.dot(q)) / denom
+    beta = (cos12 * axis1.dot(q) - axis2.dot(p)) / denom
+    cross12 = _cross(axis1, axis2)
+    gamma_sq = (p.dot(p) - alpha**2 - beta**2 - 2 * alpha * beta * cos12) / (
+        cross12.dot(cross12)
+    )
+    if gamma_sq < -ANALYTIC_IK_EPS:
+        return []
+    gammas = [0.0] if gamma_sq <= ANALYTIC_IK_EPS else [np.sqrt(gamma_sq)]
+    if gamma_sq > ANALYTIC_IK_EPS:
+        gammas.append(-gammas[0])
+
+    solutions = []
+    for gamma in gammas:
+        # c is the intermediate vector: rot(axis2, theta2) @ p = c = rot(axis1, -theta1) @ q
+        c = alpha * axis1 + beta * axis2 + gamma * cross12
+        solutions.append((_rotation_to(axis1, c, q), _rotation_to(axis2, p, c)))
+    return solutions
+
+
+def _wrap_into_range(theta: float, lower: float, upper: float) -> List[float]:
+    """all values theta + 2 * k * pi that lie inside [lower, upper]"""
+    k_min = int(np.ceil((lower - theta) / (2 * np.pi) - ANALYTIC_IK_EPS))
+    k_max = int(np.floor((upper - theta) / (2 * np.pi) + ANALYTIC_IK_EPS))
+    return [
+        float(np.clip(theta + 2 * np.pi * k, lower, upper))
+        for k in range(k_min, k_max + 1)
+    ]
+
+
+class StretchAnalyticIKSolver(PinocchioIKSolver):
+    """Closed-form IK for the Stretch manipulator chain.
+
+    In manipulation mode the chain is a set of prismatic joints (base x, lift and the telescoping
+    arm) followed by the three revolute wrist joints (yaw, pitch, roll). The end-effector
+    orientation therefore only depends on the wrist, and is solved with Paden-Kahan subproblems;
+    for every wrist solution the position is then linear in the prismatic joints.
+
+    Poses without an exact solution within joint limits fall back to the iterative pinocchio
+    solver, unless fallback is disabled.
+    """
+
+    def __init__(
+        self,
+        urdf_path: str,
+        ee_link_name: str,
+        controlled_joints: List[str],
+        telescoping_joint_prefix: str = "joint_arm",
+        use_fallback: bool = True,
+    ):
+        """
+        urdf_path: path to urdf file
+        ee_link_name: name of the end-effector link
+        controlled_joints: list of joint names to control
+        telescoping_joint_prefix: prismatic joints with this prefix share the arm extension equally
+        use_fallback: use the iterative solver for poses with no analytic solution
+        """
+        super().__init__(urdf_path, ee_link_name, controlled_joints)
+        self.use_fallback = use_fallback
+
+        # Split the controlled joints into prismatic and revolute joints
+        prismatic, revolute = [], []
+        for i, name in enumerate(controlled_joints):
+            joint = self.model.joints[self.model.getJointId(name)]
+            if joint.nq != 1:
+                raise ValueError(f"Unsupported joint for analytic IK: {name}")
+            if joint.shortname().startswith("JointModelP"):
+                prismatic.append(i)
+            else:
+                revolute.append(i)
+        if len(revolute) != 3 or max(prismatic) > min(revolute):
+            raise ValueError(
+                "Analytic IK needs prismatic joints followed by a 3-dof revolute wrist"
+            )
+        self._prismatic_idx = np.array(prismatic)
+        self._revolute_idx = np.array(revolute)
+        self._telescoping = np.array(
+            [
+                controlled_joints[i].startswith(telescoping_joint_prefix)
+                for i in prismatic
+            ]
+        )
+
+        # Joint limits, in the controlled joint ordering
+        self._lower = np.array(
+            [self.model.lowerPositionLimit[j] for j in self.controlled_joints]
+        )
+        self._upper = np.array(
+            [self.model.upperPositionLimit[j] for j in self.controlled_joints]
+        )
+
+        # Joint axes in the world frame at the zero configuration. Prismatic joints come first
+        # in the chain, so these axes do not depend on the configuration.
+        q_zero = self._qmap_control2model(np.zeros(self.get_dof()))
+        data = self._get_data()
+        pinocchio.framesForwardKinematics(self.model, data, q_zero)
+        jacobian = pinocchio.computeFrameJacobian(
+            self.model, data, q_zero, self.ee_frame_idx, pinocchio.ReferenceFrame.WORLD
+        )
+        columns = [
+            self.model.idx_vs[self.model.getJointId(name)] for name in controlled_joints
+        ]
+        self._revolute_axes = [jacobian[3:, columns[i]].copy() for i in revolute]
+        prismatic_axes = [jacobian[:3, columns[i]].copy() for i in prismatic]
+        # Any vector orthogonal to the last wrist axis recovers its angle
+        axis1, axis2, axis3 = self._revolute_axes
+        self._roll_ref = _cross(axis3, axis1 if abs(axis1.dot(axis3)) < 0.9 else axis2)
+        self._ee_rot_zero = data.oMf[self.ee_frame_idx].rotation.copy()
+
+        # Position is linear in the independent prismatic dofs
+        independent = [
+            axis for axis, tele in zip(prismatic_axes, self._telescoping) if not tele
+        ]
+        if np.any(self._telescoping):
+            telescoping = [
+                axis for axis, tele in zip(prismatic_axes, self._telescoping) if tele
+            ]
+            independent.append(np.mean(telescoping, axis=0))
+        if len(independent) != 3:
+            raise ValueError("Analytic IK needs exactly 3 independent prismatic dofs")
+        self._prismatic_matrix = np.stack(independent, axis=1)
+        self._prismatic_matrix_inv = np.linalg.inv(self._prismatic_matrix)
+
+    def _wrist_solutions(self, rot_desired: np.ndarray) -> List[np.ndarray]:
+        """all (yaw, pitch, roll) wrist angles within limits producing rot_desired"""
+        axis1, axis2, axis3 = self._revolute_axes
+        rot = rot_desired @ self._ee_rot_zero.T
+
+        # axis3 is invariant to the last rotation, so the first two joints must map it onto rot @ axis3
+        solutions = []
+        for theta1, theta2 in _two_rotations_to(axis1, axis2, axis3, rot @ axis3):
+            rot12 = _rotate(axis1, theta1) @ _rotate(axis2, theta2)
+            theta3 = _rotation_to(axis3, self._roll_ref, rot12.T @ rot @ self._roll_ref)
+            solutions.append(np.array([theta1, theta2, theta3]))
+
+        # Keep every equivalent solution within the wrist joint limits
+        lower = self._lower[self._revolute_idx]
+        upper = self._upper[self._revolute_idx]
+        valid = []
+        for thetas in solutions:
+            candidates = [
+                _wrap_into_range(theta, lo, hi)
+                for theta, lo, hi in zip(thetas, lower, upper)
+            ]
+            valid += [np.array(c) for c in itertools.product(*candidates)]
+        return valid
+
+    def compute_all_ik(
+        self, pos_desired: np.ndarray, quat_desired: np.ndarray
+    ) -> List[np.ndarray]:
+        """returns all joint configurations within joint limits reaching the desired pose exactly"""
+        data = self._get_data()
+        rot_desired = R.from_quat(quat_desired).as_matrix()
+        solutions = []
+        for wrist in self._wrist_solutions(rot_desired):
+            # End-effector position with the prismatic joints at zero
+            q = np.zeros(self.get_dof())
+            q[self._revolute_idx] = wrist
+            pinocchio.framesForwardKinematics(
+                self.model, data, self._qmap_control2model(q)
+            )
+            pos_zero = data.oMf[self.ee_frame_idx].translation
+
+            # Then solve for the prismatic joint values
+            dofs = self._prismatic_matrix_inv @ (np.asarray(pos_desired) - pos_zero)
+            prismatic = np.empty(len(self._prismatic_idx))
+            prismatic[~self._telescoping] = dofs[: np.sum(~self._telescoping)]
+            if np.any(self._telescoping):
+                prismatic[self._telescoping] = dofs[-1] / np.sum(self._telescoping)
+            q[self._prismatic_idx] = prismatic
+
+            if np.all(q >= self._lower - ANALYTIC_IK_EPS) and np.all(
+                q <= self._upper + ANALYTIC_IK_EPS
+            ):
+                solutions.append(q)
+        return solutions
+
+    def compute_ik(
+        self,
+        pos_desired: np.ndarray,
+        quat_desired: np.ndarray,
+        q_init=None,
+        max_iterations=100,
+        num_attempts: int = 1,
+        verbose: bool = False,
+    ) -> Tuple[np.ndarray, bool, dict]:
+        """given end-effector position and quaternion, return joint values.
+
+        Returns the analytic solution closest to q_init (or the first one if q_init is None
+        or not in the controlled joint format); all solutions are available in the debug
+        info. max_iterations and num_attempts are only used by the iterative fallback
+        solver.
+        """
+        solutions = self.compute_all_ik(pos_desired, quat_desired)
+        if len(solutions) > 0:
+            if q_init is not None and len(q_init) == self.get_dof():
+                dists = [np.linalg.norm(q - q_init) for q in solutions]
+                q = solutions[int(np.argmin(dists))]
+            else:
+                q = solutions[0]
+            if verbose:
+                print(f"[analytic_ik_solver] found {len(solutions)} solutions")
+            return q, True, {"analytic": True, "solutions": solutions}
+
+        if verbose:
+            print("[analytic_ik_solver] no analytic solution, using iterative solver")
+        if not self.use_fallback:
+            return None, False, {"analytic": True, "solutions": solutions}
+        q, success, debug_info = super().compute_ik(
+            pos_desired,
+            quat_desired,
+            q_init=q_init,
+            max_iterations=max_iterations,
+            num_attempts=num_attempts,
+            verbose=verbose,
+        )
+        debug_info["analytic"] = False
+        debug_info["solutions"] = solutions
+        return q, success, debug_info
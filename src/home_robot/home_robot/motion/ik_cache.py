@@ -0,0 +1,100 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class IKCache(object):
+    """LRU cache of IK results keyed on a quantized target pose and initial configuration.
+
+    Grasp and place planners repeatedly query IK for nearly identical poses; quantizing the
+    query lets those repeated queries share a single solve.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        pos_resolution: float = 0.001,
+        quat_resolution: float = 0.001,
+        q0_resolution: Optional[float] = 0.05,
+    ):
+        """
+        max_size: max number of entries; the least recently used one is evicted first
+        pos_resolution: bucket size for the target position, in meters
+        quat_resolution: bucket size for the target quaternion components
+        q0_resolution: bucket size for the initial configuration; None ignores it in the key
+        """
+        self.max_size = max_size
+        self.pos_resolution = pos_resolution
+        self.quat_resolution = quat_resolution
+        self.q0_resolution = q0_resolution
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """reset the hit/miss counters"""
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """drop all entries and statistics"""
+        self._entries.clear()
+        self.reset_stats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def make_key(
+        self, pos: np.ndarray, quat: np.ndarray, q0: Optional[np.ndarray] = None
+    ) -> Tuple:
+        """quantize a query into a hashable key"""
+        quat = np.asarray(quat, dtype=np.float64)
+        # q and -q are the same rotation
+        if quat[np.argmax(np.abs(quat))] < 0:
+            quat = -quat
+        key = (
+            tuple(np.round(np.asarray(pos) / self.pos_resolution).astype(np.int64)),
+            tuple(np.round(quat / self.quat_resolution).astype(np.int64)),
+        )
+        if self.q0_resolution is not None and q0 is not None:
+            q0_bucket = np.round(np.asarray(q0) / self.q0_resolution).astype(np.int64)
+            key += (tuple(q0_bucket),)
+        else:
+            key += (None,)
+        return key
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """return the cached value for this key, or None, and update hit statistics"""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """add an entry, evicting the least recently used one if the cache is full"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        queries = self.hits + self.misses
+        return self.hits / queries if queries > 0 else 0.0
+
+    def get_stats(self) -> Dict[str, float]:
+        """hit-rate statistics, for tuning cache size and resolutions"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
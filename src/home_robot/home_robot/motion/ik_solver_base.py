@@ -14,6 +14,9 @@ class IKSolverBase(object):
     Base class for all IK solvers.
     """
 
+    # Whether compute_ik/compute_fk may be called concurrently from several threads
+    thread_safe: bool = False
+
     def get_dof(self) -> int:
         """returns dof for the manipulation chain"""
         raise NotImplementedError()
@@ -2,6 +2,8 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
@@ -29,6 +31,9 @@ class PinocchioIKSolver(IKSolverBase):
     DT = 1e-1
     DAMP = 1e-12
 
+    # Each thread gets its own pinocchio data, so solves can run concurrently
+    thread_safe = True
+
     def __init__(self, urdf_path: str, ee_link_name: str, controlled_joints: List[str]):
         """
         urdf_path: path to urdf file
@@ -37,6 +42,8 @@ class PinocchioIKSolver(IKSolverBase):
         """
         self.model = pinocchio.buildModelFromUrdf(urdf_path)
         self.data = self.model.createData()
+        self._thread_local = threading.local()
+        self._thread_local.data = self.data
         self.q_neutral = pinocchio.neutral(self.model)
 
         self.ee_frame_idx = [f.name for f in self.model.frames].index(ee_link_name)
@@ -53,6 +60,14 @@ class PinocchioIKSolver(IKSolverBase):
         """returns number of controllable joints under this solver's purview"""
         return len(self.controlled_joints)
 
+    def _get_data(self) -> pinocchio.Data:
+        """returns the pinocchio data buffer owned by the calling thread"""
+        data = getattr(self._thread_local, "data", None)
+        if data is None:
+            data = self.model.createData()
+            self._thread_local.data = data
+        return data
+
     def _qmap_control2model(self, q_input: np.ndarray) -> np.ndarray:
         """returns a full joint configuration from a partial joint configuration"""
         q_out = self.q_neutral.copy()
@@ -72,11 +87,12 @@ class PinocchioIKSolver(IKSolverBase):
 
     def compute_fk(self, q) -> Tuple[np.ndarray, np.ndarray]:
         """given joint values return end-effector position and quaternion associated with it"""
+        data = self._get_data()
         q_model = self._qmap_control2model(q)
-        pinocchio.forwardKinematics(self.model, self.data, q_model)
-        pinocchio.updateFramePlacement(self.model, self.data, self.ee_frame_idx)
-        pos = self.data.oMf[self.ee_frame_idx].translation
-        quat = R.from_matrix(self.data.oMf[self.ee_frame_idx].rotation).as_quat()
+        pinocchio.forwardKinematics(self.model, data, q_model)
+        pinocchio.updateFramePlacement(self.model, data, self.ee_frame_idx)
+        pos = data.oMf[self.ee_frame_idx].translation
+        quat = R.from_matrix(data.oMf[self.ee_frame_idx].rotation).as_quat()
 
         return pos.copy(), quat.copy()
 
@@ -98,6 +114,7 @@ class PinocchioIKSolver(IKSolverBase):
             max iterations: time budget in number of steps; included for compatibility with pb
         """
         i = 0
+        data = self._get_data()
 
         if q_init is None:
             q = self.q_neutral.copy()
@@ -114,10 +131,10 @@ class PinocchioIKSolver(IKSolverBase):
             R.from_quat(quat_desired).as_matrix(), pos_desired
         )
         while True:
-            pinocchio.forwardKinematics(self.model, self.data, q)
-            pinocchio.updateFramePlacement(self.model, self.data, self.ee_frame_idx)
+            pinocchio.forwardKinematics(self.model, data, q)
+            pinocchio.updateFramePlacement(self.model, data, self.ee_frame_idx)
 
-            dMi = desired_ee_pose.actInv(self.data.oMf[self.ee_frame_idx])
+            dMi = desired_ee_pose.actInv(data.oMf[self.ee_frame_idx])
             err = pinocchio.log(dMi).vector
             if verbose:
                 print(f"[pinocchio_ik_solver] iter={i}; error={err}")
@@ -129,7 +146,7 @@ class PinocchioIKSolver(IKSolverBase):
                 break
             J = pinocchio.computeFrameJacobian(
                 self.model,
-                self.data,
+                data,
                 q,
                 self.ee_frame_idx,
                 pinocchio.ReferenceFrame.LOCAL,
@@ -154,6 +171,8 @@ class PositionIKOptimizer(IKSolverBase):
     max_iterations: int = 30  # Max num of iterations for CEM
     num_samples: int = 100  # Total candidate samples for each CEM iteration
     num_top: int = 10  # Top N candidates for each CEM iteration
+    num_workers: int = 1  # Threads to evaluate candidates with (thread-safe IK only)
+    early_exit_patience: Optional[int] = None  # Stop after N iterations w/o improvement
 
     def __init__(
         self,
@@ -189,6 +208,24 @@ class PositionIKOptimizer(IKSolverBase):
             else self.num_samples
         )
         num_top = cem_params["num_top"] if "num_top" in cem_params else self.num_top
+        num_workers = (
+            cem_params["num_workers"]
+            if "num_workers" in cem_params
+            else self.num_workers
+        )
+        early_exit_patience = (
+            cem_params["early_exit_patience"]
+            if "early_exit_patience" in cem_params
+            else self.early_exit_patience
+        )
+
+        # Solvers sharing state between calls (e.g. a pybullet client) are evaluated serially
+        if num_workers > 1 and not self.ik_solver.thread_safe:
+            print(
+                f"[PositionIKOptimizer] {type(self.ik_solver).__name__} is not thread safe; "
+                "evaluating CEM candidates serially."
+            )
+            num_workers = 1
 
         self.opt = CEM(
             max_iterations=max_iterations,
@@ -196,6 +233,8 @@ class PositionIKOptimizer(IKSolverBase):
             num_top=num_top,
             tol=self.pos_error_tol,
             sigma0=self.ori_error_range / 2,
+            num_workers=num_workers,
+            early_exit_patience=early_exit_patience,
         )
 
     def get_dof(self) -> int:
@@ -213,12 +252,17 @@ class PositionIKOptimizer(IKSolverBase):
     ) -> Tuple[np.ndarray, bool, dict]:
         """optimization-based IK solver using CEM"""
 
-        # Function to optimize: IK error given delta from original desired orientation
-        def solve_ik(dr):
+        # Function to optimize: IK error given delta from original desired orientation.
+        # q_init is the IK solution of the closest elite from the previous CEM iteration.
+        def solve_ik(dr, q_init=None):
             pos = pos_desired
             quat = (R.from_rotvec(dr) * R.from_quat(quat_desired)).as_quat()
 
-            q, _, subsolver_debug_info = self.ik_solver.compute_ik(pos, quat)
+            q, _, subsolver_debug_info = self.ik_solver.compute_ik(
+                pos, quat, q_init=q_init
+            )
+            if q is None:
+                return np.inf, None
             pos_out, rot_out = self.ik_solver.compute_fk(q)
 
             cost_pos = np.linalg.norm(pos - pos_out)
@@ -232,19 +276,21 @@ class PositionIKOptimizer(IKSolverBase):
 
         # Optimize for IK and best orientation (x=0 -> use original desired orientation)
         cost_opt, q_result, max_iter, opt_sigma, success = self.opt.optimize(
-            solve_ik, x0=np.zeros(3)
+            solve_ik, x0=np.zeros(3), warm_start=True
         )
-        pos_out, quat_out = self.ik_solver.compute_fk(q_result)
-        print(
-            f"After ik optimization, cost: {cost_opt}, result: {pos_out, quat_out} vs desired: {pos_desired, quat_desired}"
-        )
-
         debug_info = {
             "best_cost": cost_opt,
             "last_iter": max_iter,
             "opt_sigma": opt_sigma,
         }
+        if q_result is None:
+            # The subsolver failed for every sample
+            return None, False, debug_info
 
+        pos_out, quat_out = self.ik_solver.compute_fk(q_result)
+        print(
+            f"After ik optimization, cost: {cost_opt}, result: {pos_out, quat_out} vs desired: {pos_desired, quat_desired}"
+        )
         return q_result, success, debug_info
 
     def compute_fk(self, q):
@@ -261,21 +307,71 @@ class CEM:
         num_top: int,
         tol: float,
         sigma0: np.ndarray,
+        num_workers: int = 1,
+        early_exit_patience: Optional[int] = None,
+        early_exit_min_improvement: float = 0.0,
     ):
         """
         max_iterations: max number of iterations
         num_samples: number of samples per iteration
         num_top: number of top samples to use for next iteration
         tol: tolerance for stopping criterion
+        num_workers: number of threads used to evaluate non-batched cost functions
+        early_exit_patience: stop once the best cost has not improved by more than
+            early_exit_min_improvement for this many iterations (None disables this)
         """
         self.max_iterations = max_iterations
         self.num_samples = num_samples
         self.num_top = num_top
         self.cost_tol = tol
         self.sigma0 = sigma0
+        self.num_workers = num_workers
+        self.early_exit_patience = early_exit_patience
+        self.early_exit_min_improvement = early_exit_min_improvement
 
-    def optimize(self, func: Callable, x0: np.ndarray):
-        """optimize function func with initial guess mu=x0 and initial std=sigma0"""
+    def _evaluate(
+        self,
+        func: Callable,
+        x_arr: np.ndarray,
+        warm_starts: Optional[List],
+        batched: bool,
+        executor: Optional[ThreadPoolExecutor],
+    ) -> Tuple[np.ndarray, List]:
+        """evaluate func on all samples; returns an array of costs and a list of aux outputs"""
+        if batched:
+            if warm_starts is None:
+                cost_arr, aux_outputs = func(x_arr)
+            else:
+                cost_arr, aux_outputs = func(x_arr, warm_starts)
+            return np.asarray(cost_arr, dtype=np.float64), list(aux_outputs)
+
+        if warm_starts is None:
+            args = [(x,) for x in x_arr]
+        else:
+            args = list(zip(x_arr, warm_starts))
+        if executor is not None:
+            results = list(executor.map(lambda a: func(*a), args))
+        else:
+            results = [func(*a) for a in args]
+        cost_arr = np.array([cost for cost, _ in results], dtype=np.float64)
+        aux_outputs = [aux for _, aux in results]
+        return cost_arr, aux_outputs
+
+    def optimize(
+        self,
+        func: Callable,
+        x0: np.ndarray,
+        batched: bool = False,
+        warm_start: bool = False,
+    ):
+        """optimize function func with initial guess mu=x0 and initial std=sigma0
+
+        func: by default, maps a single sample x to (cost, aux_output). If batched, it maps an
+            (num_samples, dim) array to (costs, list of aux_outputs) in a single call.
+        warm_start: if set, func receives an additional argument (a list of them if batched)
+            with the aux output of the closest elite sample from the previous iteration, or
+            None on the first iteration. For IK this is the elite joint configuration.
+        """
         assert (
             x0.shape == self.sigma0.shape
         ), f"x0 and sigma0 must have same shape, got {x0.shape} and {self.sigma0.shape}"
@@ -283,35 +379,75 @@ class CEM:
         i = 0
         mu = x0
         sigma = self.sigma0
+        elite_x, elite_aux = None, None
+        best_cost, best_aux = np.inf, None
+        iters_without_improvement = 0
+
+        executor = None
+        if not batched and self.num_workers > 1:
+            executor = ThreadPoolExecutor(max_workers=self.num_workers)
+
+        try:
+            while True:
+                # Sample x
+                x_arr = mu + sigma * np.random.randn(self.num_samples, x0.shape[0])
+
+                # Each sample starts from the solution of its nearest elite
+                warm_starts = None
+                if warm_start:
+                    if elite_x is None:
+                        warm_starts = [None] * self.num_samples
+                    else:
+                        dists = np.linalg.norm(
+                            x_arr[:, None, :] - elite_x[None, :, :], axis=-1
+                        )
+                        warm_starts = [elite_aux[k] for k in np.argmin(dists, axis=1)]
+
+                # Compute costs
+                cost_arr, aux_outputs = self._evaluate(
+                    func, x_arr, warm_starts, batched, executor
+                )
 
-        while True:
-            # Sample x
-            x_arr = mu + sigma * np.random.randn(self.num_samples, x0.shape[0])
-
-            # Compute costs
-            cost_arr = np.zeros(self.num_samples)
-            aux_outputs = [None for _ in range(self.num_samples)]
-            for j, x in enumerate(x_arr):
-                cost_arr[j], aux_outputs[j] = func(x)
-
-            # Sort costs
-            idx_sorted_arr = np.argsort(cost_arr)
-            i_best = idx_sorted_arr[0]
-
-            # Check termination
-            i += 1
-            if i >= self.max_iterations or np.all(sigma <= self.cost_tol / 10):
-                # If we have run out of iterations or if our sigma has converged before getting close enough, per our
-                # error tolerances, then the optimization failed
-                success = False
-                break
-
-            if cost_arr[i_best] <= self.cost_tol:
-                success = True
-                break
-
-            # Update distribution
-            mu = np.mean(x_arr[idx_sorted_arr[: self.num_top], :], axis=0)
-            sigma = np.std(x_arr[idx_sorted_arr[: self.num_top], :], axis=0)
-
-        return cost_arr[i_best], aux_outputs[i_best], i, sigma, success
+                # Sort costs
+                idx_sorted_arr = np.argsort(cost_arr)
+                i_best = idx_sorted_arr[0]
+
+                # Keep track of the best sample seen over all iterations
+                if cost_arr[i_best] < best_cost - self.early_exit_min_improvement:
+                    iters_without_improvement = 0
+                else:
+                    iters_without_improvement += 1
+                if cost_arr[i_best] < best_cost:
+                    best_cost, best_aux = cost_arr[i_best], aux_outputs[i_best]
+
+                # Check termination
+                i += 1
+                if best_cost <= self.cost_tol:
+                    success = True
+                    break
+
+                if (
+                    i >= self.max_iterations
+                    or np.all(sigma <= self.cost_tol / 10)
+                    or (
+                        self.early_exit_patience is not None
+                        and iters_without_improvement >= self.early_exit_patience
+                    )
+                ):
+                    # If we have run out of iterations, if our sigma has converged or if we have
+                    # stopped improving before getting close enough, per our error tolerances,
+                    # then the optimization failed
+                    success = False
+                    break
+
+                # Update distribution
+                elite_idxs = idx_sorted_arr[: self.num_top]
+                elite_x = x_arr[elite_idxs, :]
+                elite_aux = [aux_outputs[k] for k in elite_idxs]
+                mu = np.mean(elite_x, axis=0)
+                sigma = np.std(elite_x, axis=0)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return best_cost, best_aux, i, sigma, success
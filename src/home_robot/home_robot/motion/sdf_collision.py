@@ -0,0 +1,273 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pinocchio
+from scipy import ndimage
+from scipy.spatial.transform import Rotation as R
+
+# Distance used for grids without any obstacle; finite so it can be interpolated
+SDF_MAX_DISTANCE = 1e3
+
+
+class SignedDistanceField(object):
+    """Signed distance grid of a scene: negative inside obstacles, positive in free space.
+
+    Queries outside of the grid are treated as free space."""
+
+    def __init__(
+        self,
+        distances: np.ndarray,
+        origin: np.ndarray,
+        resolution: float,
+        fill_value: float = np.inf,
+    ):
+        """
+        distances: (X, Y, Z) signed distances in meters, sampled at voxel centers
+        origin: world position of the center of voxel (0, 0, 0)
+        resolution: voxel size in meters
+        fill_value: distance returned for queries outside of the grid
+        """
+        self.distances = distances.astype(np.float32)
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.resolution = resolution
+        self.fill_value = fill_value
+        self._max_idx = np.array(distances.shape) - 1
+
+    @classmethod
+    def from_occupancy(
+        cls, occupancy: np.ndarray, origin: np.ndarray, resolution: float
+    ) -> "SignedDistanceField":
+        """compute the signed distance field of a boolean (X, Y, Z) occupancy grid"""
+        occupancy = occupancy.astype(bool)
+        if not np.any(occupancy):
+            return cls(np.full(occupancy.shape, SDF_MAX_DISTANCE), origin, resolution)
+        outside = ndimage.distance_transform_edt(~occupancy)
+        inside = ndimage.distance_transform_edt(occupancy)
+        # Distances between voxel centers; obstacle boundaries lie half a voxel away from them
+        distances = np.where(occupancy, 0.5 - inside, outside - 0.5) * resolution
+        return cls(distances, origin, resolution)
+
+    @classmethod
+    def from_points(
+        cls,
+        xyz: np.ndarray,
+        resolution: float = 0.02,
+        padding: float = 0.5,
+        min_height: Optional[float] = None,
+    ) -> "SignedDistanceField":
+        """voxelize an (N, 3) point cloud of obstacles and compute its signed distance field
+
+        padding: free space kept around the points, so that distances are valid near the scene
+        min_height: drop points below this height, e.g. to remove the floor
+        """
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        if min_height is not None:
+            xyz = xyz[xyz[:, 2] >= min_height]
+        if xyz.shape[0] == 0:
+            return cls(np.full((1, 1, 1), SDF_MAX_DISTANCE), np.zeros(3), resolution)
+        origin = xyz.min(axis=0) - padding
+        shape = (
+            np.ceil((xyz.max(axis=0) + padding - origin) / resolution).astype(int) + 1
+        )
+        idx = np.round((xyz - origin) / resolution).astype(int)
+        occupancy = np.zeros(shape, dtype=bool)
+        occupancy[idx[:, 0], idx[:, 1], idx[:, 2]] = True
+        return cls.from_occupancy(occupancy, origin, resolution)
+
+    @classmethod
+    def from_voxel_map(
+        cls, voxel_map, resolution: Optional[float] = None, **kwargs
+    ) -> "SignedDistanceField":
+        """compute the signed distance field of the points in a SparseVoxelMap"""
+        xyz, _ = voxel_map.get_data()
+        if xyz is None:
+            xyz = np.zeros((0, 3))
+        if resolution is None:
+            resolution = voxel_map.resolution
+        return cls.from_points(xyz, resolution=resolution, **kwargs)
+
+    def query(self, points: np.ndarray) -> np.ndarray:
+        """trilinearly interpolated signed distance at (..., 3) world points"""
+        points = np.asarray(points)
+        shape = points.shape[:-1]
+        coords = ((points.reshape(-1, 3) - self.origin) / self.resolution).T
+        distances = ndimage.map_coordinates(
+            self.distances, coords, order=1, mode="nearest"
+        )
+        outside = np.any((coords < 0) | (coords > self._max_idx[:, None]), axis=0)
+        distances[outside] = self.fill_value
+        return distances.reshape(shape)
+
+
+def _box_to_spheres(
+    size: np.ndarray, max_spacing: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """cover a box centered at the origin with spheres; returns (centers, radii)"""
+    spacing = max(float(np.min(size)), max_spacing)
+    num = np.maximum(np.ceil(size / spacing), 1).astype(int)
+    cell = size / num
+    axes = [(np.arange(n) + 0.5) * c - s / 2 for n, c, s in zip(num, cell, size)]
+    centers = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+    # Spheres circumscribe their cell, so the approximation is conservative
+    radii = np.full(centers.shape[0], np.linalg.norm(cell) / 2)
+    return centers, radii
+
+
+def load_collision_spheres(
+    urdf_path: str,
+    max_spacing: float = 0.05,
+    ignore_links: Sequence[str] = (),
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """approximate the collision geometry of each link with spheres in the link frame
+
+    Supports box, cylinder and sphere collision shapes; meshes are skipped.
+    Returns a dict of link name -> (centers, radii).
+    """
+    spheres = {}
+    root = ET.parse(urdf_path).getroot()
+    for link in root.findall("link"):
+        name = link.get("name")
+        if name in ignore_links:
+            continue
+        link_centers, link_radii = [], []
+        for collision in link.findall("collision"):
+            geometry = collision.find("geometry")
+            if geometry.find("box") is not None:
+                size = np.array(
+                    [float(v) for v in geometry.find("box").get("size").split()]
+                )
+                centers, radii = _box_to_spheres(size, max_spacing)
+            elif geometry.find("cylinder") is not None:
+                cylinder = geometry.find("cylinder")
+                radius = float(cylinder.get("radius"))
+                length = float(cylinder.get("length"))
+                size = np.array([2 * radius, 2 * radius, length])
+                centers, radii = _box_to_spheres(size, max_spacing)
+            elif geometry.find("sphere") is not None:
+                centers = np.zeros((1, 3))
+                radii = np.array([float(geometry.find("sphere").get("radius"))])
+            else:
+                continue
+
+            # Move spheres from the collision frame into the link frame
+            origin = collision.find("origin")
+            if origin is not None:
+                xyz = np.array([float(v) for v in origin.get("xyz", "0 0 0").split()])
+                rpy = [float(v) for v in origin.get("rpy", "0 0 0").split()]
+                centers = centers @ R.from_euler("xyz", rpy).as_matrix().T + xyz
+            link_centers.append(centers)
+            link_radii.append(radii)
+        if len(link_centers) > 0:
+            spheres[name] = (np.concatenate(link_centers), np.concatenate(link_radii))
+    return spheres
+
+
+class SphereCollisionChecker(object):
+    """Batched collision checking of robot configurations against a signed distance field.
+
+    Robot links are approximated as sets of spheres, posed with pinocchio forward kinematics; no
+    physics client is needed. A configuration is in collision if any sphere is closer to an
+    obstacle than its radius plus the requested margin.
+    """
+
+    def __init__(
+        self,
+        urdf_path: str,
+        joint_map: Dict[str, Tuple[int, float]],
+        sdf: Optional[SignedDistanceField] = None,
+        max_sphere_spacing: float = 0.05,
+        ignore_links: Sequence[str] = (),
+    ):
+        """
+        urdf_path: path to the full-body urdf
+        joint_map: urdf joint name -> (index in the robot configuration, scale)
+        sdf: signed distance field of the scene; can be set later with set_sdf
+        max_sphere_spacing: largest spacing between spheres approximating a link
+        ignore_links: links not checked for collisions
+        """
+        self.model = pinocchio.buildModelFromUrdf(urdf_path)
+        self.data = self.model.createData()
+        self.q_neutral = pinocchio.neutral(self.model)
+        self.sdf = sdf
+
+        # Configuration -> pinocchio joint positions
+        self._model_idx = np.array(
+            [self.model.idx_qs[self.model.getJointId(j)] for j in joint_map]
+        )
+        self._config_idx = np.array([idx for idx, _ in joint_map.values()])
+        self._config_scale = np.array([scale for _, scale in joint_map.values()])
+
+        # Spheres for each link, in the link frame
+        spheres = load_collision_spheres(urdf_path, max_sphere_spacing, ignore_links)
+        self.link_names: List[str] = []
+        centers, radii, owners, joint_centers, joints = [], [], [], [], []
+        for name, (link_centers, link_radii) in spheres.items():
+            if not self.model.existFrame(name):
+                continue
+            owners += [len(self.link_names)] * len(link_radii)
+            self.link_names.append(name)
+            centers.append(link_centers)
+            radii.append(link_radii)
+            # Links are rigidly attached to a joint; express spheres in that joint's frame so
+            # that only joint placements need to be computed for each configuration
+            frame = self.model.frames[self.model.getFrameId(name)]
+            placement = frame.placement
+            joint_centers.append(
+                link_centers @ placement.rotation.T + placement.translation
+            )
+            joints += [frame.parentJoint] * len(link_radii)
+        self.sphere_centers = np.concatenate(centers)
+        self.sphere_radii = np.concatenate(radii)
+        self.sphere_links = np.array(owners)
+        joint_ids, self._sphere_joints = np.unique(joints, return_inverse=True)
+        self._joint_ids = [int(j) for j in joint_ids]
+        self._joint_sphere_centers = np.concatenate(joint_centers)
+
+    def set_sdf(self, sdf: SignedDistanceField):
+        """set the scene to check against"""
+        self.sdf = sdf
+
+    def _to_model_config(self, qs: np.ndarray) -> np.ndarray:
+        """(N, dof) robot configurations -> (N, nq) pinocchio configurations"""
+        q_model = np.tile(self.q_neutral, (qs.shape[0], 1))
+        q_model[:, self._model_idx] = qs[:, self._config_idx] * self._config_scale
+        return q_model
+
+    def get_sphere_positions(self, qs: np.ndarray) -> np.ndarray:
+        """world positions (N, num_spheres, 3) of all collision spheres for (N, dof) configs"""
+        qs = np.atleast_2d(qs)
+        q_model = self._to_model_config(qs)
+        num_joints = len(self._joint_ids)
+        rotations = np.empty((qs.shape[0], num_joints, 3, 3))
+        translations = np.empty((qs.shape[0], num_joints, 3))
+        for i, q in enumerate(q_model):
+            pinocchio.forwardKinematics(self.model, self.data, q)
+            for j, joint_id in enumerate(self._joint_ids):
+                placement = self.data.oMi[joint_id]
+                rotations[i, j] = placement.rotation
+                translations[i, j] = placement.translation
+        joint_rot = rotations[:, self._sphere_joints]
+        joint_pos = translations[:, self._sphere_joints]
+        return (
+            np.einsum("nsij,sj->nsi", joint_rot, self._joint_sphere_centers) + joint_pos
+        )
+
+    def get_clearance(self, qs: np.ndarray) -> np.ndarray:
+        """signed clearance (N, num_spheres) between each sphere and the closest obstacle"""
+        assert self.sdf is not None, "set a signed distance field first"
+        positions = self.get_sphere_positions(qs)
+        return self.sdf.query(positions) - self.sphere_radii
+
+    def check_batch(self, qs: np.ndarray, distance: float = 0.0) -> np.ndarray:
+        """returns a boolean array, true for each (N, dof) configuration that is collision free"""
+        return np.all(self.get_clearance(qs) > distance, axis=-1)
+
+    def colliding_links(self, q: np.ndarray, distance: float = 0.0) -> List[str]:
+        """names of the links of a single configuration which are in collision"""
+        in_collision = self.get_clearance(q)[0] <= distance
+        return sorted({self.link_names[i] for i in self.sphere_links[in_collision]})
@@ -4,15 +4,22 @@
 # LICENSE file in the root directory of this source tree.
 import math
 import os
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pybullet as pb
 
 import home_robot.utils.bullet as hrb
 from home_robot.core.interfaces import ContinuousFullBodyAction
+from home_robot.motion.analytic_ik_solver import StretchAnalyticIKSolver
+from home_robot.motion.ik_cache import IKCache
 from home_robot.motion.pinocchio_ik_solver import PinocchioIKSolver, PositionIKOptimizer
 from home_robot.motion.robot import Robot
+from home_robot.motion.sdf_collision import SignedDistanceField, SphereCollisionChecker
+from home_robot.motion.time_parameterization import (
+    TrapezoidalTimeParameterization,
+    get_waypoints,
+)
 from home_robot.utils.bullet import PybulletIKSolver
 from home_robot.utils.pose import to_matrix
 
@@ -154,6 +161,39 @@ STRETCH_HEAD_CAMERA_ROTATIONS = (
     3  # number of counterclockwise rotations for the head camera
 )
 
+# Joint velocity and acceleration limits, in the same order as HelloStretchIdx. Conservative
+# values from the stretch_body defaults; the urdf velocity limits are placeholders.
+STRETCH_MAX_JOINT_VELOCITY = np.array(
+    [
+        0.15,  # x
+        0.15,  # y
+        0.5,  # theta
+        0.15,  # lift
+        0.15,  # arm
+        1.0,  # gripper
+        1.0,  # wrist roll
+        1.0,  # wrist pitch
+        1.0,  # wrist yaw
+        1.0,  # head pan
+        1.0,  # head tilt
+    ]
+)
+STRETCH_MAX_JOINT_ACCELERATION = np.array(
+    [
+        0.2,  # x
+        0.2,  # y
+        1.0,  # theta
+        0.3,  # lift
+        0.3,  # arm
+        2.0,  # gripper
+        2.0,  # wrist roll
+        2.0,  # wrist pitch
+        2.0,  # wrist yaw
+        2.0,  # head pan
+        2.0,  # head tilt
+    ]
+)
+
 # For EXTEND_ARM action
 STRETCH_ARM_EXTENSION = 0.8
 STRETCH_ARM_LIFT = 0.8
@@ -246,15 +286,44 @@ class HelloStretchKinematics(Robot):
         "joint_wrist_roll",
     ]
 
-    def _create_ik_solvers(self, ik_type: str = "pinocchio", visualize: bool = False):
-        """Create ik solvers using physics backends such as pybullet or pinocchio."""
+    # URDF joint -> (index in the configuration, scale), for pinocchio-based collision checking
+    full_body_joint_map = {
+        "base_x_joint": (HelloStretchIdx.BASE_X, 1.0),
+        "base_y_joint": (HelloStretchIdx.BASE_Y, 1.0),
+        "base_theta_joint": (HelloStretchIdx.BASE_THETA, 1.0),
+        "joint_lift": (HelloStretchIdx.LIFT, 1.0),
+        "joint_arm_l0": (HelloStretchIdx.ARM, 0.25),
+        "joint_arm_l1": (HelloStretchIdx.ARM, 0.25),
+        "joint_arm_l2": (HelloStretchIdx.ARM, 0.25),
+        "joint_arm_l3": (HelloStretchIdx.ARM, 0.25),
+        "joint_wrist_yaw": (HelloStretchIdx.WRIST_YAW, 1.0),
+        "joint_wrist_pitch": (HelloStretchIdx.WRIST_PITCH, 1.0),
+        "joint_wrist_roll": (HelloStretchIdx.WRIST_ROLL, 1.0),
+        "joint_gripper_finger_left": (HelloStretchIdx.GRIPPER, 1.0),
+        "joint_gripper_finger_right": (HelloStretchIdx.GRIPPER, 1.0),
+        "joint_head_pan": (HelloStretchIdx.HEAD_PAN, 1.0),
+        "joint_head_tilt": (HelloStretchIdx.HEAD_TILT, 1.0),
+    }
+
+    def _create_ik_solvers(
+        self,
+        ik_type: str = "pinocchio",
+        visualize: bool = False,
+        ik_num_workers: int = 1,
+    ):
+        """Create ik solvers using physics backends such as pybullet or pinocchio.
+
+        ik_num_workers: number of threads used to evaluate CEM samples in "*_optimize" modes
+        """
         # You can set one of the visualize flags to true to debug IK issues
         # This is not exposed manually - only one though or it will fail
         assert ik_type in [
             "pybullet",
             "pinocchio",
+            "analytic",
             "pybullet_optimize",
             "pinocchio_optimize",
+            "analytic_optimize",
         ], f"Unknown ik type: {ik_type}"
 
         # You can set one of the visualize flags to true to debug IK issues
@@ -276,12 +345,20 @@ class HelloStretchKinematics(Robot):
                 self._ee_link_name,
                 self._manip_mode_controlled_joints,
             )
+        elif "analytic" in ik_type:
+            # Closed-form solutions; the iterative pinocchio solver is only a fallback
+            self.manip_ik_solver = StretchAnalyticIKSolver(
+                self.manip_mode_urdf_path,
+                self._ee_link_name,
+                self._manip_mode_controlled_joints,
+            )
 
         if "optimize" in ik_type:
             self.manip_ik_solver = PositionIKOptimizer(
                 ik_solver=self.manip_ik_solver,
                 pos_error_tol=0.005,
                 ori_error_range=np.array([0.0, 0.0, 0.2]),
+                cem_params={"num_workers": ik_num_workers},
             )
 
     def __init__(
@@ -295,8 +372,15 @@ class HelloStretchKinematics(Robot):
         grasp_frame: Optional[str] = None,
         joint_tolerance: float = 0.01,
         manip_mode_controlled_joints: Optional[List[str]] = None,
+        ik_num_workers: int = 1,
+        ik_cache_size: int = 0,
+        ik_cache_warm_start: bool = False,
     ):
-        """Create the robot in bullet for things like kinematics; extract information"""
+        """Create the robot in bullet for things like kinematics; extract information
+
+        ik_cache_size: max number of manip_ik results kept in an LRU cache; 0 disables it
+        ik_cache_warm_start: if set, cache hits seed the IK solver instead of being returned
+        """
 
         self.joint_tol = joint_tolerance
 
@@ -346,7 +430,21 @@ class HelloStretchKinematics(Robot):
             else self.default_manip_mode_controlled_joints
         )
 
-        self._create_ik_solvers(ik_type=ik_type, visualize=visualize)
+        self._create_ik_solvers(
+            ik_type=ik_type, visualize=visualize, ik_num_workers=ik_num_workers
+        )
+
+        # Optional sphere/distance-field collision backend used instead of pybullet in validate
+        self.collision_checker = None
+
+        # Turns waypoint lists into timed trajectories
+        self.time_parameterization = TrapezoidalTimeParameterization(
+            STRETCH_MAX_JOINT_VELOCITY, STRETCH_MAX_JOINT_ACCELERATION
+        )
+
+        # Cache for repeated IK queries on (nearly) identical poses
+        self.ik_cache = IKCache(max_size=ik_cache_size) if ik_cache_size > 0 else None
+        self._ik_cache_warm_start = ik_cache_warm_start
 
     def set_head_config(self, q):
         # WARNING: this sets all configs
@@ -582,7 +680,7 @@ class HelloStretchKinematics(Robot):
         """manipulator specific forward kinematics; uses separate URDF than the full-body fk() method"""
         assert q.shape == (self.dof,)
 
-        if "pinocchio" in self._ik_type:
+        if "pinocchio" in self._ik_type or "analytic" in self._ik_type:
             q = self._ros_pose_to_pinocchio(q)
 
         ee_pos, ee_quat = self.manip_ik_solver.compute_fk(q)
@@ -739,10 +837,11 @@ class HelloStretchKinematics(Robot):
         """
 
         if q0 is not None:
-            self._to_manip_format(q0)
+            q0_manip = self._to_manip_format(q0)
             default_q = q0
         else:
             # q0 = STRETCH_HOME_Q
+            q0_manip = None
             default_q = STRETCH_HOME_Q
         # Perform IK
         # These should be relative to the robot's base
@@ -754,16 +853,45 @@ class HelloStretchKinematics(Robot):
             # This logic currently in local hello robot client
             raise NotImplementedError()
 
+        # Check for a cached solution to the same quantized query
+        q_init = q0
+        cache_key = None
+        if self.ik_cache is not None:
+            cache_key = self.ik_cache.make_key(pos, quat, q0_manip)
+            cached = self.ik_cache.get(cache_key)
+            if cached is not None:
+                q, success, debug_info = cached
+                if not self._ik_cache_warm_start:
+                    q = q.copy() if q is not None else None
+                    return self._manip_ik_output(q, success, debug_info, default_q)
+                elif q is not None:
+                    q_init = q.copy()
+
         q, success, debug_info = self.manip_ik_solver.compute_ik(
-            pos, quat, q0, num_attempts=num_attempts, verbose=verbose
+            pos, quat, q_init, num_attempts=num_attempts, verbose=verbose
         )
 
+        if cache_key is not None:
+            self.ik_cache.put(
+                cache_key, (q.copy() if q is not None else None, success, debug_info)
+            )
+
+        return self._manip_ik_output(q, success, debug_info, default_q)
+
+    def _manip_ik_output(self, q, success: bool, debug_info: dict, default_q):
+        """convert a manip-format IK result to a full-body configuration"""
         if q is not None and success:
             q = self._from_manip_format(q, default_q)
             self.set_config(q)
 
         return q, success, debug_info
 
+    def get_ik_cache_stats(self) -> Optional[Dict[str, float]]:
+        """hit-rate statistics of the manip_ik cache, or None if caching is disabled"""
+        if self.ik_cache is None:
+            return None
+        return self.ik_cache.get_stats()
+
     def get_ee_pose(self, q=None):
         if q is not None:
             self.set_config(q)
@@ -836,6 +964,14 @@ class HelloStretchKinematics(Robot):
             qi = self.update_head(qi, self.look_at_ee)
             yield qi, ai
 
+    def time_parameterize(
+        self, trajectory, dt: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Turn a list of waypoints, or the output of interpolate / interpolate_arm, into a single
+        timed trajectory respecting the joint velocity and acceleration limits.
+        Returns (times, positions, velocities)."""
+        return self.time_parameterization.parameterize(get_waypoints(trajectory), dt=dt)
+
     def is_colliding(self, other):
         return self.ref.is_colliding(other)
 
@@ -858,12 +994,40 @@ class HelloStretchKinematics(Robot):
         q[HelloStretchIdx.BASE_Y] += dy
         return q
 
+    def create_collision_checker(
+        self, sdf: Optional[SignedDistanceField] = None, **kwargs
+    ) -> SphereCollisionChecker:
+        """Use a sphere/signed distance field collision checker in validate instead of pybullet.
+        Keyword arguments are passed to SphereCollisionChecker."""
+        self.collision_checker = SphereCollisionChecker(
+            self.full_body_urdf_path, self.full_body_joint_map, sdf=sdf, **kwargs
+        )
+        return self.collision_checker
+
+    def validate_batch(self, qs: np.ndarray, distance: float = 0.0) -> np.ndarray:
+        """Check a batch of (N, dof) configurations at once; requires a collision checker.
+        Returns a boolean array which is true for valid configurations."""
+        assert (
+            self.collision_checker is not None
+        ), "batched validation needs create_collision_checker()"
+        qs = np.atleast_2d(qs)
+        valid = qs[:, HelloStretchIdx.LIFT] < 1.0
+        valid[valid] = self.collision_checker.check_batch(qs[valid], distance=distance)
+        return valid
+
     def validate(self, q=None, ignored=[], distance=0.0, verbose=False):
         """
         Check collisions against different obstacles
         q = configuration to test
-        ignored = other objects to NOT check against
+        ignored = other objects to NOT check against; only used by the pybullet backend, the
+            collision checker checks against its whole distance field
         """
+        if self.collision_checker is not None:
+            valid = bool(self.validate_batch(q, distance=distance)[0])
+            if verbose and not valid:
+                print("colliding:", self.collision_checker.colliding_links(q, distance))
+            return valid
+
         self.set_config(q)
         # Check robot height
         if q[HelloStretchIdx.LIFT] >= 1.0:
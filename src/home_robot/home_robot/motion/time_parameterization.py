@@ -0,0 +1,171 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Waypoints closer than this are merged
+TIME_PARAM_EPS = 1e-6
+
+
+class TrapezoidalTimeParameterization(object):
+    """Time-optimal parameterization of a piecewise-linear joint-space path.
+
+    The path through the waypoints is followed exactly. Along each segment the path speed follows
+    a trapezoidal profile, bounded so that no joint exceeds its velocity or acceleration limit;
+    the speed through intermediate waypoints is maximized with a forward/backward pass over the
+    path (TOPP-style), so the robot does not stop at every waypoint. Joints with an infinite limit
+    do not constrain the timing.
+    """
+
+    def __init__(
+        self,
+        max_velocity: np.ndarray,
+        max_acceleration: np.ndarray,
+        corner_time: float = 0.1,
+    ):
+        """
+        max_velocity: (dof,) max absolute velocity of every joint
+        max_acceleration: (dof,) max absolute acceleration of every joint
+        corner_time: time over which the controller smooths a change of direction at a waypoint;
+            speed through corners is limited so that this respects the acceleration limits
+        """
+        self.max_velocity = np.asarray(max_velocity, dtype=np.float64)
+        self.max_acceleration = np.asarray(max_acceleration, dtype=np.float64)
+        assert self.max_velocity.shape == self.max_acceleration.shape
+        assert np.all(self.max_velocity > 0) and np.all(self.max_acceleration > 0)
+        self.corner_time = corner_time
+
+    def _path_limit(self, direction: np.ndarray, joint_limit: np.ndarray) -> float:
+        """largest path rate such that no joint moving along direction exceeds its limit"""
+        with np.errstate(divide="ignore"):
+            return float(np.min(joint_limit / np.abs(direction)))
+
+    def _segment_profiles(
+        self,
+        lengths: np.ndarray,
+        speeds: np.ndarray,
+        vmax: np.ndarray,
+        amax: np.ndarray,
+    ) -> np.ndarray:
+        """(num_segments, 4) trapezoid of each segment: peak speed, accel, cruise, decel times"""
+        v0, v1 = speeds[:-1], speeds[1:]
+        vpeak = np.sqrt((2 * amax * lengths + v0**2 + v1**2) / 2)
+        vpeak = np.maximum(np.minimum(vpeak, vmax), np.maximum(v0, v1))
+        t_acc = (vpeak - v0) / amax
+        t_dec = (vpeak - v1) / amax
+        cruise = (
+            lengths
+            - (vpeak**2 - v0**2) / (2 * amax)
+            - (vpeak**2 - v1**2) / (2 * amax)
+        )
+        t_cruise = np.maximum(cruise, 0) / vpeak
+        return np.stack([vpeak, t_acc, t_cruise, t_dec], axis=1)
+
+    def parameterize(
+        self, waypoints: Sequence[np.ndarray], dt: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """compute times for a list of (dof,) waypoints, starting and ending at rest.
+
+        If dt is given, the trajectory is resampled every dt seconds along the trapezoidal
+        profiles, which lets controllers with cubic interpolation between points track it closely.
+
+        Returns (times, positions, velocities) with shapes (T,), (T, dof) and (T, dof).
+        """
+        qs = np.asarray(waypoints, dtype=np.float64)
+        assert qs.ndim == 2 and qs.shape[1] == self.max_velocity.shape[0]
+
+        # Drop repeated waypoints, which would give segments with no direction
+        keep = np.ones(qs.shape[0], dtype=bool)
+        keep[1:] = np.linalg.norm(np.diff(qs, axis=0), axis=1) > TIME_PARAM_EPS
+        qs = qs[keep]
+        if qs.shape[0] < 2:
+            return np.zeros(1), qs[:1], np.zeros_like(qs[:1])
+
+        # Arc-length parameterization of the path
+        deltas = np.diff(qs, axis=0)
+        lengths = np.linalg.norm(deltas, axis=1)
+        directions = deltas / lengths[:, None]
+        vmax = np.array([self._path_limit(u, self.max_velocity) for u in directions])
+        amax = np.array(
+            [self._path_limit(u, self.max_acceleration) for u in directions]
+        )
+
+        # Max path speed at every waypoint; at rest at both ends
+        speeds = np.zeros(qs.shape[0])
+        for i in range(1, qs.shape[0] - 1):
+            turn = directions[i] - directions[i - 1]
+            corner = self._path_limit(turn, self.max_acceleration * self.corner_time)
+            speeds[i] = min(vmax[i - 1], vmax[i], corner)
+
+        # Forward pass: reachable from the previous waypoint; backward pass: able to stop in time
+        for i in range(len(lengths)):
+            speeds[i + 1] = min(
+                speeds[i + 1], np.sqrt(speeds[i] ** 2 + 2 * amax[i] * lengths[i])
+            )
+        for i in reversed(range(len(lengths))):
+            speeds[i] = min(
+                speeds[i], np.sqrt(speeds[i + 1] ** 2 + 2 * amax[i] * lengths[i])
+            )
+
+        profiles = self._segment_profiles(lengths, speeds, vmax, amax)
+        durations = profiles[:, 1:].sum(axis=1)
+        times = np.concatenate([[0.0], np.cumsum(durations)])
+
+        if dt is None:
+            # Blend directions at corners; the endpoints are at rest anyway
+            tangents = np.concatenate([directions[:1], directions])
+            tangents[1:-1] = (directions[:-1] + directions[1:]) / 2
+            return times, qs, tangents * speeds[:, None]
+
+        # Resample along the trapezoidal profiles
+        sample_times = np.arange(0, times[-1] - TIME_PARAM_EPS, dt)
+        sample_times = np.append(sample_times, times[-1])
+        segment = np.clip(
+            np.searchsorted(times, sample_times, side="right") - 1, 0, None
+        )
+        segment = np.minimum(segment, len(lengths) - 1)
+        tau = sample_times - times[segment]
+        v0 = speeds[segment]
+        amax_s = amax[segment]
+        vpeak, t_acc, t_cruise, _ = profiles[segment].T
+
+        t1 = np.minimum(tau, t_acc)
+        t2 = np.clip(tau - t_acc, 0, t_cruise)
+        t3 = np.clip(tau - t_acc - t_cruise, 0, None)
+        s = (
+            v0 * t1
+            + amax_s * t1**2 / 2
+            + vpeak * t2
+            + vpeak * t3
+            - amax_s * t3**2 / 2
+        )
+        s = np.minimum(s, lengths[segment])
+        sdot = np.where(
+            tau < t_acc,
+            v0 + amax_s * tau,
+            np.where(tau < t_acc + t_cruise, vpeak, vpeak - amax_s * t3),
+        )
+        sdot = np.maximum(sdot, 0)
+        positions = qs[segment] + directions[segment] * s[:, None]
+        velocities = directions[segment] * sdot[:, None]
+        velocities[-1] = 0
+        positions[-1] = qs[-1]
+        return sample_times, positions, velocities
+
+    def get_duration(self, waypoints: Sequence[np.ndarray]) -> float:
+        """returns total time needed to execute a list of waypoints"""
+        times, _, _ = self.parameterize(waypoints)
+        return float(times[-1])
+
+
+def get_waypoints(trajectory: Iterable) -> List[np.ndarray]:
+    """collect waypoints from a list of configurations, or from the (q, action) tuples yielded by
+    robot interpolation functions. Configurations are copied, since interpolation functions may
+    update them in place."""
+    return [
+        np.array(q[0] if isinstance(q, tuple) else q, dtype=np.float64)
+        for q in trajectory
+    ]
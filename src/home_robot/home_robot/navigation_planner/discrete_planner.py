@@ -5,7 +5,6 @@
 import math
 import os
 import shutil
-import time
 from typing import List, Tuple
 
 import cv2
@@ -18,7 +17,9 @@ from home_robot.core.interfaces import (
     ContinuousNavigationAction,
     DiscreteNavigationAction,
 )
+from home_robot.utils.frame_sink import get_frame_sink
 from home_robot.utils.geometry import xyt_global_to_base
+from home_robot.utils.profiler import profiler
 
 from .fmm_planner import FMMPlanner
 
@@ -119,6 +120,8 @@ class DiscretePlanner:
         self.map_update_frequency = map_update_frequency
 
     def reset(self):
+        if self.print_images and self.vis_dir is not None:
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = self.default_vis_dir
         self.collision_map = np.zeros(self.map_shape)
         self.visited_map = np.zeros(self.map_shape)
@@ -140,6 +143,9 @@ class DiscretePlanner:
         )
 
     def set_vis_dir(self, scene_id: str, episode_id: str):
+        if self.print_images and self.vis_dir is not None:
+            # Finish the videos of the previous episode
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = os.path.join(self.default_vis_dir, f"{scene_id}_{episode_id}")
         shutil.rmtree(self.vis_dir, ignore_errors=True)
         os.makedirs(self.vis_dir, exist_ok=True)
@@ -147,6 +153,7 @@ class DiscretePlanner:
     def disable_print_images(self):
         self.print_images = False
 
+    @profiler.profile("planning")
     def plan(
         self,
         obstacle_map: np.ndarray,
@@ -252,8 +259,6 @@ class DiscretePlanner:
                 dist_to_short_term_goal * self.map_resolution * CM_TO_METERS,
             )
             print("Replan:", replan)
-        # t1 = time.time()
-        # print(f"[Planning] get_short_term_goal() time: {t1 - t0}")
 
         # We were not able to find a path to the high-level goal
         if replan and not stop:
@@ -445,6 +450,7 @@ class DiscretePlanner:
 
         return action
 
+    @profiler.profile("fmm")
     def _get_short_term_goal(
         self,
         obstacle_map: np.ndarray,
@@ -473,10 +479,7 @@ class DiscretePlanner:
             stop: binary flag to indicate we've reached the goal
         """
         gx1, gx2, gy1, gy2 = planning_window
-        (x1, y1,) = (
-            0,
-            0,
-        )
+        x1, y1 = 0, 0
         x2, y2 = obstacle_map.shape
         obstacles = obstacle_map[x1:x2, y1:y2]
 
@@ -619,6 +622,7 @@ class DiscretePlanner:
         )
         return closest_goal_map, closest_goal_pt
 
+    @profiler.profile("collision_check")
     def _check_collision(self):
         """Check whether we had a collision and update the collision map."""
         x1, y1, t1 = self.last_pose
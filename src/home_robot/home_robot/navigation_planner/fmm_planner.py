@@ -12,6 +12,8 @@ import skfmm
 import skimage
 from numpy import ma
 
+from home_robot.utils.frame_sink import get_frame_sink
+
 
 class FMMPlanner:
     """
@@ -151,9 +153,9 @@ class FMMPlanner:
                 cv2.waitKey(1)
 
             if self.print_images and timestep is not None:
-                cv2.imwrite(
+                get_frame_sink().add_frame(
                     os.path.join(self.vis_dir, f"planner_snapshot_{timestep}.png"),
-                    (dist_vis * 255).astype(int),
+                    (dist_vis * 255).astype(np.uint8),
                 )
         return dd
 
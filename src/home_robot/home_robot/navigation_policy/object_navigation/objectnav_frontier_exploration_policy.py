@@ -105,7 +105,7 @@ class ObjectNavFrontierExplorationPolicy(nn.Module):
                     map_features, object_category, start_recep_category
                 )
             # there is at least one instance in the batch where the goal is receptacle
-            elif nav_to_recep.sum() > 0:
+            if nav_to_recep.sum() > 0:
                 goal_map_r, found_goal_r = self.reach_single_category(
                     map_features, end_recep_category
                 )
@@ -115,13 +115,11 @@ class ObjectNavFrontierExplorationPolicy(nn.Module):
             elif nav_to_recep.sum() == map_features.shape[0]:
                 return goal_map_r, found_goal_r
             else:
-                goal_map = (
-                    goal_map_o * nav_to_recep.view(-1, 1, 1)
-                    + (1 - nav_to_recep).view(-1, 1, 1) * goal_map_o
-                )
-                found_goal = (
-                    found_goal_r * nav_to_recep + (1 - nav_to_recep) * found_goal_r
+                nav_to_recep = nav_to_recep.bool().to(map_features.device)
+                goal_map = torch.where(
+                    nav_to_recep.view(-1, 1, 1), goal_map_r, goal_map_o
                 )
+                found_goal = torch.where(nav_to_recep, found_goal_r, found_goal_o)
                 return goal_map, found_goal
         else:
             # Here, the goal is specified by a single object or receptacle to navigate to with no additional constraints (eg. the given object can be on any receptacle)
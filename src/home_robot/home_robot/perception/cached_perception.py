@@ -0,0 +1,228 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import functools
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from home_robot.core.abstract_perception import PerceptionModule
+from home_robot.core.interfaces import Observations
+from home_robot.perception.detection.deferred_visualization import (
+    DeferredVisualization,
+)
+
+# Outputs of the wrapped model which are stored in the cache
+CACHED_TASK_OBSERVATIONS = ["instance_map", "instance_classes", "instance_scores"]
+
+
+def hash_array(array: Optional[np.ndarray]) -> str:
+    """hash of the content, shape and dtype of an array"""
+    if array is None:
+        return "none"
+    array = np.ascontiguousarray(array)
+    h = hashlib.sha1(f"{array.dtype.str}{array.shape}".encode("utf-8"))
+    h.update(array.data)
+    return h.hexdigest()
+
+
+def get_model_id(name: str, config: str, files: Sequence[Optional[str]]) -> str:
+    """Identifier of a model for the cache: its name, plus a hash of its resolved config and
+    of the size and modification time of its files. Replacing a checkpoint or changing a
+    config value changes the identifier, without reading large checkpoints.
+
+    Arguments:
+        name: name of the model
+        config: resolved config of the model, without machine-specific values such as
+         file paths or devices
+        files: paths of the files the model is loaded from; None entries are skipped
+    """
+    h = hashlib.sha1(config.encode("utf-8"))
+    for path in files:
+        if path is not None:
+            stat = os.stat(path)
+            h.update(f"\n{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return f"{name}:{h.hexdigest()}"
+
+
+def draw_instances(rgb: np.ndarray, instance_map: np.ndarray) -> np.ndarray:
+    """rgb image with instances of an instance map overlaid in random colors, to visualize
+    predictions loaded from the cache"""
+    instance_map = np.asarray(instance_map).astype(np.int64)
+    num_instances = int(instance_map.max()) + 1
+    colors = np.random.RandomState(0).randint(0, 255, (max(num_instances, 1), 3))
+    image = np.asarray(rgb).astype(np.float32)
+    covered = instance_map >= 0
+    image[covered] = 0.5 * image[covered] + 0.5 * colors[instance_map[covered]]
+    return image.astype(np.uint8)
+
+
+class CachedPerception(PerceptionModule):
+    """Disk cache of the predictions of a segmentation model, for offline replay.
+
+    Predictions are keyed on the content of the frame, the model and its vocabulary, so that
+    running again over recorded observations (e.g. to rebuild a map, or to re-evaluate
+    episodes) never runs the model on a frame it has already seen. Each entry is a compressed
+    .npz file, in subdirectories named after the first characters of its key to keep
+    directories small.
+
+    Visualizations are not cached: on a cache hit obs.task_observations["semantic_frame"] is
+    drawn from the cached instance map when read.
+
+    Other attributes and methods (e.g. reset_vocab or num_sem_categories) are those of the
+    wrapped model.
+    """
+
+    def __init__(
+        self,
+        model: PerceptionModule,
+        cache_dir: str,
+        model_id: Optional[str] = None,
+    ):
+        """
+        model: segmentation model; sets obs.semantic and obs.task_observations["instance_map"],
+         ["instance_classes"] and ["instance_scores"]
+        cache_dir: directory to store predictions in; can be shared between models
+        model_id: identifies the weights and config of the model; predictions of different
+         models never mix. Defaults to model.model_id if it exists, else the model class name
+        """
+        self.model = model
+        self.cache_dir = Path(cache_dir)
+        if model_id is None:
+            model_id = getattr(model, "model_id", type(model).__name__)
+        self.model_id = model_id
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not found on the wrapper
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def get_vocabulary(self) -> Optional[Tuple[str, ...]]:
+        """current vocabulary of the model, part of the cache key"""
+        metadata = getattr(self.model, "metadata", None)
+        classes = getattr(metadata, "thing_classes", None)
+        return None if classes is None else tuple(classes)
+
+    def get_stats(self) -> Dict[str, float]:
+        """cache hits and misses since creation"""
+        num_frames = self.num_hits + self.num_misses
+        return {
+            "hits": self.num_hits,
+            "misses": self.num_misses,
+            "hit_ratio": self.num_hits / max(num_frames, 1),
+        }
+
+    def get_key(self, obs: Observations, **kwargs) -> str:
+        """Cache key of the predictions for obs.
+
+        Arguments:
+            obs: observations; only obs.rgb is part of the key, plus obs.depth when predictions
+             are filtered with a depth threshold
+            kwargs: arguments of predict, e.g. depth_threshold
+        """
+        kwargs.pop("draw_instance_predictions", None)
+        depth_hash = (
+            hash_array(obs.depth)
+            if kwargs.get("depth_threshold") is not None
+            else "none"
+        )
+        fields = [
+            self.model_id,
+            repr(self.get_vocabulary()),
+            repr(sorted(kwargs.items())),
+            hash_array(obs.rgb),
+            depth_hash,
+        ]
+        return hashlib.sha1("\n".join(fields).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    def _load(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return {k: data[k] for k in data.files}
+        except (OSError, ValueError, KeyError):
+            # Partially written or corrupted entry; predict again
+            return None
+
+    def _save(self, key: str, obs: Observations):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {"semantic": obs.semantic}
+        for k in CACHED_TASK_OBSERVATIONS:
+            arrays[k] = obs.task_observations[k]
+        # Write then rename, so concurrent readers never see a partial file
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def _restore(
+        self,
+        obs: Observations,
+        entry: Dict[str, np.ndarray],
+        draw_instance_predictions: bool,
+    ) -> Observations:
+        if obs.task_observations is None:
+            obs.task_observations = {}
+        obs.semantic = entry["semantic"]
+        for k in CACHED_TASK_OBSERVATIONS:
+            obs.task_observations[k] = entry[k]
+        if draw_instance_predictions:
+            obs.task_observations["semantic_frame"] = DeferredVisualization(
+                functools.partial(draw_instances, obs.rgb, entry["instance_map"])
+            )
+        else:
+            obs.task_observations["semantic_frame"] = None
+        return obs
+
+    def predict(self, obs: Observations, **kwargs) -> Observations:
+        """Same as the predict method of the wrapped model, which only runs on cache misses.
+
+        Arguments:
+            obs: observations
+            kwargs: arguments of the predict method of the wrapped model
+        """
+        return self.predict_batch([obs], **kwargs)[0]
+
+    def predict_batch(
+        self, obs_list: Sequence[Observations], **kwargs
+    ) -> List[Observations]:
+        """Same as predict, for a list of observations; cache misses are predicted together
+        with the predict_batch method of the wrapped model if it has one."""
+        draw_instance_predictions = kwargs.get("draw_instance_predictions", True)
+        keys = [self.get_key(obs, **kwargs) for obs in obs_list]
+        entries = [self._load(key) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        self.num_hits += len(obs_list) - len(missing)
+        self.num_misses += len(missing)
+
+        results = list(obs_list)
+        if len(missing) > 0:
+            if hasattr(self.model, "predict_batch"):
+                predicted = self.model.predict_batch(
+                    [obs_list[i] for i in missing], **kwargs
+                )
+            else:
+                predicted = [self.model.predict(obs_list[i], **kwargs) for i in missing]
+            for i, obs in zip(missing, predicted):
+                self._save(keys[i], obs)
+                results[i] = obs
+
+        for i, entry in enumerate(entries):
+            if entry is not None:
+                results[i] = self._restore(
+                    obs_list[i], entry, draw_instance_predictions
+                )
+        return results
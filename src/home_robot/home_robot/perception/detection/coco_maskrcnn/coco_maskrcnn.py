@@ -8,9 +8,11 @@
 # https://github.com/facebookresearch/detectron2/blob/master/demo/predictor.py
 
 import argparse
+import functools
 import time
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -19,26 +21,74 @@ from detectron2.config import get_cfg
 from detectron2.data.catalog import MetadataCatalog
 from detectron2.modeling import build_model
 from detectron2.utils.logger import setup_logger
-from detectron2.utils.visualizer import ColorMode, VisImage, Visualizer
+from detectron2.utils.visualizer import ColorMode, Visualizer
+
+from home_robot.perception.detection.deferred_visualization import (
+    DeferredVisualization,
+    get_visualization_executor,
+)
+from home_robot.perception.detection.exported_backbone import (
+    export_backbone,
+    load_exported_backbone,
+)
+from home_robot.perception.detection.utils import (
+    add_masks_to_one_hot,
+    filter_depth_batch,
+    get_category_lookup,
+    get_model_inputs,
+    lookup_categories,
+)
 
 from .coco_categories import coco_categories, coco_categories_mapping
 
 
 class COCOMaskRCNN:
-    def __init__(self, sem_pred_prob_thr: float, sem_gpu_id: int, visualize: bool):
+    def __init__(
+        self,
+        sem_pred_prob_thr: float,
+        sem_gpu_id: int,
+        visualize: bool,
+        visualization_workers: int = 0,
+        backbone_file: Optional[str] = None,
+    ):
         """
         Arguments:
             sem_pred_prob_thr: prediction threshold
             sem_gpu_id: prediction GPU id (-1 for CPU)
             visualize: if True, visualize predictions
+            visualization_workers: if > 0, predictions are visualized on this many
+             background threads; else they are visualized when first read
+            backbone_file: backbone exported with export_backbone, to run instead of the
+             eager one
         """
         self.segmentation_model = ImageSegmentation(sem_pred_prob_thr, sem_gpu_id)
+        if backbone_file is not None:
+            load_exported_backbone(self._model, backbone_file)
         self.visualize = visualize
+        self.visualization_executor = (
+            get_visualization_executor(visualization_workers)
+            if visualization_workers > 0
+            else None
+        )
         self.num_sem_categories = len(coco_categories)
+        # Detectron2 COCO class id -> semantic category, -1 for unused classes
+        self.category_lookup = get_category_lookup(coco_categories_mapping)
+
+    @property
+    def _model(self):
+        return self.segmentation_model.demo.predictor.model
+
+    def export_backbone(self, path: str, image: np.ndarray, quantize: bool = False):
+        """Export the backbone for (H, W, 3) images of the size of image, to be loaded
+        with backbone_file"""
+        inputs = self.segmentation_model.demo.predictor.preprocess(image[None])
+        with torch.no_grad():
+            sample_input = self._model.preprocess_image(inputs).tensor
+        export_backbone(self._model, sample_input, path, quantize=quantize)
 
     def get_prediction(
         self, images: np.ndarray, depths: Optional[np.ndarray] = None
-    ) -> Tuple[np.ndarray, np.ndarray]:
+    ) -> Tuple[np.ndarray, Union[np.ndarray, List[DeferredVisualization]]]:
         """
         Arguments:
             images: images of shape (batch_size, H, W, 3) (in BGR order)
@@ -47,14 +97,14 @@ class COCOMaskRCNN:
         Returns:
             one_hot_predictions: one hot segmentation predictions of shape
              (batch_size, H, W, num_sem_categories)
-            visualizations: prediction visualization images
-             shape (batch_size, H, W, 3) if self.visualize=True, else
-             original images
+            visualizations: list of batch_size deferred prediction visualizations
+             of shape (H, W, 3), only drawn when read, if self.visualize=True, else
+             original images of shape (batch_size, H, W, 3)
         """
         batch_size, height, width, _ = images.shape
 
         predictions, visualizations = self.segmentation_model.get_predictions(
-            images, visualize=self.visualize
+            images, visualize=self.visualize, executor=self.visualization_executor
         )
         one_hot_predictions = np.zeros(
             (batch_size, height, width, self.num_sem_categories)
@@ -63,36 +113,26 @@ class COCOMaskRCNN:
         # t0 = time.time()
 
         for i in range(batch_size):
-            for j, class_idx in enumerate(
-                predictions[i]["instances"].pred_classes.cpu().numpy()
-            ):
-                if class_idx in list(coco_categories_mapping.keys()):
-                    idx = coco_categories_mapping[class_idx]
-                    obj_mask = predictions[i]["instances"].pred_masks[j] * 1.0
-                    obj_mask = obj_mask.cpu().numpy()
-
-                    if depths is not None:
-                        depth = depths[i]
-                        md = np.median(depth[obj_mask == 1])
-                        if md == 0:
-                            filter_mask = np.ones_like(obj_mask, dtype=bool)
-                        else:
-                            # Restrict objects to 1m depth
-                            filter_mask = (depth >= md + 50) | (depth <= md - 50)
-                        # print(
-                        #     f"Median object depth: {md.item()}, filtering out "
-                        #     f"{np.count_nonzero(filter_mask)} pixels"
-                        # )
-                        obj_mask[filter_mask] = 0.0
-
-                    one_hot_predictions[i, :, :, idx] += obj_mask
+            instances = predictions[i]["instances"]
+            category_idcs = lookup_categories(
+                self.category_lookup, instances.pred_classes.cpu().numpy()
+            )
+            keep = category_idcs >= 0
+            if not keep.any():
+                continue
+            obj_masks = instances.pred_masks[torch.from_numpy(keep)].cpu().numpy()
+            category_idcs = category_idcs[keep]
+
+            if depths is not None:
+                # Restrict objects to 1m depth
+                obj_masks = filter_depth_batch(obj_masks, depths[i], 50)
+
+            add_masks_to_one_hot(one_hot_predictions[i], obj_masks, category_idcs)
 
         # t1 = time.time()
         # print(f"[Obs preprocessing] Segmentation depth filtering time: {t1 - t0:.2f}")
 
-        if self.visualize:
-            visualizations = np.stack([vis.get_image() for vis in visualizations])
-        else:
+        if not self.visualize:
             # Convert BGR to RGB for visualization
             visualizations = images[:, :, :, ::-1]
 
@@ -124,8 +164,8 @@ class ImageSegmentation:
         cfg = setup_cfg(args)
         self.demo = VisualizationDemo(cfg)
 
-    def get_predictions(self, images, visualize=False):
-        return self.demo.run_on_images(images, visualize=visualize)
+    def get_predictions(self, images, visualize=False, executor=None):
+        return self.demo.run_on_images(images, visualize=visualize, executor=executor)
 
 
 def setup_cfg(args):
@@ -189,12 +229,17 @@ class VisualizationDemo:
         self.predictor = BatchPredictor(cfg)
 
     def run_on_images(
-        self, images: np.ndarray, visualize=False
-    ) -> Tuple[List[dict], List[VisImage]]:
+        self,
+        images: np.ndarray,
+        visualize=False,
+        executor: Optional[Executor] = None,
+    ) -> Tuple[List[dict], List[DeferredVisualization]]:
         """
         Arguments:
             images: images of shape (batch_size, H, W, 3) (in BGR order)
             visualize: if True, return prediction visualization
+            executor: if given, visualizations are drawn on it in the background;
+             else they are drawn when first read
 
         Returns:
             predictions: a list of predictions for all images
@@ -214,33 +259,59 @@ class VisualizationDemo:
 
         if visualize:
             for i in range(batch_size):
-                pred = predictions[i]
-                image = images[i]
-                visualizer = Visualizer(
-                    image, self.metadata, instance_mode=self.instance_mode
+                # Copy what the visualization needs now, as inputs may be reused
+                render = self._get_visualization_renderer(
+                    images[i].copy(), predictions[i]
                 )
-                if "panoptic_seg" in pred:
-                    panoptic_seg, segments_info = pred["panoptic_seg"]
-                    vis = visualizer.draw_panoptic_seg_predictions(
-                        panoptic_seg.to(self.cpu_device), segments_info
-                    )
-                else:
-                    if "sem_seg" in pred:
-                        vis = visualizer.draw_sem_seg(
-                            pred["sem_seg"].argmax(dim=0).to(self.cpu_device)
-                        )
-                    if "instances" in pred:
-                        instances = pred["instances"].to(self.cpu_device)
-                        vis = visualizer.draw_instance_predictions(
-                            predictions=instances
-                        )
-                visualizations.append(vis)
+                visualizations.append(DeferredVisualization(render, executor))
 
         # t2 = time.time()
         # print(f"[Obs preprocessing] Segmentation visualization time: {t2 - t1:.2f}")
 
         return predictions, visualizations
 
+    def _get_visualization_renderer(self, image: np.ndarray, pred: dict):
+        """function drawing the predictions for an RGB image, on CPU copies of them"""
+        panoptic_seg, segments_info, sem_seg, instances = None, None, None, None
+        if "panoptic_seg" in pred:
+            panoptic_seg, segments_info = pred["panoptic_seg"]
+            panoptic_seg = panoptic_seg.to(self.cpu_device)
+        if "sem_seg" in pred:
+            sem_seg = pred["sem_seg"].argmax(dim=0).to(self.cpu_device)
+        if "instances" in pred:
+            instances = pred["instances"].to(self.cpu_device)
+        return functools.partial(
+            _draw_predictions,
+            image,
+            self.metadata,
+            self.instance_mode,
+            panoptic_seg,
+            segments_info,
+            sem_seg,
+            instances,
+        )
+
+
+def _draw_predictions(
+    image: np.ndarray,
+    metadata,
+    instance_mode: ColorMode,
+    panoptic_seg: Optional[torch.Tensor],
+    segments_info: Optional[list],
+    sem_seg: Optional[torch.Tensor],
+    instances,
+) -> np.ndarray:
+    """visualization of the predictions for an RGB image"""
+    visualizer = Visualizer(image, metadata, instance_mode=instance_mode)
+    if panoptic_seg is not None:
+        vis = visualizer.draw_panoptic_seg_predictions(panoptic_seg, segments_info)
+    else:
+        if sem_seg is not None:
+            vis = visualizer.draw_sem_seg(sem_seg)
+        if instances is not None:
+            vis = visualizer.draw_instance_predictions(predictions=instances)
+    return vis.get_image()
+
 
 class BatchPredictor:
     def __init__(self, cfg):
@@ -263,16 +334,11 @@ class BatchPredictor:
         Returns:
             predictions: a list of predictions for all images
         """
-        inputs = []
-        for original_image in images:
-            if self.input_format == "RGB":
-                original_image = original_image[:, :, ::-1]
-            height, width = original_image.shape[:2]
-            image = original_image
-            image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
-            instance = {"image": image, "height": height, "width": width}
-            inputs.append(instance)
-
+        inputs = self.preprocess(images)
         with torch.no_grad():
             predictions = self.model(inputs)
             return predictions
+
+    def preprocess(self, images: np.ndarray) -> List[dict]:
+        """model inputs for images of shape (batch_size, H, W, 3) (in BGR order)"""
+        return get_model_inputs(images, self.input_format)
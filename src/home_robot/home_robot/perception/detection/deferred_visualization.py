@@ -0,0 +1,113 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_visualization_executor(num_workers: int) -> ThreadPoolExecutor:
+    """thread pool shared by all models which render visualizations in the background;
+    created on first use with num_workers threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=num_workers, thread_name_prefix="visualization"
+            )
+    return _executor
+
+
+class DeferredVisualization:
+    """Visualization image which is rendered off the critical path of perception.
+
+    Without an executor the image is rendered the first time it is read, so it costs nothing
+    if no consumer looks at it; with an executor rendering starts right away on a background
+    thread and reading it waits for the result. Reading it is done with get() or
+    get_visualization(), but it also behaves as the rendered (H, W, 3) array for indexing and
+    numpy functions.
+
+    A visualization which is not rendered yet is pickled as its renderer (e.g. to send infos
+    to vectorized environments), so that it is only rendered if the receiver reads it.
+    """
+
+    def __init__(
+        self, render: Callable[[], np.ndarray], executor: Optional[Executor] = None
+    ):
+        """
+        render: returns the visualization image; should not depend on data modified
+         afterwards, and should be picklable (e.g. a functools.partial of a module-level
+         function on CPU predictions) for the visualization to be pickled
+        executor: if given, the visualization is rendered on it right away
+        """
+        self._render = render
+        self._future = None if executor is None else executor.submit(render)
+        self._image: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> np.ndarray:
+        """returns the visualization image, rendering it if needed"""
+        with self._lock:
+            if self._image is None:
+                if self._future is not None:
+                    self._image = self._future.result()
+                else:
+                    self._image = self._render()
+                self._render = None
+                self._future = None
+        return self._image
+
+    @property
+    def shape(self):
+        return self.get().shape
+
+    def __array__(self, dtype=None, copy=None):
+        image = self.get()
+        if dtype is not None and image.dtype != np.dtype(dtype):
+            if copy is False:
+                raise ValueError(
+                    f"cannot convert visualization of dtype {image.dtype} to {dtype} "
+                    "without a copy"
+                )
+            return image.astype(dtype)
+        return image.copy() if copy else image
+
+    def __reduce__(self):
+        # The lock and future cannot be pickled: pickle the image if it is rendered, else
+        # the renderer, without waiting for a background rendering
+        with self._lock:
+            if self._future is not None and self._future.done():
+                self._image = self._future.result()
+                self._render = None
+                self._future = None
+            if self._image is not None:
+                return _from_image, (self._image,)
+            return DeferredVisualization, (self._render,)
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __setitem__(self, key, value):
+        self.get()[key] = value
+
+
+def _from_image(image: np.ndarray) -> DeferredVisualization:
+    """visualization which is already rendered"""
+    visualization = DeferredVisualization(None)
+    visualization._image = image
+    return visualization
+
+
+def get_visualization(
+    frame: Union[np.ndarray, DeferredVisualization, None]
+) -> Optional[np.ndarray]:
+    """returns a visualization image, rendering it first if it was deferred"""
+    if isinstance(frame, DeferredVisualization):
+        return frame.get()
+    return frame
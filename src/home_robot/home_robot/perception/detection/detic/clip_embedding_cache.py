@@ -0,0 +1,82 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import hashlib
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+
+DEFAULT_CLIP_CACHE_DIR = Path(
+    os.environ.get(
+        "HOME_ROBOT_CLIP_CACHE",
+        Path.home() / ".cache" / "home_robot" / "clip_text_embeddings",
+    )
+)
+
+
+class ClipEmbeddingCache:
+    """Memory and disk cache of text embeddings, keyed on (text, model id).
+
+    Text embeddings only depend on the prompt and the text encoder weights, so they can be
+    shared between vocabularies, processes and runs; the text encoder itself is only needed
+    for prompts which have never been encoded.
+    """
+
+    def __init__(
+        self, model_id: str, cache_dir: Optional[Path] = DEFAULT_CLIP_CACHE_DIR
+    ):
+        """
+        model_id: identifies the text encoder weights; embeddings of different models never mix
+        cache_dir: directory to store embeddings in, None to only cache in memory
+        """
+        self.model_id = model_id
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self._embeddings: Dict[str, torch.Tensor] = {}
+
+    def _path(self, text: str) -> Path:
+        key = hashlib.sha1(f"{self.model_id}\n{text}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, text: str) -> Optional[torch.Tensor]:
+        """returns the cached (D,) embedding of text, or None"""
+        if text in self._embeddings:
+            return self._embeddings[text]
+        if self.cache_dir is not None and self._path(text).exists():
+            try:
+                embedding = torch.from_numpy(np.load(self._path(text)))
+            except (OSError, ValueError):
+                # Partially written or corrupted entry; encode it again
+                return None
+            self._embeddings[text] = embedding
+            return embedding
+        return None
+
+    def put(self, text: str, embedding: torch.Tensor):
+        """add the (D,) embedding of text to the cache"""
+        embedding = embedding.detach().cpu()
+        self._embeddings[text] = embedding
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so concurrent readers never see a partial file
+            path = self._path(text)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, embedding.numpy())
+            os.replace(tmp_path, path)
+
+    def encode(
+        self, texts: List[str], encoder: Callable[[List[str]], torch.Tensor]
+    ) -> torch.Tensor:
+        """(N, D) embeddings of texts; encoder is only called on texts missing from the cache,
+        and should return their (M, D) embeddings"""
+        missing = [text for text in dict.fromkeys(texts) if self.get(text) is None]
+        if len(missing) > 0:
+            with torch.no_grad():
+                embeddings = encoder(missing)
+            for text, embedding in zip(missing, embeddings):
+                self.put(text, embedding)
+        return torch.stack([self.get(text) for text in texts])
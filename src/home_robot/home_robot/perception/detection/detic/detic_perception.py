@@ -5,10 +5,13 @@
 
 
 import argparse
+import functools
+import hashlib
 import pathlib
 import sys
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -20,6 +23,19 @@ from detectron2.utils.visualizer import ColorMode, Visualizer
 
 from home_robot.core.abstract_perception import PerceptionModule
 from home_robot.core.interfaces import Observations
+from home_robot.perception.cached_perception import get_model_id
+from home_robot.perception.detection.deferred_visualization import (
+    DeferredVisualization,
+    get_visualization_executor,
+)
+from home_robot.perception.detection.detic.clip_embedding_cache import (
+    ClipEmbeddingCache,
+)
+from home_robot.perception.detection.exported_backbone import (
+    export_backbone,
+    load_exported_backbone,
+)
+from home_robot.perception.detection.utils import filter_depth_batch, overlay_masks
 
 sys.path.insert(
     0, str(Path(__file__).resolve().parent / "Detic/third_party/CenterNet2/")
@@ -55,51 +71,60 @@ BUILDIN_METADATA_PATH = {
 }
 
 
-def get_clip_embeddings(vocabulary, prompt="a "):
-    text_encoder = build_text_encoder(pretrain=True)
-    text_encoder.eval()
-    texts = [prompt + x for x in vocabulary]
-    emb = text_encoder(texts).detach().permute(1, 0).contiguous().cpu()
-    return emb
+# Text encoder used for custom vocabularies; also the key of cached text embeddings
+DETIC_TEXT_ENCODER_ID = "detic-clip-ViT-B/32"
 
+_text_encoder = None
+_clip_embedding_cache = None
 
-def overlay_masks(
-    masks: np.ndarray, class_idcs: np.ndarray, shape: Tuple[int, int]
-) -> np.ndarray:
-    """Overlays the masks of objects
-    Determines the order of masks based on mask size
-    """
-    mask_sizes = [np.sum(mask) for mask in masks]
-    sorted_mask_idcs = np.argsort(mask_sizes)
 
-    semantic_mask = np.zeros(shape)
-    instance_mask = -np.ones(shape)
-    for i_mask in sorted_mask_idcs[::-1]:  # largest to smallest
-        semantic_mask[masks[i_mask].astype(bool)] = class_idcs[i_mask]
-        instance_mask[masks[i_mask].astype(bool)] = i_mask
+def get_text_encoder():
+    """Load the CLIP text encoder once per process"""
+    global _text_encoder
+    if _text_encoder is None:
+        _text_encoder = build_text_encoder(pretrain=True)
+        _text_encoder.eval()
+    return _text_encoder
+
 
-    return semantic_mask, instance_mask
+def get_clip_embedding_cache() -> ClipEmbeddingCache:
+    global _clip_embedding_cache
+    if _clip_embedding_cache is None:
+        _clip_embedding_cache = ClipEmbeddingCache(DETIC_TEXT_ENCODER_ID)
+    return _clip_embedding_cache
 
 
-def filter_depth(
-    mask: np.ndarray, depth: np.ndarray, depth_threshold: Optional[float] = None
+def get_clip_embeddings(vocabulary, prompt="a "):
+    """(D, C) text embeddings of a vocabulary; only prompts missing from the embedding
+    cache go through the text encoder"""
+    texts = [prompt + x for x in vocabulary]
+    emb = get_clip_embedding_cache().encode(
+        texts, lambda missing: get_text_encoder()(missing)
+    )
+    return emb.permute(1, 0).contiguous()
+
+
+def _draw_instance_predictions(
+    image: np.ndarray, metadata, instance_mode: ColorMode, instances
 ) -> np.ndarray:
-    md = np.median(depth[mask == 1])  # median depth
-    if md == 0:
-        # Remove mask if more than half of points has invalid depth
-        filter_mask = np.ones_like(mask, dtype=bool)
-    elif depth_threshold is not None:
-        # Restrict objects to 1m depth
-        filter_mask = (depth >= md + depth_threshold) | (depth <= md - depth_threshold)
-    else:
-        filter_mask = np.zeros_like(mask, dtype=bool)
-    mask_out = mask.copy()
-    mask_out[filter_mask] = 0.0
+    """visualization of instances over a BGR image"""
+    visualizer = Visualizer(image[:, :, ::-1], metadata, instance_mode=instance_mode)
+    return visualizer.draw_instance_predictions(predictions=instances).get_image()
+
 
-    return mask_out
+def get_vocab_metadata(vocabulary: Tuple[str, ...]):
+    """Metadata of a custom vocabulary, created once and reused when switching back to it"""
+    key = hashlib.sha1("\n".join(vocabulary).encode("utf-8")).hexdigest()[:16]
+    metadata = MetadataCatalog.get(f"__detic_vocab_{key}")
+    if not hasattr(metadata, "thing_classes"):
+        metadata.thing_classes = list(vocabulary)
+    return metadata
 
 
 class DeticPerception(PerceptionModule):
+    # Max number of vocabulary classifiers kept for fast switching
+    max_cached_vocabs = 16
+
     def __init__(
         self,
         config_file=None,
@@ -108,6 +133,8 @@ class DeticPerception(PerceptionModule):
         checkpoint_file=None,
         sem_gpu_id=0,
         verbose: bool = False,
+        visualization_workers: int = 0,
+        backbone_file: Optional[str] = None,
     ):
         """Load trained Detic model for inference.
 
@@ -120,8 +147,17 @@ class DeticPerception(PerceptionModule):
             checkpoint_file: path to model checkpoint
             sem_gpu_id: GPU ID to load the model on, -1 for CPU
             verbose: whether to print out debug information
+            visualization_workers: if > 0, instance predictions are drawn on this many
+             background threads; else they are drawn when the visualization is first read
+            backbone_file: backbone exported with export_backbone, to run instead of the
+             eager one
         """
         self.verbose = verbose
+        self.visualization_executor = (
+            get_visualization_executor(visualization_workers)
+            if visualization_workers > 0
+            else None
+        )
         if config_file is None:
             config_file = str(
                 Path(__file__).resolve().parent
@@ -155,6 +191,14 @@ class DeticPerception(PerceptionModule):
         string_args = string_args.split()
         args = get_parser().parse_args(string_args)
         cfg = setup_cfg(args, verbose=verbose)
+        # Identifies the predictions of this model, e.g. in a CachedPerception
+        id_cfg = cfg.clone()
+        id_cfg.defrost()
+        id_cfg.MODEL.WEIGHTS = ""
+        id_cfg.MODEL.DEVICE = ""
+        self.model_id = get_model_id(
+            "detic", id_cfg.dump(), [checkpoint_file, backbone_file]
+        )
 
         assert vocabulary in ["coco", "custom"]
         if args.vocabulary == "custom":
@@ -194,24 +238,56 @@ class DeticPerception(PerceptionModule):
         if type(classifier) == pathlib.PosixPath:
             classifier = str(classifier)
         reset_cls_test(self.predictor.model, classifier, num_classes)
+        if backbone_file is not None:
+            load_exported_backbone(self.predictor.model, backbone_file)
+
+        # Classifier weights of recent custom vocabularies, for switching between them
+        self._vocab_classifiers: "OrderedDict[Tuple[str, ...], Tuple]" = OrderedDict()
+
+    def register_vocab(self, new_vocab: List[str]):
+        """Build the classifier of a custom vocabulary ahead of time, so that switching to it
+        with reset_vocab only swaps a tensor. The current vocabulary stays active.
+        """
+        vocab = tuple(new_vocab)
+        if vocab in self._vocab_classifiers:
+            self._vocab_classifiers.move_to_end(vocab)
+            return
+        model = self.predictor.model
+        previous = (
+            model.roi_heads.num_classes,
+            model.roi_heads.box_predictor[0].cls_score.zs_weight,
+        )
+        reset_cls_test(model, get_clip_embeddings(vocab), len(vocab))
+        self._vocab_classifiers[vocab] = (
+            get_vocab_metadata(vocab),
+            model.roi_heads.box_predictor[0].cls_score.zs_weight,
+        )
+        self._set_classifier(*previous)
+        while len(self._vocab_classifiers) > self.max_cached_vocabs:
+            self._vocab_classifiers.popitem(last=False)
+
+    def _set_classifier(self, num_classes: int, zs_weight: torch.Tensor):
+        """swap the zero-shot classifier weights of every box predictor"""
+        model = self.predictor.model
+        model.roi_heads.num_classes = num_classes
+        for box_predictor in model.roi_heads.box_predictor:
+            box_predictor.cls_score.zs_weight = zs_weight
 
     def reset_vocab(self, new_vocab: List[str], vocab_type="custom"):
         """Resets the vocabulary of Detic model allowing you to change detection on
-        the fly. Note that previous vocabulary is not preserved.
+        the fly. Classifiers of previous vocabularies are kept, so switching back to one
+        (or to one added with register_vocab) does not run the text encoder again.
         Args:
             new_vocab: list of strings representing the new vocabulary
             vocab_type: one of "custom" or "coco"; only "custom" supported right now
         """
         if self.verbose:
             print(f"Resetting vocabulary to {new_vocab}")
-        MetadataCatalog.remove("__unused")
         if vocab_type == "custom":
-            self.metadata = MetadataCatalog.get("__unused")
-            self.metadata.thing_classes = new_vocab
-            classifier = get_clip_embeddings(self.metadata.thing_classes)
-            self.categories_mapping = {
-                i: i for i in range(len(self.metadata.thing_classes))
-            }
+            vocab = tuple(new_vocab)
+            self.register_vocab(vocab)
+            self.metadata, zs_weight = self._vocab_classifiers[vocab]
+            self.categories_mapping = {i: i for i in range(len(vocab))}
         else:
             raise NotImplementedError(
                 "Detic does not have support for resetting from custom to coco vocab"
@@ -219,7 +295,7 @@ class DeticPerception(PerceptionModule):
         self.num_sem_categories = len(self.categories_mapping)
 
         num_classes = len(self.metadata.thing_classes)
-        reset_cls_test(self.predictor.model, classifier, num_classes)
+        self._set_classifier(num_classes, zs_weight)
 
     def predict(
         self,
@@ -237,37 +313,96 @@ class DeticPerception(PerceptionModule):
             obs.semantic: segmentation predictions of shape (H, W) with
              indices in [0, num_sem_categories - 1]
             obs.task_observations["semantic_frame"]: segmentation visualization
-             image of shape (H, W, 3)
+             image of shape (H, W, 3), as a DeferredVisualization which is only drawn
+             when read, or None if draw_instance_predictions is False
+        """
+        return self.predict_batch(
+            [obs],
+            depth_threshold=depth_threshold,
+            draw_instance_predictions=draw_instance_predictions,
+        )[0]
+
+    def predict_batch(
+        self,
+        obs_list: List[Observations],
+        depth_threshold: Optional[float] = None,
+        draw_instance_predictions: bool = True,
+    ) -> List[Observations]:
+        """Same as predict, for a list of observations (e.g. one per vectorized environment).
+        The detection model runs once on the whole batch; depth filtering and mask overlays
+        are done per image afterwards.
+        """
+        images = [cv2.cvtColor(obs.rgb, cv2.COLOR_RGB2BGR) for obs in obs_list]
+        with torch.no_grad():
+            preds = self.predictor.model([self._preprocess(image) for image in images])
+        return [
+            self._postprocess(
+                obs, image, pred, depth_threshold, draw_instance_predictions
+            )
+            for obs, image, pred in zip(obs_list, images, preds)
+        ]
+
+    def _preprocess(self, image: np.ndarray) -> Dict:
+        """convert a BGR image into a model input, as done by DefaultPredictor"""
+        if self.predictor.input_format == "RGB":
+            image = image[:, :, ::-1]
+        height, width = image.shape[:2]
+        resized = self.predictor.aug.get_transform(image).apply_image(image)
+        resized = torch.as_tensor(resized.astype("float32").transpose(2, 0, 1))
+        return {"image": resized, "height": height, "width": width}
+
+    def export_backbone(self, path: str, obs: Observations, quantize: bool = False):
+        """Export the backbone for frames of the size of obs.rgb, to be loaded with
+        backbone_file. The backbone does not depend on the vocabulary.
         """
         image = cv2.cvtColor(obs.rgb, cv2.COLOR_RGB2BGR)
+        model = self.predictor.model
+        with torch.no_grad():
+            sample_input = model.preprocess_image([self._preprocess(image)]).tensor
+        export_backbone(model, sample_input, path, quantize=quantize)
+
+    def _get_visualization_renderer(self, image: np.ndarray, instances):
+        """function drawing CPU instances over a BGR image; binds the current metadata, as
+        the vocabulary may change before it is called"""
+        return functools.partial(
+            _draw_instance_predictions,
+            image,
+            self.metadata,
+            self.instance_mode,
+            instances,
+        )
+
+    def _postprocess(
+        self,
+        obs: Observations,
+        image: np.ndarray,
+        pred: Dict,
+        depth_threshold: Optional[float] = None,
+        draw_instance_predictions: bool = True,
+    ) -> Observations:
+        """write the predictions for a single BGR image into its observations"""
         depth = obs.depth
         height, width, _ = image.shape
 
-        pred = self.predictor(image)
-
         if obs.task_observations is None:
             obs.task_observations = {}
 
+        instances = pred["instances"].to(self.cpu_device)
         if draw_instance_predictions:
-            visualizer = Visualizer(
-                image[:, :, ::-1], self.metadata, instance_mode=self.instance_mode
+            obs.task_observations["semantic_frame"] = DeferredVisualization(
+                self._get_visualization_renderer(image, instances),
+                executor=self.visualization_executor,
             )
-            visualization = visualizer.draw_instance_predictions(
-                predictions=pred["instances"].to(self.cpu_device)
-            ).get_image()
-            obs.task_observations["semantic_frame"] = visualization
         else:
             obs.task_observations["semantic_frame"] = None
 
         # Sort instances by mask size
-        masks = pred["instances"].pred_masks.cpu().numpy()
-        class_idcs = pred["instances"].pred_classes.cpu().numpy()
-        scores = pred["instances"].scores.cpu().numpy()
+        masks = instances.pred_masks.numpy()
+        class_idcs = instances.pred_classes.numpy()
+        scores = instances.scores.numpy()
 
         if depth_threshold is not None and depth is not None:
-            masks = np.array(
-                [filter_depth(mask, depth, depth_threshold) for mask in masks]
-            )
+            masks = filter_depth_batch(masks, depth, depth_threshold)
 
         semantic_map, instance_map = overlay_masks(masks, class_idcs, (height, width))
 
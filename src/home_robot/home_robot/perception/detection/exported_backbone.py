@@ -0,0 +1,158 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import copy
+import json
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+
+
+def quantize_backbone(backbone: nn.Module) -> nn.Module:
+    """copy of a backbone with int8 dynamic quantization of its linear layers, for CPU
+    inference. Transformer backbones such as Detic's Swin are mostly linear layers;
+    convolutions (e.g. in the ResNet of Mask R-CNN) are left in float."""
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(backbone).cpu().eval(), {nn.Linear}, dtype=torch.qint8
+    )
+
+
+class _TupleOutput(nn.Module):
+    """backbone returning its feature maps as a tuple, in a fixed order, for export"""
+
+    def __init__(self, backbone: nn.Module, out_features):
+        super().__init__()
+        self.backbone = backbone
+        self.out_features = out_features
+
+    def forward(self, x: torch.Tensor):
+        features = self.backbone(x)
+        return tuple(features[k] for k in self.out_features)
+
+
+def export_backbone(
+    model: nn.Module, sample_input: torch.Tensor, path: str, quantize: bool = False
+):
+    """Export the backbone of a detectron2 model for a fixed input size.
+
+    The backbone dominates inference time and, unlike the heads, does not depend on the
+    vocabulary, so it is the part worth compiling. The rest of the model runs eagerly.
+
+    Arguments:
+        model: detectron2 meta-architecture with a backbone, e.g. GeneralizedRCNN
+        sample_input: (1, 3, H, W) normalized and padded image, as given to the backbone
+         (model.preprocess_image(inputs).tensor)
+        path: output file; ".onnx" exports to ONNX, anything else to TorchScript
+        quantize: int8 dynamic quantization of linear layers (TorchScript on CPU only)
+    """
+    out_features = list(model.backbone.output_shape().keys())
+    backbone = model.backbone.eval()
+    if quantize:
+        if path.endswith(".onnx"):
+            raise ValueError("ONNX export of quantized backbones is not supported")
+        backbone = quantize_backbone(backbone)
+        sample_input = sample_input.cpu()
+    module = _TupleOutput(backbone, out_features).eval()
+
+    with torch.no_grad():
+        if path.endswith(".onnx"):
+            torch.onnx.export(
+                module,
+                sample_input,
+                path,
+                input_names=["image"],
+                output_names=out_features,
+                opset_version=17,
+            )
+        else:
+            torch.jit.save(torch.jit.trace(module, sample_input), path)
+
+    metadata = {
+        "input_shape": list(sample_input.shape[1:]),
+        "out_features": out_features,
+        "quantized": quantize,
+    }
+    with open(path + ".json", "w") as f:
+        json.dump(metadata, f)
+
+
+class ExportedBackbone(nn.Module):
+    """Drop-in replacement for the backbone of a detectron2 model, running a backbone
+    exported with export_backbone.
+
+    Exported backbones only accept the input size they were exported for. Inputs of another
+    size go through the original backbone if it is given, else raise a ValueError.
+    """
+
+    def __init__(self, path: str, backbone: Optional[nn.Module] = None):
+        """
+        path: file written by export_backbone
+        backbone: original backbone; gives the output shapes and padding of the model, and
+         handles inputs the exported backbone does not support
+        """
+        super().__init__()
+        with open(path + ".json") as f:
+            metadata = json.load(f)
+        self.input_shape = tuple(metadata["input_shape"])
+        self.out_features = metadata["out_features"]
+        self.quantized = metadata["quantized"]
+        self.eager_backbone = backbone
+
+        self._session = None
+        self._module = None
+        if path.endswith(".onnx"):
+            # Optional dependency, only needed for ONNX models
+            import onnxruntime
+
+            self._session = onnxruntime.InferenceSession(
+                path, providers=["CPUExecutionProvider"]
+            )
+        else:
+            self._module = torch.jit.load(path, map_location="cpu")
+
+    @property
+    def size_divisibility(self) -> int:
+        return self.eager_backbone.size_divisibility
+
+    @property
+    def padding_constraints(self) -> Dict[str, int]:
+        return getattr(self.eager_backbone, "padding_constraints", {})
+
+    def output_shape(self):
+        return self.eager_backbone.output_shape()
+
+    def _run(self, x: torch.Tensor):
+        """features of a single (1, 3, H, W) image"""
+        if self._session is not None:
+            outputs = self._session.run(None, {"image": x.cpu().numpy()})
+            return [torch.from_numpy(output).to(x.device) for output in outputs]
+        if self.quantized:
+            # Quantized kernels only run on CPU
+            return [output.to(x.device) for output in self._module(x.cpu())]
+        return list(self._module.to(x.device)(x))
+
+    def forward(self, x: torch.Tensor) -> Dict[str, torch.Tensor]:
+        if tuple(x.shape[1:]) != self.input_shape:
+            if self.eager_backbone is None:
+                raise ValueError(
+                    f"Backbone was exported for inputs of shape {self.input_shape}, "
+                    f"got {tuple(x.shape[1:])}"
+                )
+            return self.eager_backbone(x)
+
+        # Exported graphs may have the batch size baked in; run images one by one
+        outputs = [self._run(x[i : i + 1]) for i in range(x.shape[0])]
+        return {
+            name: torch.cat([output[j] for output in outputs])
+            for j, name in enumerate(self.out_features)
+        }
+
+
+def load_exported_backbone(model: nn.Module, path: str):
+    """replace the backbone of a detectron2 model with the one exported to path"""
+    backbone = model.backbone
+    if isinstance(backbone, ExportedBackbone):
+        backbone = backbone.eager_backbone
+    model.backbone = ExportedBackbone(path, backbone)
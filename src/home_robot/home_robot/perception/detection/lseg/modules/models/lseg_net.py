@@ -2,6 +2,7 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+from collections import OrderedDict
 from typing import List, Optional, Tuple
 
 import clip
@@ -9,6 +10,7 @@ import matplotlib.patches as mpatches
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torchvision.transforms as transforms
 from PIL import Image
 
@@ -386,6 +388,9 @@ def get_new_mask_palette(
 class LSegEncDecNet(LSegEnc):
     """LSeg encoder & decoder wrapper."""
 
+    # Number of label sets whose text features are kept in memory
+    max_cached_labels = 16
+
     def __init__(
         self,
         path=None,
@@ -414,22 +419,87 @@ class LSegEncDecNet(LSegEnc):
         if path is not None:
             self.load(path)
 
-    def encode(self, images) -> torch.Tensor:
+        # Normalized CLIP text features of recent label sets
+        self._text_features: "OrderedDict[Tuple[str, ...], torch.Tensor]" = (
+            OrderedDict()
+        )
+
+    def encode(self, images, scale_factor: float = 1.0) -> torch.Tensor:
         """Encode RGB images to CLIP pixel features.
 
         Arguments:
             images: images of shape (batch_size, H, W, 3) (in RGB order)
+            scale_factor: if < 1, images are downscaled before encoding, which reduces
+             the cost of the encoder roughly quadratically; the sides of downscaled
+             images are rounded to multiples of 32, as required by the encoder
 
         Returns:
-            pixel_features: CLIP pixel features of shape (batch_size, 512, H, W)
+            pixel_features: CLIP pixel features of shape (batch_size, 512, H', W'),
+             with (H', W') = (H, W) if scale_factor is 1
         """
         if isinstance(images, np.ndarray):
             images = torch.from_numpy(images)
         device = next(self.parameters()).device
         images = images.to(device).permute((0, 3, 1, 2))
         images = self.transform(images / 255.0)
+        if scale_factor != 1.0:
+            height, width = images.shape[-2:]
+            size = [
+                max(32, int(round(x * scale_factor / 32)) * 32) for x in (height, width)
+            ]
+            images = F.interpolate(
+                images, size=size, mode="bilinear", align_corners=False
+            )
         return self.forward(images)
 
+    def get_text_features(self, labels: List[str]) -> torch.Tensor:
+        """Normalized CLIP text features of shape (len(labels), 512), computed once per
+        label set"""
+        key = tuple(labels)
+        device = next(self.parameters()).device
+        if key in self._text_features:
+            self._text_features.move_to_end(key)
+            return self._text_features[key].to(device)
+
+        with torch.no_grad():
+            text = clip.tokenize(labels).to(device)
+            text_features = self.clip_pretrained.encode_text(text)
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+            text_features = text_features.float()
+        self._text_features[key] = text_features
+        while len(self._text_features) > self.max_cached_labels:
+            self._text_features.popitem(last=False)
+        return text_features
+
+    def decode_labels(
+        self,
+        pixel_features: torch.Tensor,
+        labels: List[str],
+        output_size: Optional[Tuple[int, int]] = None,
+    ) -> torch.Tensor:
+        """Decode CLIP pixel features to the index of their best matching text label,
+        without building one hot predictions.
+
+        Arguments:
+            pixel_features: CLIP pixel features of shape (batch_size, 512, H, W)
+            labels: set of text labels
+            output_size: if given, predictions are upsampled to this (H, W); only the
+             label indices are upsampled, not the features
+
+        Returns:
+            predictions: label indices of shape (batch_size, H, W)
+        """
+        text_features = self.get_text_features(labels)
+        label_scores = torch.einsum("bchw,lc->blhw", pixel_features, text_features)
+        predictions = label_scores.argmax(dim=1)
+        if output_size is not None and tuple(predictions.shape[-2:]) != tuple(
+            output_size
+        ):
+            predictions = F.interpolate(
+                predictions[:, None].float(), size=output_size, mode="nearest"
+            )[:, 0].long()
+        return predictions
+
     def decode(
         self, pixel_features: torch.Tensor, labels: Optional[List[str]] = None
     ) -> Tuple[torch.Tensor, Optional[np.ndarray]]:
@@ -445,16 +515,8 @@ class LSegEncDecNet(LSegEnc):
             visualizations: prediction visualization images of shape
              (batch_size, H, W, 3) if self.visualize=True else None
         """
-        device = next(self.parameters()).device
-        text = clip.tokenize(labels).to(device)
-        text_features = self.clip_pretrained.encode_text(text)
-        text_features /= text_features.norm(dim=-1, keepdim=True)
-        text_features = text_features.float()
-
-        label_scores = pixel_features.permute((0, 2, 3, 1)) @ text_features.T
-
-        predictions = torch.argmax(label_scores, dim=-1)
-        one_hot_predictions = torch.eye(len(labels)).to(device)[predictions]
+        predictions = self.decode_labels(pixel_features, labels)
+        one_hot_predictions = F.one_hot(predictions, len(labels)).float()
 
         if self.visualize:
             visualizations = []
@@ -0,0 +1,130 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Post-processing of instance masks shared by the detection models."""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+
+def overlay_masks(
+    masks: np.ndarray, class_idcs: np.ndarray, shape: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Overlays the masks of objects
+    Determines the order of masks based on mask size: smaller masks are drawn on top
+    """
+    semantic_mask = np.zeros(shape)
+    instance_mask = -np.ones(shape)
+    num_masks = len(masks)
+    if num_masks == 0:
+        return semantic_mask, instance_mask
+
+    masks = masks.astype(bool, copy=False)
+    mask_sizes = np.count_nonzero(masks.reshape(num_masks, -1), axis=1)
+    sorted_mask_idcs = np.argsort(mask_sizes, kind="stable")
+
+    # Every pixel takes the mask with the highest priority covering it (the smallest one)
+    priority = np.empty(num_masks, dtype=np.min_scalar_type(num_masks))
+    priority[sorted_mask_idcs] = np.arange(num_masks, 0, -1)
+    top_priority = (masks * priority[:, None, None]).max(axis=0)
+    covered = top_priority > 0
+    top_mask_idcs = sorted_mask_idcs[num_masks - top_priority[covered]]
+
+    semantic_mask[covered] = class_idcs[top_mask_idcs]
+    instance_mask[covered] = top_mask_idcs
+    return semantic_mask, instance_mask
+
+
+def _sorted_medians(
+    mask_idcs: np.ndarray, masked_values: np.ndarray, num_masks: int
+) -> np.ndarray:
+    """median of the values belonging to each mask, as np.median would give for each
+    mask, nan for empty masks; mask_idcs must be in increasing order"""
+    counts = np.bincount(mask_idcs, minlength=num_masks)
+
+    # Sort values within each mask with a single sort: masks are already in order
+    sorted_values = masked_values[np.lexsort((masked_values, mask_idcs))]
+
+    medians = np.full(num_masks, np.nan)
+    valid = counts > 0
+    starts = (np.cumsum(counts) - counts)[valid]
+    lower = sorted_values[starts + (counts[valid] - 1) // 2]
+    upper = sorted_values[starts + counts[valid] // 2]
+    medians[valid] = (lower + upper) / 2
+    return medians
+
+
+def masked_medians(masks: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """(N,) median of (H, W) values under each of (N, H, W) masks, as np.median would
+    give for each mask; nan for empty masks"""
+    mask_idcs, pixel_idcs = np.divmod(np.flatnonzero(masks), values.size)
+    return _sorted_medians(mask_idcs, values.ravel()[pixel_idcs], len(masks))
+
+
+def filter_depth_batch(
+    masks: np.ndarray, depth: np.ndarray, depth_threshold: Optional[float] = None
+) -> np.ndarray:
+    """filter_depth applied to a stack of (N, H, W) masks at once. Only the pixels inside
+    the masks are visited after a single pass to find them."""
+    flat_idcs = np.flatnonzero(masks)
+    mask_idcs, pixel_idcs = np.divmod(flat_idcs, depth.size)
+    masked_depth = depth.ravel()[pixel_idcs].astype(np.float64)
+    md = _sorted_medians(mask_idcs, masked_depth, len(masks))[mask_idcs]  # median depth
+
+    # Remove mask if more than half of points has invalid depth
+    keep = md != 0
+    if depth_threshold is not None:
+        # Restrict objects to 1m depth
+        keep &= (masked_depth < md + depth_threshold) & (
+            masked_depth > md - depth_threshold
+        )
+    masks_out = masks.copy()
+    masks_out.ravel()[flat_idcs[~keep]] = 0
+    return masks_out
+
+
+def filter_depth(
+    mask: np.ndarray, depth: np.ndarray, depth_threshold: Optional[float] = None
+) -> np.ndarray:
+    return filter_depth_batch(mask[None], depth, depth_threshold)[0]
+
+
+def get_category_lookup(category_mapping: Dict[int, int]) -> np.ndarray:
+    """array mapping the class ids of a model to semantic categories, -1 for classes
+    without a category"""
+    category_lookup = np.full(max(category_mapping.keys()) + 1, -1)
+    for class_idx, idx in category_mapping.items():
+        category_lookup[class_idx] = idx
+    return category_lookup
+
+
+def lookup_categories(
+    category_lookup: np.ndarray, class_idcs: np.ndarray
+) -> np.ndarray:
+    """semantic categories of class ids, -1 for classes without a category"""
+    known = class_idcs < len(category_lookup)
+    category_idcs = np.full(len(class_idcs), -1)
+    category_idcs[known] = category_lookup[class_idcs[known]]
+    return category_idcs
+
+
+def add_masks_to_one_hot(
+    one_hot: np.ndarray, masks: np.ndarray, category_idcs: np.ndarray
+):
+    """Adds (N, H, W) masks to the channels of their categories in an (H, W, C) one-hot
+    map; overlapping masks of a category add up"""
+    for idx in np.unique(category_idcs):
+        one_hot[:, :, idx] += masks[category_idcs == idx].sum(axis=0)
+
+
+def get_model_inputs(images: np.ndarray, input_format: str = "BGR") -> List[dict]:
+    """detectron2 model inputs for images of shape (batch_size, H, W, 3) (in BGR
+    order)"""
+    if input_format == "RGB":
+        images = images[:, :, :, ::-1]
+    _, height, width, _ = images.shape
+    # Convert the whole batch at once; each input is a view into it
+    batch = torch.as_tensor(images.astype("float32").transpose(0, 3, 1, 2))
+    return [{"image": image, "height": height, "width": width} for image in batch]
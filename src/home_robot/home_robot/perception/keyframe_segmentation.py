@@ -0,0 +1,268 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from argparse import Namespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import trimesh.transformations as tra
+from scipy import ndimage
+
+from home_robot.core.interfaces import Observations
+from home_robot.utils import rotation as ru
+
+# Task observations computed on keyframes which are propagated as is
+KEYFRAME_TASK_OBSERVATIONS = ["instance_classes", "instance_scores", "semantic_frame"]
+
+
+def get_camera_tilt(camera_pose: Optional[np.ndarray]) -> float:
+    """camera tilt in radians, with the same convention as the semantic map module"""
+    if camera_pose is None:
+        return 0.0
+    return tra.euler_from_matrix(np.asarray(camera_pose)[:3, :3], "rzyx")[1]
+
+
+def _camera_to_world(tilt: float, pose: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """rotation and translation from camera coordinates (x right, y forward, z up) to the
+    2D world frame of an (x, y, theta) base pose"""
+    rot_tilt = ru.get_r_matrix([1.0, 0.0, 0.0], angle=tilt)
+    rot_pose = ru.get_r_matrix([0.0, 0.0, 1.0], angle=pose[2] - np.pi / 2.0)
+    return rot_pose @ rot_tilt, np.array([pose[0], pose[1], 0.0])
+
+
+def warp_to_view(
+    layers: List[np.ndarray],
+    fill_values: List[float],
+    depth: np.ndarray,
+    pose: np.ndarray,
+    tilt: float,
+    new_pose: np.ndarray,
+    new_tilt: float,
+    camera_matrix: Namespace,
+    new_depth: Optional[np.ndarray] = None,
+    depth_tolerance: float = 0.1,
+    max_fill_distance: float = 2.0,
+) -> Tuple[List[np.ndarray], np.ndarray]:
+    """Forward warp per-pixel layers (e.g. semantic and instance maps) from one view to another
+    using the depth of the source view and the change of camera pose.
+
+    Arguments:
+        layers: (H, W) maps to warp
+        fill_values: value of each layer at pixels nothing is warped to
+        depth: (H, W) depth of the source view in meters; 0 for invalid pixels
+        pose, new_pose: (x, y, theta) base poses of both views, from gps and compass
+        tilt, new_tilt: camera tilts of both views in radians
+        camera_matrix: intrinsics, from home_robot.utils.depth.get_camera_matrix
+        new_depth: (H, W) depth of the target view; warped pixels which do not match it are
+         considered occluded
+        depth_tolerance: max difference between warped and target depth, in meters
+        max_fill_distance: holes up to this distance in pixels to a warped pixel are filled
+         with its values
+
+    Returns:
+        warped layers, and the (H, W) mask of target pixels which received a value
+    """
+    height, width = depth.shape
+    source = np.flatnonzero(depth > 0)
+    v, u = np.divmod(source, width)
+    d = depth.reshape(-1)[source]
+
+    # Unproject, with the axes of get_point_cloud_from_z_t
+    points = np.stack(
+        [
+            (u - camera_matrix.xc) * d / camera_matrix.f,
+            d,
+            ((height - 1 - v) - camera_matrix.zc) * d / camera_matrix.f,
+        ],
+        axis=1,
+    )
+
+    # Source camera -> world -> target camera, as a single rigid transform
+    rot, trans = _camera_to_world(tilt, pose)
+    new_rot, new_trans = _camera_to_world(new_tilt, new_pose)
+    points = points @ (new_rot.T @ rot).T + (trans - new_trans) @ new_rot
+
+    # Project; keep points in front of the target camera
+    new_d = points[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = camera_matrix.f / new_d
+    new_u = np.rint(points[:, 0] * scale + camera_matrix.xc)
+    new_v = np.rint(height - 1 - camera_matrix.zc - points[:, 2] * scale)
+    keep = (
+        (new_d > 1e-3)
+        & (new_u >= 0)
+        & (new_u < width)
+        & (new_v >= 0)
+        & (new_v < height)
+    )
+    target = new_v[keep].astype(np.int64) * width + new_u[keep].astype(np.int64)
+    source, new_d = source[keep], new_d[keep]
+
+    # Z-buffer: write the farthest points first so that the closest ones are kept
+    order = np.argsort(-new_d, kind="stable")
+    source_idx = np.full(height * width, -1, dtype=np.int64)
+    warped_depth = np.zeros(height * width)
+    source_idx[target[order]] = source[order]
+    warped_depth[target[order]] = new_d[order]
+    source_idx = source_idx.reshape(height, width)
+    warped_depth = warped_depth.reshape(height, width)
+    valid = source_idx >= 0
+
+    # Fill small holes left by forward warping from their nearest warped pixel
+    if max_fill_distance > 0 and np.any(valid) and not np.all(valid):
+        distance, (near_v, near_u) = ndimage.distance_transform_edt(
+            ~valid, return_indices=True
+        )
+        fill = ~valid & (distance <= max_fill_distance)
+        source_idx[fill] = source_idx[near_v[fill], near_u[fill]]
+        warped_depth[fill] = warped_depth[near_v[fill], near_u[fill]]
+        valid |= fill
+
+    # Remove occluded and disoccluded pixels
+    if new_depth is not None:
+        valid &= (new_depth > 0) & (np.abs(warped_depth - new_depth) < depth_tolerance)
+
+    flat_idx = source_idx[valid]
+    warped = []
+    for layer, fill_value in zip(layers, fill_values):
+        out = np.full((height, width), fill_value, dtype=layer.dtype)
+        out[valid] = layer.reshape(-1)[flat_idx]
+        warped.append(out)
+    return warped, valid
+
+
+class KeyframeSegmentation:
+    """Runs a segmentation model on keyframes only, and warps its last predictions to the
+    frames in between using depth and the pose change.
+
+    A new keyframe is segmented when the agent moved or turned too much since the last one,
+    every keyframe_interval frames, or when propagation is unreliable: too many pixels could
+    not be warped, or the warped keyframe image differs too much from the current image.
+    These two thresholds bound the fraction of pixels whose labels are unknown or stale on
+    propagated frames.
+    """
+
+    def __init__(
+        self,
+        segment: Callable[[Observations], Observations],
+        camera_matrix: Namespace,
+        keyframe_interval: int = 4,
+        max_translation: float = 0.3,
+        max_rotation: float = np.deg2rad(20),
+        max_hole_fraction: float = 0.1,
+        max_photometric_error: float = 0.1,
+        depth_tolerance: float = 0.1,
+    ):
+        """
+        segment: segmentation model; sets obs.semantic and obs.task_observations["instance_map"]
+        camera_matrix: intrinsics, from home_robot.utils.depth.get_camera_matrix
+        keyframe_interval: max number of frames between two keyframes (1 segments every frame)
+        max_translation: max distance in meters from the last keyframe
+        max_rotation: max rotation in radians from the last keyframe
+        max_hole_fraction: max fraction of pixels without a warped label
+        max_photometric_error: max mean absolute difference, in [0, 1], between the warped
+         keyframe image and the current image
+        depth_tolerance: max depth difference in meters between warped and observed pixels
+        """
+        self.segment = segment
+        self.camera_matrix = camera_matrix
+        self.keyframe_interval = keyframe_interval
+        self.max_translation = max_translation
+        self.max_rotation = max_rotation
+        self.max_hole_fraction = max_hole_fraction
+        self.max_photometric_error = max_photometric_error
+        self.depth_tolerance = depth_tolerance
+        self.reset()
+
+    def reset(self):
+        """forget the last keyframe, e.g. at the start of an episode or after a vocabulary
+        change, and reset statistics"""
+        self._keyframe: Optional[Dict] = None
+        self._frames_since_keyframe = 0
+        self.num_keyframes = 0
+        self.num_propagated = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        """fraction of frames which were segmented"""
+        num_frames = self.num_keyframes + self.num_propagated
+        return {
+            "keyframes": self.num_keyframes,
+            "propagated": self.num_propagated,
+            "keyframe_ratio": self.num_keyframes / max(num_frames, 1),
+        }
+
+    @staticmethod
+    def _get_pose(obs: Observations) -> np.ndarray:
+        return np.array([obs.gps[0], obs.gps[1], np.asarray(obs.compass).item()])
+
+    def _needs_keyframe(self, pose: np.ndarray) -> bool:
+        if self._keyframe is None:
+            return True
+        if self._frames_since_keyframe + 1 >= self.keyframe_interval:
+            return True
+        delta = pose - self._keyframe["pose"]
+        rotation = np.abs((delta[2] + np.pi) % (2 * np.pi) - np.pi)
+        return (
+            np.linalg.norm(delta[:2]) > self.max_translation
+            or rotation > self.max_rotation
+        )
+
+    def _run_keyframe(self, obs: Observations, pose: np.ndarray) -> Observations:
+        obs = self.segment(obs)
+        self._keyframe = {
+            "pose": pose,
+            "tilt": get_camera_tilt(obs.camera_pose),
+            "depth": np.asarray(obs.depth, dtype=np.float64).copy(),
+            "gray": np.asarray(obs.rgb, dtype=np.float32).mean(axis=-1) / 255.0,
+            "semantic": obs.semantic.copy(),
+            "instance_map": obs.task_observations["instance_map"].copy(),
+            "task_observations": {
+                k: obs.task_observations.get(k) for k in KEYFRAME_TASK_OBSERVATIONS
+            },
+        }
+        self._frames_since_keyframe = 0
+        self.num_keyframes += 1
+        return obs
+
+    def __call__(self, obs: Observations) -> Observations:
+        pose = self._get_pose(obs)
+        if self._needs_keyframe(pose):
+            return self._run_keyframe(obs, pose)
+
+        keyframe = self._keyframe
+        depth = np.asarray(obs.depth, dtype=np.float64)
+        (semantic, instance_map, gray), valid = warp_to_view(
+            [keyframe["semantic"], keyframe["instance_map"], keyframe["gray"]],
+            [0, -1, 0],
+            keyframe["depth"],
+            keyframe["pose"],
+            keyframe["tilt"],
+            pose,
+            get_camera_tilt(obs.camera_pose),
+            self.camera_matrix,
+            new_depth=depth,
+            depth_tolerance=self.depth_tolerance,
+        )
+
+        # Segment instead if propagation is not reliable enough
+        observed = depth > 0
+        hole_fraction = np.mean(observed & ~valid)
+        current_gray = np.asarray(obs.rgb, dtype=np.float32).mean(axis=-1) / 255.0
+        photometric_error = (
+            np.abs(gray[valid] - current_gray[valid]).mean() if np.any(valid) else 0.0
+        )
+        if (
+            hole_fraction > self.max_hole_fraction
+            or photometric_error > self.max_photometric_error
+        ):
+            return self._run_keyframe(obs, pose)
+
+        if obs.task_observations is None:
+            obs.task_observations = {}
+        obs.semantic = semantic
+        obs.task_observations["instance_map"] = instance_map
+        obs.task_observations.update(keyframe["task_observations"])
+        self._frames_since_keyframe += 1
+        self.num_propagated += 1
+        return obs
@@ -0,0 +1,422 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Typed binary messages to exchange observations, actions and infos with remote
+environments.
+
+Values are encoded with a one byte type tag. Arrays are sent as raw buffers with a
+dtype and shape header, optionally compressed: losslessly with zlib (e.g. depth and
+semantic frames) or as JPEG (RGB frames). The codec of an array is chosen from the name
+of the Observations field or dict key holding it. Objects converting to arrays (e.g.
+deferred visualizations) are sent as those arrays. Objects without a binary encoding
+(e.g. habitat episodes) are pickled.
+"""
+import dataclasses
+import pickle
+import struct
+import zlib
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+import torch
+
+from home_robot.core.interfaces import (
+    ContinuousFullBodyAction,
+    ContinuousNavigationAction,
+    DiscreteNavigationAction,
+    Observations,
+)
+
+MAGIC = b"HRB1"
+
+
+class ArrayCodec(Enum):
+    RAW = 0
+    ZLIB = 1  # lossless
+    JPEG = 2  # lossy, uint8 (H, W, 3) RGB images only
+
+
+# Codecs of arrays, by field or key name; other arrays are sent raw
+DEFAULT_ARRAY_CODECS = {
+    "depth": ArrayCodec.ZLIB,
+    "semantic": ArrayCodec.ZLIB,
+}
+
+_NONE = b"N"
+_TRUE = b"T"
+_FALSE = b"F"
+_INT = b"i"
+_FLOAT = b"f"
+_STR = b"s"
+_BYTES = b"b"
+_LIST = b"l"
+_TUPLE = b"t"
+_DICT = b"d"
+_ARRAY = b"a"
+_SCALAR = b"g"
+_OBSERVATIONS = b"o"
+_DISCRETE_ACTION = b"e"
+_CONTINUOUS_NAVIGATION_ACTION = b"c"
+_CONTINUOUS_FULL_BODY_ACTION = b"j"
+_PICKLE = b"p"
+
+_INT64_RANGE = (-(2**63), 2**63 - 1)
+
+
+class _Writer:
+    def __init__(
+        self, array_codecs: Dict[str, ArrayCodec], jpeg_quality: int = 90
+    ) -> None:
+        self.chunks: List[Any] = [MAGIC]
+        self.array_codecs = array_codecs
+        self.jpeg_quality = jpeg_quality
+
+    def write_len(self, n: int):
+        self.chunks.append(struct.pack("<Q", n))
+
+    def write_bytes(self, data):
+        self.write_len(len(data))
+        self.chunks.append(data)
+
+    def write_str(self, s: str):
+        self.write_bytes(s.encode("utf-8"))
+
+    def write_array(self, array: np.ndarray, codec: ArrayCodec):
+        if array.size == 0 or (
+            codec == ArrayCodec.JPEG
+            and not (
+                array.dtype == np.uint8 and array.ndim == 3 and array.shape[2] == 3
+            )
+        ):
+            # Empty arrays have no payload to compress
+            codec = ArrayCodec.RAW
+        array = np.ascontiguousarray(array)
+        self.write_str(array.dtype.str)
+        self.write_len(array.ndim)
+        for n in array.shape:
+            self.write_len(n)
+        self.chunks.append(bytes([codec.value]))
+        if codec == ArrayCodec.ZLIB:
+            self.write_bytes(zlib.compress(memoryview(array).cast("B"), 1))
+        elif codec == ArrayCodec.JPEG:
+            _, buffer = cv2.imencode(
+                ".jpg",
+                cv2.cvtColor(array, cv2.COLOR_RGB2BGR),
+                [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality],
+            )
+            self.write_bytes(buffer.tobytes())
+        else:
+            self.write_bytes(memoryview(array).cast("B") if array.size > 0 else b"")
+
+    def write(self, value: Any, name: Optional[str] = None):
+        """writes a value; name is the field or key holding it, which selects the codec
+        of arrays"""
+        if value is None:
+            self.chunks.append(_NONE)
+        elif value is True or value is False:
+            self.chunks.append(_TRUE if value else _FALSE)
+        elif type(value) is int and _INT64_RANGE[0] <= value <= _INT64_RANGE[1]:
+            self.chunks.append(_INT + struct.pack("<q", value))
+        elif type(value) is float:
+            self.chunks.append(_FLOAT + struct.pack("<d", value))
+        elif type(value) is str:
+            self.chunks.append(_STR)
+            self.write_str(value)
+        elif type(value) is bytes:
+            self.chunks.append(_BYTES)
+            self.write_bytes(value)
+        elif type(value) in (list, tuple):
+            self.chunks.append(_LIST if type(value) is list else _TUPLE)
+            self.write_len(len(value))
+            for v in value:
+                self.write(v, name)
+        elif type(value) is dict and all(type(k) is str for k in value):
+            self.chunks.append(_DICT)
+            self.write_len(len(value))
+            for k, v in value.items():
+                self.write_str(k)
+                self.write(v, k)
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            self.chunks.append(_ARRAY)
+            self.write_array(value, self.array_codecs.get(name, ArrayCodec.RAW))
+        elif isinstance(value, np.generic) and not isinstance(value, np.object_):
+            self.chunks.append(_SCALAR)
+            self.write_array(np.asarray(value), ArrayCodec.RAW)
+        elif type(value) is Observations:
+            self.chunks.append(_OBSERVATIONS)
+            fields = dataclasses.fields(value)
+            self.write_len(len(fields))
+            for field in fields:
+                self.write_str(field.name)
+                self.write(getattr(value, field.name), field.name)
+        elif isinstance(value, DiscreteNavigationAction):
+            self.chunks.append(_DISCRETE_ACTION + struct.pack("<q", value.value))
+        elif type(value) is ContinuousNavigationAction:
+            self.chunks.append(_CONTINUOUS_NAVIGATION_ACTION)
+            self.write(value.xyt)
+        elif type(value) is ContinuousFullBodyAction:
+            self.chunks.append(_CONTINUOUS_FULL_BODY_ACTION)
+            self.write(value.joints)
+            self.write(value.xyt)
+        else:
+            array = _as_plain_array(value)
+            if array is not None:
+                self.chunks.append(_ARRAY)
+                self.write_array(array, self.array_codecs.get(name, ArrayCodec.RAW))
+            else:
+                self.chunks.append(_PICKLE)
+                self.write_bytes(pickle.dumps(value))
+
+
+def _as_plain_array(value: Any) -> Optional[np.ndarray]:
+    """array an object converts to (e.g. a deferred visualization), None if it has no
+    conversion to a non-object array; tensors keep their type and are pickled"""
+    if not hasattr(value, "__array__") or isinstance(value, torch.Tensor):
+        return None
+    try:
+        array = np.asarray(value)
+    except Exception:
+        return None
+    return None if array.dtype == object else array
+
+
+class _Reader:
+    def __init__(self, data: bytearray) -> None:
+        self.data = data
+        self.view = memoryview(data)
+        self.offset = 0
+
+    def read_raw(self, n: int) -> memoryview:
+        chunk = self.view[self.offset : self.offset + n]
+        self.offset += n
+        return chunk
+
+    def read_len(self) -> int:
+        (n,) = struct.unpack_from("<Q", self.data, self.offset)
+        self.offset += 8
+        return n
+
+    def read_bytes(self) -> memoryview:
+        return self.read_raw(self.read_len())
+
+    def read_str(self) -> str:
+        return str(self.read_bytes(), "utf-8")
+
+    def read_array(self) -> np.ndarray:
+        dtype = np.dtype(self.read_str())
+        shape = tuple(self.read_len() for _ in range(self.read_len()))
+        codec = ArrayCodec(self.read_raw(1)[0])
+        payload = self.read_bytes()
+        if codec == ArrayCodec.ZLIB:
+            return np.frombuffer(
+                bytearray(zlib.decompress(payload)), dtype=dtype
+            ).reshape(shape)
+        elif codec == ArrayCodec.JPEG:
+            image = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # Writable view of the message, without copy
+        return np.frombuffer(payload, dtype=dtype).reshape(shape)
+
+    def read(self) -> Any:
+        tag = bytes(self.read_raw(1))
+        if tag == _NONE:
+            return None
+        elif tag == _TRUE:
+            return True
+        elif tag == _FALSE:
+            return False
+        elif tag == _INT:
+            return struct.unpack("<q", self.read_raw(8))[0]
+        elif tag == _FLOAT:
+            return struct.unpack("<d", self.read_raw(8))[0]
+        elif tag == _STR:
+            return self.read_str()
+        elif tag == _BYTES:
+            return bytes(self.read_bytes())
+        elif tag in (_LIST, _TUPLE):
+            values = [self.read() for _ in range(self.read_len())]
+            return values if tag == _LIST else tuple(values)
+        elif tag == _DICT:
+            return {self.read_str(): self.read() for _ in range(self.read_len())}
+        elif tag == _ARRAY:
+            return self.read_array()
+        elif tag == _SCALAR:
+            return self.read_array()[()]
+        elif tag == _OBSERVATIONS:
+            return Observations(
+                **{self.read_str(): self.read() for _ in range(self.read_len())}
+            )
+        elif tag == _DISCRETE_ACTION:
+            return DiscreteNavigationAction(struct.unpack("<q", self.read_raw(8))[0])
+        elif tag == _CONTINUOUS_NAVIGATION_ACTION:
+            return ContinuousNavigationAction(self.read())
+        elif tag == _CONTINUOUS_FULL_BODY_ACTION:
+            joints = self.read()
+            return ContinuousFullBodyAction(joints, xyt=self.read())
+        elif tag == _PICKLE:
+            return pickle.loads(self.read_bytes())
+        raise ValueError(f"Unknown type tag {tag} at offset {self.offset - 1}")
+
+
+def encode(
+    value: Any,
+    array_codecs: Optional[Dict[str, ArrayCodec]] = None,
+    jpeg_quality: int = 90,
+) -> bytes:
+    """Binary message of a value.
+
+    Arguments:
+        value: value to encode, e.g. observations, actions or dicts of infos
+        array_codecs: codec of arrays by field or key name, defaults to
+         DEFAULT_ARRAY_CODECS
+        jpeg_quality: quality of JPEG images, in [0, 100]
+    """
+    if array_codecs is None:
+        array_codecs = DEFAULT_ARRAY_CODECS
+    writer = _Writer(array_codecs, jpeg_quality)
+    writer.write(value)
+    return b"".join(writer.chunks)
+
+
+def decode(message: bytes) -> Any:
+    """value of a binary message written by encode; arrays are writable"""
+    # Single copy of the message, which arrays sent raw are views of
+    reader = _Reader(bytearray(message))
+    if bytes(reader.read_raw(len(MAGIC))) != MAGIC:
+        raise ValueError("Not a binary transport message")
+    return reader.read()
+
+
+def get_array_codecs(
+    rgb_codec: str = "RAW", compress_depth_semantic: bool = True
+) -> Dict[str, ArrayCodec]:
+    """Codecs of arrays by field or key name.
+
+    Arguments:
+        rgb_codec: "RAW" or "JPEG" (lossy), codec of RGB frames
+        compress_depth_semantic: whether to compress depth and semantic frames (lossless)
+    """
+    array_codecs = {
+        "rgb": ArrayCodec[rgb_codec],
+        "third_person_image": ArrayCodec[rgb_codec],
+    }
+    if compress_depth_semantic:
+        array_codecs.update(DEFAULT_ARRAY_CODECS)
+    return array_codecs
+
+
+class RemoteEnvServer:
+    """Serves calls to the methods of several environments from binary messages.
+
+    Each message is a batch of calls to the same method in several environments. Any
+    transport delivering (method name, message) pairs and returning the response can
+    be used, e.g. gRPC in remote evaluation, or direct calls to handle in tests.
+    """
+
+    def __init__(self, envs: Sequence[Any]):
+        self.envs = list(envs)
+
+    def handle(self, method: str, message: bytes) -> bytes:
+        """response to a request message of RemoteEnvClient"""
+        request = decode(message)
+        array_codecs = {k: ArrayCodec[v] for k, v in request["array_codecs"].items()}
+        try:
+            results = []
+            for e, kwargs in zip(request["env_ids"], request["args"]):
+                attribute = getattr(self.envs[e], method)
+                results.append(
+                    attribute(**kwargs) if callable(attribute) else attribute
+                )
+            response = {"results": results}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        return encode(response, array_codecs, request["jpeg_quality"])
+
+
+class RemoteEnvClient:
+    """Environments served by a RemoteEnvServer, with the call interface of
+    habitat.core.vector_env.VectorEnv. Calls to the same method in several environments
+    are sent as one message.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, bytes], bytes],
+        num_envs: int = 1,
+        array_codecs: Optional[Dict[str, ArrayCodec]] = None,
+        jpeg_quality: int = 90,
+    ):
+        """
+        send: sends a method name and request message to the server, returns the response
+        num_envs: number of environments of the server
+        array_codecs: codecs of arrays of requests and responses by field or key name;
+         defaults to DEFAULT_ARRAY_CODECS
+        jpeg_quality: quality of JPEG images, in [0, 100]
+        """
+        self.send = send
+        self.num_envs = num_envs
+        self.array_codecs = (
+            DEFAULT_ARRAY_CODECS if array_codecs is None else array_codecs
+        )
+        self.jpeg_quality = jpeg_quality
+
+    def _call_batch(
+        self, method: str, env_ids: Sequence[int], args: Sequence[Dict[str, Any]]
+    ) -> List[Any]:
+        request = {
+            "env_ids": list(env_ids),
+            "args": list(args),
+            "array_codecs": {k: codec.name for k, codec in self.array_codecs.items()},
+            "jpeg_quality": self.jpeg_quality,
+        }
+        message = encode(request, self.array_codecs, self.jpeg_quality)
+        response = decode(self.send(method, message))
+        if "error" in response:
+            raise RuntimeError(f"Remote {method} failed: {response['error']}")
+        return response["results"]
+
+    def call(
+        self,
+        function_names: List[str],
+        function_args_list: Optional[List[Any]] = None,
+    ) -> List[Any]:
+        """results of a method (or values of an attribute) in each environment, with
+        one message per method name
+
+        Arguments:
+            function_names: name of the method or attribute, for each environment
+            function_args_list: keyword arguments of the method, for each environment
+        """
+        if function_args_list is None:
+            function_args_list = [None] * len(function_names)
+        env_ids_by_method: Dict[str, List[int]] = {}
+        for e, method in enumerate(function_names):
+            env_ids_by_method.setdefault(method, []).append(e)
+        results: List[Any] = [None] * len(function_names)
+        for method, env_ids in env_ids_by_method.items():
+            args = [function_args_list[e] or {} for e in env_ids]
+            for e, result in zip(env_ids, self._call_batch(method, env_ids, args)):
+                results[e] = result
+        return results
+
+    def call_at(
+        self,
+        index: int,
+        function_name: str,
+        function_args: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """result of a method (or value of an attribute) in one environment"""
+        return self._call_batch(function_name, [index], [function_args or {}])[0]
+
+    def current_episodes(self) -> List[Any]:
+        return self.call(["get_current_episode"] * self.num_envs)
+
+    @property
+    def number_of_episodes(self) -> List[int]:
+        return self.call(["number_of_episodes"] * self.num_envs)
+
+    def close(self):
+        self.call(["close"] * self.num_envs)
@@ -75,15 +75,36 @@ def transform_camera_view_t(XYZ, sensor_height, camera_elevation_degree, device)
     camera elevation and angle
     Input:
         XYZ                     : ...x3
-        sensor_height           : height of the sensor
-        camera_elevation_degree : camera elevation to rectify.
+        sensor_height           : height of the sensor, or (B,) heights for a batch of
+                                  B x ... x 3 point clouds
+        camera_elevation_degree : camera elevation to rectify, or (B,) elevations for a
+                                  batch of B x ... x 3 point clouds
     Output:
         XYZ : ...x3
     """
-    R = ru.get_r_matrix([1.0, 0.0, 0.0], angle=np.deg2rad(camera_elevation_degree))
+    if np.ndim(camera_elevation_degree) == 0:
+        R = ru.get_r_matrix([1.0, 0.0, 0.0], angle=np.deg2rad(camera_elevation_degree))
+        XYZ = torch.matmul(
+            XYZ.reshape(-1, 3), torch.from_numpy(R).float().transpose(1, 0).to(device)
+        ).reshape(XYZ.shape)
+        XYZ[..., 2] = XYZ[..., 2] + sensor_height
+        return XYZ
+
+    # One rotation (and height) per element of the batch
+    batch_size = XYZ.shape[0]
+    R = np.stack(
+        [
+            ru.get_r_matrix([1.0, 0.0, 0.0], angle=np.deg2rad(elevation))
+            for elevation in np.asarray(camera_elevation_degree).reshape(-1)
+        ]
+    )
     XYZ = torch.matmul(
-        XYZ.reshape(-1, 3), torch.from_numpy(R).float().transpose(1, 0).to(device)
+        XYZ.reshape(batch_size, -1, 3),
+        torch.from_numpy(R).float().transpose(1, 2).to(device),
     ).reshape(XYZ.shape)
+    sensor_height = torch.as_tensor(sensor_height, dtype=XYZ.dtype, device=device)
+    if sensor_height.dim() > 0:
+        sensor_height = sensor_height.view(-1, *[1] * (XYZ.dim() - 2))
     XYZ[..., 2] = XYZ[..., 2] + sensor_height
     return XYZ
 
@@ -0,0 +1,115 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import glob
+import json
+import os
+import warnings
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+# Episode results are appended to files named
+# episode_results.jsonl (unsharded evaluation) or
+# episode_results.shard_<i>_of_<N>.jsonl
+RESULTS_LOG_PREFIX = "episode_results"
+
+
+def parse_shard(shard: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(index, number of shards) from a "i/N" string, None if shard is None"""
+    if shard is None:
+        return None
+    try:
+        index, num_shards = [int(x) for x in str(shard).split("/")]
+    except ValueError:
+        raise ValueError(f"Shards are specified as i/N, got {shard}")
+    if num_shards < 1 or not 0 <= index < num_shards:
+        raise ValueError(f"Invalid shard {shard}: need 0 <= i < N")
+    return index, num_shards
+
+
+def in_shard(episode_key: str, shard: Optional[Tuple[int, int]]) -> bool:
+    """Whether an episode belongs to a shard. Episodes are assigned to shards by a hash
+    of their key, so that workers agree on shards without coordination whatever the order
+    in which they load episodes."""
+    if shard is None:
+        return True
+    index, num_shards = shard
+    return zlib.crc32(episode_key.encode("utf-8")) % num_shards == index
+
+
+def get_shard_suffix(shard: Optional[Tuple[int, int]]) -> str:
+    """suffix of the result files of a shard"""
+    if shard is None:
+        return ""
+    return f".shard_{shard[0]}_of_{shard[1]}"
+
+
+class EpisodeResultsLog:
+    """Append-only JSON lines log of the metrics of finished episodes.
+
+    Each episode is written and flushed to disk as soon as it finishes, so that an
+    evaluation that crashes can be resumed and skip the episodes already evaluated.
+    """
+
+    def __init__(self, results_dir: str, shard: Optional[Tuple[int, int]] = None):
+        self.path = os.path.join(
+            results_dir, f"{RESULTS_LOG_PREFIX}{get_shard_suffix(shard)}.jsonl"
+        )
+        # Terminate a line being written when a previous evaluation stopped, so that new
+        # episodes start on their own line
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def load(self) -> Dict[str, Dict]:
+        """metrics of the episodes in the log, by episode key"""
+        return read_results_logs([self.path])
+
+    def start(self, resume: bool) -> Dict[str, Dict]:
+        """Starts an evaluation. When resuming, returns the metrics of the episodes already
+        in the log, to skip them. Otherwise the log of a previous evaluation is moved to
+        <path>.old, out of the logs merged across shards, and the evaluation starts from
+        an empty log."""
+        episode_metrics = self.load()
+        if resume:
+            return episode_metrics
+        if len(episode_metrics) > 0:
+            os.replace(self.path, self.path + ".old")
+            warnings.warn(
+                f"Not resuming from the {len(episode_metrics)} episodes in {self.path}, "
+                f"moved to {self.path}.old: evaluate with resume enabled to skip them"
+            )
+        return {}
+
+    def append(self, episode_key: str, metrics: Dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"episode": episode_key, "metrics": metrics}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_results_logs(paths: Iterable[str]) -> Dict[str, Dict]:
+    """Metrics of the episodes in several logs, by episode key. Episodes evaluated more
+    than once keep their last metrics."""
+    episode_metrics = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Line being written when the evaluation stopped
+                    continue
+                episode_metrics[entry["episode"]] = entry["metrics"]
+    return episode_metrics
+
+
+def merge_results_logs(results_dir: str) -> Dict[str, Dict]:
+    """metrics of the episodes of all shards of an evaluation, by episode key"""
+    paths = sorted(glob.glob(os.path.join(results_dir, f"{RESULTS_LOG_PREFIX}*.jsonl")))
+    return read_results_logs(paths)
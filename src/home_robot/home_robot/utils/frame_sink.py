@@ -0,0 +1,226 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Background writing of visualization frames, so that saving images never slows down
+the environment step.
+
+Frames are written by a pool of worker threads, each with a bounded number of queued
+frames. When a worker is full the frame is dropped instead of waiting; commands such as
+finishing videos never wait. Frames are either written as PNG images, or streamed into
+one MP4 video per sequence: frames saved as <dir>/<name>_<index>.png go to
+<dir>/<name>.mp4, in the order they are added. A video finished early to bound the
+number of open videos is continued in <dir>/<name>.1.mp4, <dir>/<name>.2.mp4, etc.
+"""
+import atexit
+import os
+import queue
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+_FRAME = "frame"
+_CLOSE_VIDEOS = "close_videos"
+_STOP = "stop"
+
+
+def get_video_path(image_path: str) -> str:
+    """path of the video of the sequence an image belongs to, e.g.
+    dir/snapshot.mp4 for dir/snapshot_003.png"""
+    directory, filename = os.path.split(image_path)
+    name = re.sub(r"_\d+$", "", os.path.splitext(filename)[0])
+    return os.path.join(directory, f"{name}.mp4")
+
+
+def _to_bgr_uint8(frame: np.ndarray) -> np.ndarray:
+    if frame.dtype != np.uint8:
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+    if frame.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+class _Worker:
+    def __init__(self, sink: "FrameSink", max_queued_frames: int):
+        self.sink = sink
+        # Frames and commands in order; commands never wait for room, only frames are
+        # bounded, by the free slots
+        self.queue: queue.Queue = queue.Queue()
+        self.free_slots = threading.Semaphore(max_queued_frames)
+        # Video writers of the worker by path, least recently used first
+        self.videos: Dict[str, cv2.VideoWriter] = OrderedDict()
+        # Number of parts of the videos finished early, so that they are never overwritten
+        self.num_parts: Dict[str, int] = {}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def close_videos(self, directory: Optional[str] = None):
+        for path in list(self.videos):
+            if directory is None or os.path.dirname(path) == directory:
+                self.videos.pop(path).release()
+        for path in list(self.num_parts):
+            if directory is None or os.path.dirname(path) == directory:
+                del self.num_parts[path]
+
+    def write_video_frame(self, path: str, frame: np.ndarray):
+        frame = _to_bgr_uint8(frame)
+        if path in self.videos:
+            self.videos.move_to_end(path)
+        else:
+            if len(self.videos) >= self.sink.max_open_videos:
+                evicted_path, writer = self.videos.popitem(last=False)
+                writer.release()
+                self.num_parts[evicted_path] = self.num_parts.get(evicted_path, 0) + 1
+            part = self.num_parts.get(path, 0)
+            self.videos[path] = cv2.VideoWriter(
+                f"{os.path.splitext(path)[0]}.{part}.mp4" if part > 0 else path,
+                cv2.VideoWriter_fourcc(*"mp4v"),
+                self.sink.fps,
+                (frame.shape[1], frame.shape[0]),
+            )
+            self.sink.frame_sizes[path] = (frame.shape[1], frame.shape[0])
+        size = self.sink.frame_sizes[path]
+        if (frame.shape[1], frame.shape[0]) != size:
+            frame = cv2.resize(frame, size)
+        self.videos[path].write(frame)
+
+    def run(self):
+        while True:
+            command, path, frame = self.queue.get()
+            if command == _FRAME:
+                self.free_slots.release()
+            try:
+                if command == _STOP:
+                    self.close_videos()
+                    return
+                elif command == _CLOSE_VIDEOS:
+                    self.close_videos(path)
+                elif self.sink.video:
+                    self.write_video_frame(get_video_path(path), frame)
+                else:
+                    cv2.imwrite(path, frame)
+            except Exception as e:
+                print(f"Failed to write frame {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+class FrameSink:
+    """Writes frames in background threads, dropping frames when writing falls behind."""
+
+    def __init__(
+        self,
+        video: bool = False,
+        fps: int = 10,
+        num_workers: int = 2,
+        max_queued_frames: int = 64,
+        max_open_videos: int = 16,
+    ):
+        """
+        video: whether to stream frames into MP4 videos instead of writing PNG images
+        fps: frame rate of videos
+        num_workers: number of threads writing frames; frames of a video are always
+         written by the same thread
+        max_queued_frames: frames waiting to be written per thread, beyond which new
+         frames are dropped
+        max_open_videos: videos open per thread, beyond which the least recently written
+         video is finished; its later frames go to a new part, <name>.1.mp4 etc.
+        """
+        self.video = bool(video)
+        self.fps = fps
+        self.max_open_videos = max_open_videos
+        self.settings = (self.video, fps, num_workers, max_queued_frames)
+        self.frame_sizes: Dict[str, tuple] = {}
+        self.num_written = 0
+        self.num_dropped = 0
+        self._workers = [_Worker(self, max_queued_frames) for _ in range(num_workers)]
+
+    def _get_worker(self, image_path: str) -> _Worker:
+        key = get_video_path(image_path) if self.video else image_path
+        return self._workers[zlib.crc32(key.encode("utf-8")) % len(self._workers)]
+
+    def add_frame(self, image_path: str, frame: np.ndarray) -> bool:
+        """Queues a frame to be written, without waiting. Returns False if the frame was
+        dropped because writing is behind. The frame must not be modified afterwards.
+
+        Arguments:
+            image_path: path of the PNG image of the frame; in video mode, frames are
+             written to the video of get_video_path(image_path)
+            frame: BGR or grayscale image
+        """
+        worker = self._get_worker(image_path)
+        if not worker.free_slots.acquire(blocking=False):
+            self.num_dropped += 1
+            if self.num_dropped % 100 == 1:
+                print(f"Frame sink is behind, dropped {self.num_dropped} frames so far")
+            return False
+        worker.queue.put((_FRAME, image_path, frame))
+        self.num_written += 1
+        return True
+
+    def close_videos(self, directory: Optional[str] = None):
+        """Finishes the videos in a directory (all videos if None) once their queued
+        frames are written, without waiting. Frames added to them afterwards start new
+        videos."""
+        for worker in self._workers:
+            worker.queue.put((_CLOSE_VIDEOS, directory, None))
+
+    def flush(self):
+        """waits until all queued frames are written"""
+        for worker in self._workers:
+            worker.queue.join()
+
+    def close(self):
+        """writes queued frames, finishes videos and stops the threads"""
+        for worker in self._workers:
+            worker.queue.put((_STOP, None, None))
+        for worker in self._workers:
+            worker.thread.join()
+        self._workers = []
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"written": self.num_written, "dropped": self.num_dropped}
+
+
+_frame_sink: Optional[FrameSink] = None
+_frame_sink_lock = threading.Lock()
+
+
+def configure_frame_sink(config=None) -> FrameSink:
+    """Sets the settings of the frame sink of the process from a config with
+    FRAME_SINK.video, fps, num_workers and max_queued_frames (all optional); the sink is
+    only restarted if its settings change."""
+    global _frame_sink
+    sink_config = {} if config is None else (config.get("FRAME_SINK") or {})
+    settings = (
+        bool(sink_config.get("video", False)),
+        sink_config.get("fps", 10),
+        sink_config.get("num_workers", 2),
+        sink_config.get("max_queued_frames", 64),
+    )
+    with _frame_sink_lock:
+        if _frame_sink is not None and _frame_sink.settings != settings:
+            _frame_sink.close()
+            _frame_sink = None
+        if _frame_sink is None:
+            _frame_sink = FrameSink(*settings)
+        return _frame_sink
+
+
+def get_frame_sink() -> FrameSink:
+    """frame sink shared by the visualizers and planners of the process"""
+    with _frame_sink_lock:
+        if _frame_sink is not None:
+            return _frame_sink
+    return configure_frame_sink()
+
+
+@atexit.register
+def _close_frame_sink():
+    if _frame_sink is not None:
+        _frame_sink.close()
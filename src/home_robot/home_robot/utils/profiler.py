@@ -0,0 +1,207 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Lightweight profiler of the stages of agents (perception, mapping, planning...).
+
+Code to profile is wrapped in named spans:
+
+    from home_robot.utils.profiler import profiler
+
+    with profiler.span("mapping"):
+        ...
+
+    @profiler.profile("planning")
+    def plan(...):
+        ...
+
+Spans cost one attribute check while the profiler is disabled, which is the default.
+Once enabled, the durations of spans are recorded until written out as histograms and
+as a trace viewable in chrome://tracing or https://ui.perfetto.dev.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Upper edges of the histogram bins of span durations, in milliseconds
+HISTOGRAM_BINS_MS = [
+    0.1,
+    0.2,
+    0.5,
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1000,
+    2000,
+    5000,
+]
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._synchronize()
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler._synchronize()
+        self.profiler._record(
+            self.name, self.start_ns, time.perf_counter_ns() - self.start_ns
+        )
+        return False
+
+
+class Profiler:
+    """Records the durations of named spans of code."""
+
+    def __init__(self):
+        self.enabled = False
+        self.cuda_sync = False
+        self._durations: Dict[str, List[float]] = defaultdict(list)
+        self._events: List[Dict] = []
+        self._origin_ns = time.perf_counter_ns()
+
+    def enable(self, cuda_sync: bool = True):
+        """Starts recording spans.
+
+        Arguments:
+            cuda_sync: whether to wait for CUDA kernels at the start and end of spans, so
+             that spans measure the GPU work they launch; only has an effect if CUDA is
+             available
+        """
+        self.cuda_sync = False
+        if cuda_sync:
+            import torch
+
+            self.cuda_sync = torch.cuda.is_available()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name: str):
+        """context manager recording the duration of its block under a name"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def profile(self, name: str):
+        """decorator recording the duration of each call of a function under a name"""
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Span(self, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _synchronize(self):
+        if self.cuda_sync:
+            import torch
+
+            torch.cuda.synchronize()
+
+    def _record(self, name: str, start_ns: int, duration_ns: int):
+        # Appending to lists is thread safe
+        self._durations[name].append(duration_ns / 1e6)
+        self._events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start_ns - self._origin_ns) / 1e3,
+                "dur": duration_ns / 1e3,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+        )
+
+    def reset(self):
+        """forgets the spans recorded so far"""
+        self._durations = defaultdict(list)
+        self._events = []
+
+    def get_histograms(self) -> Dict[str, Dict]:
+        """statistics and histogram of the durations of each span, in milliseconds"""
+        histograms = {}
+        for name, durations in sorted(self._durations.items()):
+            durations = np.asarray(durations)
+            counts = np.bincount(
+                np.searchsorted(HISTOGRAM_BINS_MS, durations),
+                minlength=len(HISTOGRAM_BINS_MS) + 1,
+            )
+            histograms[name] = {
+                "count": len(durations),
+                "total_ms": float(durations.sum()),
+                "mean_ms": float(durations.mean()),
+                "p50_ms": float(np.percentile(durations, 50)),
+                "p90_ms": float(np.percentile(durations, 90)),
+                "p99_ms": float(np.percentile(durations, 99)),
+                "max_ms": float(durations.max()),
+                # counts[i] spans took at most bins_ms[i] (last: longer than all bins)
+                "bins_ms": HISTOGRAM_BINS_MS,
+                "counts": counts.tolist(),
+            }
+        return histograms
+
+    def get_chrome_trace(self) -> Dict:
+        """spans in the Chrome trace event format"""
+        return {"traceEvents": list(self._events), "displayTimeUnit": "ms"}
+
+    def write(self, results_dir: str, name: str, chrome_trace: bool = True):
+        """Writes the spans recorded since the last write or reset to
+        <results_dir>/profile/<name>.json (histograms) and <name>.trace.json (Chrome
+        trace), then forgets them."""
+        profile_dir = os.path.join(results_dir, "profile")
+        os.makedirs(profile_dir, exist_ok=True)
+        with open(os.path.join(profile_dir, f"{name}.json"), "w") as f:
+            json.dump(self.get_histograms(), f, indent=4)
+        if chrome_trace:
+            with open(os.path.join(profile_dir, f"{name}.trace.json"), "w") as f:
+                json.dump(self.get_chrome_trace(), f)
+        self.reset()
+
+
+# Profiler shared by the agents and evaluators of the process
+profiler = Profiler()
+
+
+def configure_profiler(config) -> Optional[Profiler]:
+    """Enables the profiler of the process if PROFILER.enabled is set in a config.
+    Returns it if enabled, else None."""
+    profiler_config = config.get("PROFILER") or {}
+    if not profiler_config.get("enabled", False):
+        return None
+    profiler.enable(cuda_sync=profiler_config.get("cuda_sync", True))
+    return profiler
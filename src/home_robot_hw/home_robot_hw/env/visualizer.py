@@ -13,6 +13,8 @@ from PIL import Image
 
 import home_robot.utils.pose as pu
 import home_robot.utils.visualization as vu
+from home_robot.perception.detection.deferred_visualization import get_visualization
+from home_robot.utils.frame_sink import configure_frame_sink, get_frame_sink
 
 map_color_palette = [
     int(x * 255.0)
@@ -80,6 +82,7 @@ class Visualizer:
         self.print_images = config.PRINT_IMAGES
         self.default_vis_dir = f"{config.DUMP_LOCATION}/images/{config.EXP_NAME}"
         os.makedirs(self.default_vis_dir, exist_ok=True)
+        configure_frame_sink(config)
 
         self.num_sem_categories = config.AGENT.SEMANTIC_MAP.num_sem_categories
         self.map_resolution = config.AGENT.SEMANTIC_MAP.map_resolution
@@ -96,6 +99,8 @@ class Visualizer:
         self.show_rl_obs = getattr(config, "SHOW_RL_OBS", False)
 
     def reset(self):
+        if self.vis_dir is not None:
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = self.default_vis_dir
         self.image_vis = None
         self.visited_map_vis = np.zeros(self.map_shape)
@@ -103,6 +108,8 @@ class Visualizer:
 
     def set_vis_dir(self, scene_id: str, episode_id: str):
         self.print_images = True
+        if self.vis_dir is not None:
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = os.path.join(self.default_vis_dir, f"{scene_id}_{episode_id}")
         shutil.rmtree(self.vis_dir, ignore_errors=True)
         os.makedirs(self.vis_dir, exist_ok=True)
@@ -259,7 +266,9 @@ class Visualizer:
             print(self.image_vis.shape, SEMANTIC_MAP_ORIG_X, SEMANTIC_MAP_ORIG_Y, width)
 
         # First-person semantic frame
-        semantic_frame = cv2.cvtColor(semantic_frame, cv2.COLOR_BGR2RGB)
+        semantic_frame = cv2.cvtColor(
+            get_visualization(semantic_frame), cv2.COLOR_BGR2RGB
+        )
         self.image_vis[50:530, 15:375] = cv2.resize(semantic_frame, (360, 480))
 
         if self.show_images:
@@ -267,9 +276,10 @@ class Visualizer:
             cv2.waitKey(1)
 
         if self.print_images:
-            cv2.imwrite(
+            # The visualization image is drawn on in place at the next step
+            get_frame_sink().add_frame(
                 os.path.join(self.vis_dir, "snapshot_{:03d}.png".format(timestep)),
-                self.image_vis,
+                self.image_vis.copy(),
             )
 
     def _init_vis_image(
@@ -348,6 +358,7 @@ class ExplorationVisualizer:
         self.print_images = config.PRINT_IMAGES
         self.default_vis_dir = f"{config.DUMP_LOCATION}/images/{config.EXP_NAME}"
         os.makedirs(self.default_vis_dir, exist_ok=True)
+        configure_frame_sink(config)
 
         self.map_resolution = config.AGENT.SEMANTIC_MAP.map_resolution
         map_size_cm = config.AGENT.SEMANTIC_MAP.map_size_cm
@@ -362,6 +373,8 @@ class ExplorationVisualizer:
         self.last_xy = None
 
     def reset(self):
+        if self.vis_dir is not None:
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = self.default_vis_dir
         self.image_vis = None
         self.visited_map_vis = np.zeros(self.map_shape)
@@ -369,6 +382,8 @@ class ExplorationVisualizer:
 
     def set_vis_dir(self, scene_id: str, episode_id: str):
         self.print_images = True
+        if self.vis_dir is not None:
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = os.path.join(self.default_vis_dir, f"{scene_id}_{episode_id}")
         shutil.rmtree(self.vis_dir, ignore_errors=True)
         os.makedirs(self.vis_dir, exist_ok=True)
@@ -487,9 +502,10 @@ class ExplorationVisualizer:
             cv2.waitKey(1)
 
         if self.print_images:
-            cv2.imwrite(
+            # The visualization image is drawn on in place at the next step
+            get_frame_sink().add_frame(
                 os.path.join(self.vis_dir, "snapshot_{:03d}.png".format(timestep)),
-                self.image_vis,
+                self.image_vis.copy(),
             )
 
     def _init_vis_image(self, goal_name: str):
@@ -107,6 +107,19 @@ class StretchManipulationClient(AbstractControlModule):
 
         return True
 
+    @enforce_enabled
+    def goto_trajectory(self, trajectory, dt: Optional[float] = 0.1, wait=True):
+        """Execute a list of generalized coordinates as a single timed trajectory, so that the
+        robot does not stop at every waypoint. The base is not moved.
+        """
+        self._ros_client.goto_trajectory(trajectory, dt=dt, wait=False)
+
+        self._register_wait(self._ros_client.wait_for_trajectory_action)
+        if wait:
+            self.wait()
+
+        return True
+
     @enforce_enabled
     def home(self):
         self.goto(STRETCH_HOME_Q, wait=True)
@@ -20,7 +20,16 @@ from std_msgs.msg import Bool, String
 from std_srvs.srv import SetBool, SetBoolRequest, Trigger, TriggerRequest
 from trajectory_msgs.msg import JointTrajectoryPoint
 
-from home_robot.motion.stretch import STRETCH_HEAD_CAMERA_ROTATIONS, HelloStretchIdx
+from home_robot.motion.stretch import (
+    STRETCH_HEAD_CAMERA_ROTATIONS,
+    STRETCH_MAX_JOINT_ACCELERATION,
+    STRETCH_MAX_JOINT_VELOCITY,
+    HelloStretchIdx,
+)
+from home_robot.motion.time_parameterization import (
+    TrapezoidalTimeParameterization,
+    get_waypoints,
+)
 from home_robot.utils.pose import to_matrix
 from home_robot_hw.constants import (
     CONFIG_TO_ROS,
@@ -85,6 +94,11 @@ class StretchRosInterface:
         self.se3_camera_pose: Optional[sp.SE3] = None
         self.at_goal: bool = False
 
+        # Timing of multi-waypoint trajectories
+        self.time_parameterization = TrapezoidalTimeParameterization(
+            STRETCH_MAX_JOINT_VELOCITY, STRETCH_MAX_JOINT_ACCELERATION
+        )
+
         self.last_odom_update_timestamp = rospy.Time(0)
         self.last_base_update_timestamp = rospy.Time(0)
         self._goal_reset_t = rospy.Time(0)
@@ -188,6 +202,22 @@ class StretchRosInterface:
         trajectory_goal.trajectory.header.stamp = rospy.Time.now()
         return trajectory_goal
 
+    def trajectory_to_ros_trajectory_goal(
+        self, times: np.ndarray, qs: np.ndarray, dqs: Optional[np.ndarray] = None
+    ) -> FollowJointTrajectoryGoal:
+        """Create a single joint trajectory goal from a timed sequence of configurations."""
+        trajectory_goal = FollowJointTrajectoryGoal()
+        trajectory_goal.goal_time_tolerance = rospy.Time(self.goal_time_tolerance)
+        trajectory_goal.trajectory.joint_names = self.ros_joint_names
+        points = []
+        for i, (t, q) in enumerate(zip(times, qs)):
+            msg = self._config_to_ros_msg(q, None if dqs is None else dqs[i])
+            msg.time_from_start = rospy.Duration(float(t))
+            points.append(msg)
+        trajectory_goal.trajectory.points = points
+        trajectory_goal.trajectory.header.stamp = rospy.Time.now()
+        return trajectory_goal
+
     # Helper functions
 
     def _create_services(self):
@@ -304,14 +334,12 @@ class StretchRosInterface:
             names = CONFIG_TO_ROS[i]
             for _ in names:
                 # Only for arm - but this is a dumb way to check
-                if "arm" in names[0]:
-                    msg.positions[idx] = q[i] / len(names)
-                else:
-                    msg.positions[idx] = q[i]
+                scale = 1.0 / len(names) if "arm" in names[0] else 1.0
+                msg.positions[idx] = q[i] * scale
                 if dq is not None:
-                    msg.velocities[idx] = dq[i]
+                    msg.velocities[idx] = dq[i] * scale
                 if ddq is not None:
-                    msg.accelerations[idx] = ddq[i]
+                    msg.accelerations[idx] = ddq[i] * scale
                 idx += 1
         return msg
 
@@ -563,3 +591,26 @@ class StretchRosInterface:
         if wait:
             self.trajectory_client.wait_for_result()
         return True
+
+    def goto_trajectory(self, trajectory, dt: Optional[float] = 0.1, wait=False):
+        """Execute a list of waypoints (or the output of robot interpolation) as a single timed
+        trajectory, without stopping at every waypoint. Base joints are not moved.
+
+        dt: resampling period of the trajectory; None sends the waypoints themselves"""
+        waypoints = get_waypoints(trajectory)
+        if len(waypoints) == 0:
+            return False
+        # Start from the current state so that the first segment is timed correctly
+        q0 = self.get_joint_state()[0].copy()
+        waypoints = [q0] + waypoints
+        for q in waypoints:
+            q[:3] = q0[:3]
+        times, qs, dqs = self.time_parameterization.parameterize(waypoints, dt=dt)
+        if len(times) < 2:
+            # Already at the goal
+            return True
+        goal = self.trajectory_to_ros_trajectory_goal(times, qs, dqs)
+        self.trajectory_client.send_goal(goal)
+        if wait:
+            self.trajectory_client.wait_for_result()
+        return True
@@ -21,6 +21,8 @@ from home_robot.perception.constants import (
 )
 from home_robot.perception.constants import PaletteIndices as PI
 from home_robot.perception.constants import RearrangeDETICCategories
+from home_robot.perception.detection.deferred_visualization import get_visualization
+from home_robot.utils.frame_sink import configure_frame_sink, get_frame_sink
 
 
 class VIS_LAYOUT:
@@ -61,6 +63,8 @@ class Visualizer:
         self.default_vis_dir = f"{config.DUMP_LOCATION}/images/{config.EXP_NAME}"
         self._dataset = dataset
         os.makedirs(self.default_vis_dir, exist_ok=True)
+        # Images are written in the background, optionally as videos
+        configure_frame_sink(config)
         if hasattr(config, "habitat"):  # hydra configs
             self.episodes_data_path = config.habitat.dataset.data_path
         else:
@@ -155,6 +159,8 @@ class Visualizer:
         self.show_rl_obs = getattr(config, "SHOW_RL_OBS", False)
 
     def reset(self):
+        if self.vis_dir is not None:
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = self.default_vis_dir
         self.image_vis = None
         self.visited_map_vis = np.zeros(self.map_shape)
@@ -162,6 +168,9 @@ class Visualizer:
 
     def set_vis_dir(self, scene_id: str, episode_id: str):
         self.print_images = True
+        if self.vis_dir is not None:
+            # Finish the videos of the previous episode
+            get_frame_sink().close_videos(self.vis_dir)
         self.vis_dir = os.path.join(self.default_vis_dir, f"{scene_id}_{episode_id}")
         shutil.rmtree(self.vis_dir, ignore_errors=True)
         os.makedirs(self.vis_dir, exist_ok=True)
@@ -392,6 +401,7 @@ class Visualizer:
             )
 
         # First-person RGB frame
+        semantic_frame = get_visualization(semantic_frame)
         if semantic_frame is not None:
             rgb_frame = semantic_frame[:, :, [2, 1, 0]]
             image_vis[V.Y1 : V.Y2, V.FIRST_RGB_X1 : V.FIRST_RGB_X2] = cv2.resize(
@@ -413,7 +423,7 @@ class Visualizer:
             cv2.imshow("Visualization", image_vis)
             cv2.waitKey(1)
         if self.print_images:
-            cv2.imwrite(
+            get_frame_sink().add_frame(
                 os.path.join(self.vis_dir, "snapshot_{:03d}.png".format(timestep)),
                 image_vis,
             )
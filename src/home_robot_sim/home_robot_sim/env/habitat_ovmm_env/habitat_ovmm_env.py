@@ -5,11 +5,10 @@
 
 
 from enum import IntEnum
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import habitat
 import numpy as np
-import torch
 from habitat.core.environments import GymHabitatEnv
 from habitat.core.simulator import Observations
 
@@ -34,6 +33,9 @@ from home_robot.utils.constants import (
 from home_robot_sim.env.habitat_abstract_env import HabitatEnv
 from home_robot_sim.env.habitat_objectnav_env.visualizer import Visualizer
 
+# Ground-truth semantic frames hold receptacle categories, which fit in 16 bits
+SEMANTIC_DTYPE = np.int16
+
 
 class SimJointActionIndex(IntEnum):
     """
@@ -97,6 +99,8 @@ class HabitatOpenVocabManipEnv(HabitatEnv):
         }
 
         self._last_habitat_obs = None
+        # Intermediate arrays of observation preprocessing, kept across steps
+        self._buffers: Dict[str, np.ndarray] = {}
 
     def get_current_episode(self):
         if isinstance(self.habitat_env, GymHabitatEnv):
@@ -120,72 +124,125 @@ class HabitatOpenVocabManipEnv(HabitatEnv):
 
     def convert_pose_to_real_world_axis(self, hab_pose):
         """Update axis convention of habitat pose to match the real-world axis convention"""
-        hab_pose[[0, 1, 2]] = hab_pose[[2, 0, 1]]
-        hab_pose[:, [0, 1, 2]] = hab_pose[:, [2, 0, 1]]
+        # Rows and columns (x, y, z) become (z, x, y), as one gather
+        axes = [2, 0, 1] + list(range(3, hab_pose.shape[0]))
+        hab_pose[...] = hab_pose[np.ix_(axes, axes)]
         return hab_pose
 
     def _preprocess_xy(self, xy: np.array) -> np.array:
         """Translate Habitat navigation (x, y) (i.e., GPS sensor) into robot (x, y)."""
         return np.array([xy[1], xy[0]])
 
+    def _get_buffer(
+        self, name: str, shape: Tuple[int, ...], dtype: np.dtype
+    ) -> np.ndarray:
+        """array kept across steps for intermediate results, reallocated only when the
+        frame size changes"""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    @staticmethod
+    def _stack(frames: Sequence[np.ndarray]) -> np.ndarray:
+        """frames of several environments stacked along a new first dimension, without
+        copy for a single environment"""
+        if len(frames) == 1:
+            return np.asarray(frames[0])[np.newaxis]
+        return np.stack(frames)
+
     def _preprocess_obs(
         self, habitat_obs: habitat.core.simulator.Observations
     ) -> home_robot.core.interfaces.Observations:
-        depth = self._preprocess_depth(habitat_obs["robot_head_depth"])
-
-        if self.visualize and "robot_third_rgb" in habitat_obs:
-            third_person_image = habitat_obs["robot_third_rgb"]
-        else:
-            third_person_image = None
-
-        obs = home_robot.core.interfaces.Observations(
-            rgb=habitat_obs["robot_head_rgb"],
-            depth=depth,
-            compass=habitat_obs["robot_start_compass"],
-            gps=self._preprocess_xy(habitat_obs["robot_start_gps"]),
-            task_observations={
-                "object_embedding": habitat_obs["object_embedding"],
-                "start_receptacle": habitat_obs["start_receptacle"],
-                "goal_receptacle": habitat_obs["goal_receptacle"],
-                "prev_grasp_success": habitat_obs["is_holding"],
-            },
-            joint=habitat_obs["joint"],
-            relative_resting_position=habitat_obs["relative_resting_position"],
-            third_person_image=third_person_image,
-            camera_pose=self.convert_pose_to_real_world_axis(
-                np.asarray(habitat_obs["camera_pose"])
-            ),
+        return self._preprocess_obs_batch([habitat_obs])[0]
+
+    def _preprocess_obs_batch(
+        self, habitat_obs_list: Sequence[habitat.core.simulator.Observations]
+    ) -> List[home_robot.core.interfaces.Observations]:
+        """_preprocess_obs for the observations of several environments (e.g. of a
+        batched simulator): depth and semantic frames are preprocessed together."""
+        depth = self._preprocess_depth(
+            self._stack([obs["robot_head_depth"] for obs in habitat_obs_list])
         )
-        obs = self._preprocess_goal(obs, habitat_obs)
-        obs = self._preprocess_semantic(obs, habitat_obs)
-        return obs
-
-    def _preprocess_semantic(
-        self, obs: home_robot.core.interfaces.Observations, habitat_obs
-    ) -> home_robot.core.interfaces.Observations:
+        semantic = None
         if self.ground_truth_semantics:
-            semantic = torch.from_numpy(
-                habitat_obs["object_segmentation"].squeeze(-1).astype(np.int64)
-            )
-            recep_seg = torch.from_numpy(
-                habitat_obs["receptacle_segmentation"].squeeze(-1).astype(np.int64)
+            semantic = self._preprocess_semantic(
+                self._stack([obs["object_segmentation"] for obs in habitat_obs_list]),
+                self._stack(
+                    [obs["receptacle_segmentation"] for obs in habitat_obs_list]
+                ),
             )
 
-            recep_seg[recep_seg != 0] += 1
-            semantic = semantic + recep_seg
-            semantic[semantic == 0] = len(self._rec_id_to_name_mapping) + 2
-            obs.semantic = semantic.numpy()
-            obs.task_observations["recep_idx"] = 2
-            obs.task_observations["semantic_max_val"] = (
-                len(self._rec_id_to_name_mapping) + 2
+        obs_list = []
+        for i, habitat_obs in enumerate(habitat_obs_list):
+            if self.visualize and "robot_third_rgb" in habitat_obs:
+                third_person_image = habitat_obs["robot_third_rgb"]
+            else:
+                third_person_image = None
+
+            obs = home_robot.core.interfaces.Observations(
+                rgb=habitat_obs["robot_head_rgb"],
+                depth=depth[i],
+                compass=habitat_obs["robot_start_compass"],
+                gps=self._preprocess_xy(habitat_obs["robot_start_gps"]),
+                task_observations={
+                    "object_embedding": habitat_obs["object_embedding"],
+                    "start_receptacle": habitat_obs["start_receptacle"],
+                    "goal_receptacle": habitat_obs["goal_receptacle"],
+                    "prev_grasp_success": habitat_obs["is_holding"],
+                },
+                joint=habitat_obs["joint"],
+                relative_resting_position=habitat_obs["relative_resting_position"],
+                third_person_image=third_person_image,
+                camera_pose=self.convert_pose_to_real_world_axis(
+                    np.array(habitat_obs["camera_pose"])
+                ),
             )
-        return obs
+            obs = self._preprocess_goal(obs, habitat_obs)
+            if semantic is not None:
+                obs.semantic = semantic[i]
+                obs.task_observations["recep_idx"] = 2
+                obs.task_observations["semantic_max_val"] = (
+                    len(self._rec_id_to_name_mapping) + 2
+                )
+            obs_list.append(obs)
+        return obs_list
+
+    def _preprocess_semantic(
+        self, object_segmentation: np.ndarray, receptacle_segmentation: np.ndarray
+    ) -> np.ndarray:
+        """Ground-truth semantic frames (..., H, W) from object and receptacle
+        segmentations (..., H, W, 1): 1 for the goal object, receptacle category + 2 for
+        receptacles, and len(receptacle categories) + 2 for the background."""
+        object_segmentation = object_segmentation[..., 0]
+        receptacle_segmentation = receptacle_segmentation[..., 0]
+        # New array at each step, since agents can keep observations
+        semantic = receptacle_segmentation.astype(SEMANTIC_DTYPE)
+        is_receptacle = self._get_buffer("is_receptacle", semantic.shape, bool)
+        np.not_equal(receptacle_segmentation, 0, out=is_receptacle)
+        np.add(semantic, 1, out=semantic, where=is_receptacle)
+        np.add(semantic, object_segmentation, out=semantic, casting="unsafe")
+        is_background = np.equal(semantic, 0, out=is_receptacle)
+        semantic[is_background] = len(self._rec_id_to_name_mapping) + 2
+        return semantic
 
     def _preprocess_depth(self, depth: np.array) -> np.array:
-        rescaled_depth = self.min_depth + depth * (self.max_depth - self.min_depth)
-        rescaled_depth[depth == 0.0] = MIN_DEPTH_REPLACEMENT_VALUE
-        rescaled_depth[depth == 1.0] = MAX_DEPTH_REPLACEMENT_VALUE
-        return rescaled_depth[:, :, -1]
+        """Depth frames (..., H, W) in meters from normalized depth frames (..., H, W, 1).
+
+        Frames are rescaled in place, keeping their dtype: habitat returns new frames at
+        each step."""
+        if not depth.flags.writeable:
+            depth = depth.copy()
+        too_close = self._get_buffer("too_close", depth.shape, bool)
+        too_far = self._get_buffer("too_far", depth.shape, bool)
+        np.equal(depth, 0.0, out=too_close)
+        np.equal(depth, 1.0, out=too_far)
+        depth *= self.max_depth - self.min_depth
+        depth += self.min_depth
+        depth[too_close] = MIN_DEPTH_REPLACEMENT_VALUE
+        depth[too_far] = MAX_DEPTH_REPLACEMENT_VALUE
+        return depth[..., -1]
 
     def _preprocess_goal(
         self, obs: home_robot.core.interfaces.Observations, habitat_obs: Observations
@@ -0,0 +1,142 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from omegaconf import OmegaConf
+
+pytest.importorskip("habitat_baselines")
+pytest.importorskip("detectron2")
+pytest.importorskip("skfmm")
+
+from home_robot.agent.ovmm_agent.ovmm_agent import OpenVocabManipAgent  # noqa: E402
+from home_robot.core.interfaces import Observations  # noqa: E402
+
+CONFIG_PATH = (
+    Path(__file__).resolve().parents[3]
+    / "projects/habitat_ovmm/configs/agent/hssd_eval.yaml"
+)
+NUM_ENVIRONMENTS = 3
+HEIGHT, WIDTH = 64, 48
+
+
+def make_config(num_environments: int):
+    """OVMM evaluation config with ground-truth semantics, heuristic navigation and
+    oracle pick and hardcoded place, on a small map"""
+    config = OmegaConf.load(CONFIG_PATH)
+    config.NUM_ENVIRONMENTS = num_environments
+    config.NO_GPU = 1
+    config.GROUND_TRUTH_SEMANTICS = 1
+    config.VISUALIZE = 0
+    config.PRINT_IMAGES = 0
+    config.ENVIRONMENT.frame_height = HEIGHT
+    config.ENVIRONMENT.frame_width = WIDTH
+    # Poses don't follow actions: goals only need to be roughly in front to stop
+    config.ENVIRONMENT.turn_angle = 30.0
+    config.AGENT.panorama_start = 0
+    config.AGENT.fall_wait_steps = 2
+    config.AGENT.SEMANTIC_MAP.map_size_cm = 2400
+    # Project every pixel of the small frames
+    config.AGENT.SEMANTIC_MAP.du_scale = 1
+    config.AGENT.SKILLS.PLACE.type = "hardcoded"
+    return config
+
+
+def make_episode(e: int, episode: int):
+    return SimpleNamespace(scene_id=f"data/scene_{e}.glb", episode_id=str(episode))
+
+
+def make_obs(e: int, t: int) -> Observations:
+    """Observation of environment e at step t: the goal object and receptacles appear
+    right in front of the robot after delays that depend on the environment, so that
+    environments run different skills at the same step"""
+    rng = np.random.RandomState(100 * e + t)
+    depth = rng.uniform(1.0, 3.0, (HEIGHT, WIDTH)).astype(np.float32)
+    semantic = np.full((HEIGHT, WIDTH), 23, dtype=np.int16)
+    center = slice(WIDTH // 3, 2 * WIDTH // 3)
+    if t >= 2 * e:
+        # The goal object lies on its start receptacle
+        semantic[HEIGHT // 2 : 5 * HEIGHT // 8, center] = 1
+        semantic[5 * HEIGHT // 8 : 3 * HEIGHT // 4, center] = 3
+        depth[HEIGHT // 2 : 3 * HEIGHT // 4, center] = 0.3
+    if t >= 2 * e + 8:
+        semantic[3 * HEIGHT // 4 :, center] = 5
+        depth[3 * HEIGHT // 4 :, center] = 0.3
+    return Observations(
+        gps=np.array([0.1 * e, 0.0]),
+        compass=np.array([0.0]),
+        rgb=rng.randint(0, 255, (HEIGHT, WIDTH, 3)).astype(np.uint8),
+        depth=depth,
+        semantic=semantic,
+        task_observations={
+            "goal_name": "Move cup from table to chair",
+            "object_name": "cup",
+            "start_recep_name": "table",
+            "place_recep_name": "chair",
+            "object_goal": 1,
+            "start_recep_goal": 3,
+            "end_recep_goal": 5,
+            "recep_idx": 2,
+            "semantic_max_val": 23,
+            "prev_grasp_success": np.array([0.0]),
+        },
+    )
+
+
+def check_same_step(output, expected_output, e):
+    action, info, _ = output
+    expected_action, expected_info, _ = expected_output
+    assert action == expected_action, e
+    for k in ["curr_skill", "skill_done", "timestep"]:
+        assert info[k] == expected_info[k], (e, k)
+
+
+def test_act_vectorized_matches_single_env_agents():
+    torch.manual_seed(0)
+    agent = OpenVocabManipAgent(make_config(NUM_ENVIRONMENTS))
+    agent.reset_vectorized([make_episode(e, 0) for e in range(NUM_ENVIRONMENTS)])
+    single_agents = []
+    for e in range(NUM_ENVIRONMENTS):
+        single_agent = OpenVocabManipAgent(make_config(1))
+        single_agent.reset_vectorized([make_episode(e, 0)])
+        single_agents.append(single_agent)
+
+    skills = set()
+    env_steps = [0] * NUM_ENVIRONMENTS
+    for step in range(30):
+        # Act in a subset of environments every third step, in a shuffled order
+        env_ids = [2, 0] if step % 3 == 1 else list(range(NUM_ENVIRONMENTS))
+        if step == 15:
+            # A new episode starts in one environment only
+            agent.reset_vectorized_for_env(1, make_episode(1, 1))
+            single_agents[1].reset_vectorized([make_episode(1, 1)])
+            env_steps[1] = 0
+
+        obs_list = [make_obs(e, env_steps[e]) for e in env_ids]
+        if env_ids == list(range(NUM_ENVIRONMENTS)):
+            outputs = agent.act_vectorized(obs_list)
+        else:
+            outputs = agent.act_vectorized(obs_list, env_ids)
+        for e, output in zip(env_ids, outputs):
+            expected_output = single_agents[e].act(make_obs(e, env_steps[e]))
+            check_same_step(output, expected_output, e)
+            skills.add(output[1]["curr_skill"])
+            env_steps[e] += 1
+
+        for e in range(NUM_ENVIRONMENTS):
+            single_agent = single_agents[e]
+            assert agent.states[e] == single_agent.states[0]
+            assert agent.timesteps[e] == single_agent.timesteps[0]
+            assert torch.allclose(
+                agent.semantic_map.global_map[e],
+                single_agent.semantic_map.global_map[0],
+                atol=1e-5,
+            )
+
+    # Environments went through navigation and manipulation skills
+    assert {"NAV_TO_OBJ", "PICK", "NAV_TO_REC", "PLACE", "FALL_WAIT"} <= skills
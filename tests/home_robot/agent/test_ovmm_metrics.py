@@ -0,0 +1,97 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import sys
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("habitat_baselines")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "projects/habitat_ovmm"))
+from evaluator import OVMMEvaluator  # noqa: E402
+from utils.metrics_utils import (  # noqa: E402
+    StreamingMetrics,
+    get_stats_from_episode_metrics,
+)
+
+PHASES = ["find_object", "pick_object", "find_recep", "place_object"]
+
+
+def make_episode_metrics(
+    place_success: float, phase_successes: list, collisions: float, **metrics
+) -> dict:
+    episode_metrics = {
+        "END.ovmm_place_success": place_success,
+        "END.robot_collisions.robot_scene_colls": collisions,
+        "goal_name": "Move cup from table to chair",
+        **{
+            f"END.ovmm_{phase}_phase_success": success
+            for phase, success in zip(PHASES, phase_successes)
+        },
+    }
+    episode_metrics.update(metrics)
+    return episode_metrics
+
+
+@pytest.fixture
+def episode_metrics():
+    """Metrics of synthetic episodes, with skill-prefixed metrics and metrics missing
+    in some episodes"""
+    return {
+        "scene1_0": make_episode_metrics(
+            1.0,
+            [1.0, 1.0, 1.0, 1.0],
+            0.0,
+            **{
+                "END.does_want_terminate": 1.0,
+                "END.num_steps": 120.0,
+                "NAV_TO_OBJ.ovmm_dist_to_pick_goal": 0.4,
+                "NAV_TO_OBJ.ovmm_find_object_phase_success": 1.0,
+                "PICK.ovmm_pick_object_phase_success": 1.0,
+            },
+        ),
+        "scene1_1": make_episode_metrics(
+            1.0,
+            [1.0, 1.0, 1.0, 1.0],
+            3.0,
+            **{
+                "END.does_want_terminate": 0.0,
+                "END.num_steps": 300.0,
+                "NAV_TO_OBJ.ovmm_dist_to_pick_goal": 1.5,
+            },
+        ),
+        "scene2_4": make_episode_metrics(
+            0.0,
+            [1.0, 0.0],
+            0.0,
+            **{
+                "END.num_steps": 80.0,
+                "NAV_TO_OBJ.ovmm_find_object_phase_success": 1.0,
+            },
+        ),
+        "scene3_2": make_episode_metrics(
+            0.0,
+            [0.0, 0.0, 0.0, 0.0],
+            1.0,
+            **{"END.does_want_terminate": 1.0, "END.num_steps": 500.0},
+        ),
+    }
+
+
+def test_streaming_metrics(episode_metrics):
+    streaming_metrics = StreamingMetrics()
+    for metrics in episode_metrics.values():
+        streaming_metrics.add_episode(metrics)
+    assert streaming_metrics.num_episodes == len(episode_metrics)
+
+    expected_aggregate = OVMMEvaluator._aggregate_metrics(None, episode_metrics)
+    assert streaming_metrics.aggregate() == pytest.approx(expected_aggregate)
+    assert list(streaming_metrics.aggregate()) == list(expected_aggregate)
+
+    episode_metrics_df = pd.DataFrame.from_dict(episode_metrics, orient="index")
+    episode_metrics_df["start_idx"] = 0
+    expected_stats = get_stats_from_episode_metrics(episode_metrics_df)
+    assert streaming_metrics.summarize() == pytest.approx(expected_stats)
@@ -0,0 +1,157 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("habitat_baselines")
+
+from home_robot.agent.ovmm_agent.ppo_agent import PPOAgent  # noqa: E402
+from home_robot.core.interfaces import Observations  # noqa: E402
+from home_robot.utils.constants import (  # noqa: E402
+    MAX_DEPTH_REPLACEMENT_VALUE,
+    MIN_DEPTH_REPLACEMENT_VALUE,
+)
+
+SKILL_OBS_KEYS = [
+    "robot_head_depth",
+    "object_segmentation",
+    "goal_recep_segmentation",
+    "ovmm_nav_goal_segmentation",
+    "receptacle_segmentation",
+    "object_embedding",
+    "joint",
+    "relative_resting_position",
+    "is_holding",
+    "robot_start_gps",
+    "robot_start_compass",
+    "start_receptacle",
+    "goal_receptacle",
+]
+
+
+def make_agent(nav_goal_seg_channels: int, num_environments: int = 3) -> PPOAgent:
+    """agent with only the attributes used to build observations of the policy"""
+    agent = PPOAgent.__new__(PPOAgent)
+    agent.config = SimpleNamespace(
+        ENVIRONMENT=SimpleNamespace(min_depth=0.5, max_depth=5.0)
+    )
+    agent.device = torch.device("cpu")
+    agent.num_environments = num_environments
+    agent.nav_goal_seg_channels = nav_goal_seg_channels
+    agent.skill_obs_keys = SKILL_OBS_KEYS
+    agent.skill_start_gps = [np.array([0.1 * e, -0.2]) for e in range(num_environments)]
+    agent.skill_start_compass = [np.array([0.3 * e]) for e in range(num_environments)]
+    agent._buffers = {}
+    return agent
+
+
+def make_obs(seed: int) -> Observations:
+    rng = np.random.RandomState(seed)
+    depth = rng.uniform(0.0, 7.0, (6, 8)).astype(np.float32)
+    depth[0, :3] = MIN_DEPTH_REPLACEMENT_VALUE
+    depth[1, :3] = MAX_DEPTH_REPLACEMENT_VALUE
+    return Observations(
+        gps=rng.randn(2),
+        compass=rng.randn(1),
+        rgb=None,
+        depth=depth,
+        semantic=rng.randint(0, 10, (6, 8)),
+        joint=rng.randn(10).astype(np.float32),
+        relative_resting_position=rng.randn(3).astype(np.float32),
+        task_observations={
+            "object_goal": 1,
+            "end_recep_goal": 5,
+            "start_recep_goal": 4,
+            "recep_idx": 2,
+            "semantic_max_val": 9,
+            "object_embedding": rng.randn(4).astype(np.float32),
+            "prev_grasp_success": np.array([seed % 2]),
+            "start_receptacle": np.array([3]),
+            "goal_receptacle": np.array([6]),
+        },
+    )
+
+
+@pytest.mark.parametrize("nav_goal_seg_channels", [1, 2])
+def test_habitat_obs_batch(nav_goal_seg_channels):
+    agent = make_agent(nav_goal_seg_channels)
+    env_ids = [2, 0]
+    obs_list = [make_obs(seed) for seed in range(len(env_ids))]
+    expected = [
+        agent.convert_to_habitat_obs_space(obs, e) for e, obs in zip(env_ids, obs_list)
+    ]
+    # Twice, as device buffers are reused across steps
+    for _ in range(2):
+        batch = agent._get_habitat_obs_batch(obs_list, env_ids)
+    assert sorted(batch) == sorted(SKILL_OBS_KEYS)
+    for k in SKILL_OBS_KEYS:
+        expected_k = torch.as_tensor(np.stack([np.asarray(obs[k]) for obs in expected]))
+        assert batch[k].shape == expected_k.shape, k
+        assert batch[k].dtype == expected_k.dtype, k
+        assert torch.allclose(batch[k].double(), expected_k.double(), atol=1e-6), k
+    assert batch["ovmm_nav_goal_segmentation"].shape[-1] == nav_goal_seg_channels
+
+
+class DeterministicActorCritic:
+    """recurrent policy whose outputs only depend on the row of each environment"""
+
+    num_recurrent_layers = 2
+
+    def act(self, batch, hidden_states, prev_actions, masks, deterministic=False):
+        features = sum(v.double().flatten(1).mean(1) for v in batch.values()).float()
+        hidden_states = (
+            0.5 * hidden_states * masks.view(-1, 1, 1)
+            + features.view(-1, 1, 1)
+            + prev_actions.view(-1, 1, 1)
+        )
+        actions = (hidden_states[:, 0, :1] * 10).long().remainder(4)
+        return None, actions, None, hidden_states
+
+
+def make_acting_agent(num_environments: int) -> PPOAgent:
+    """agent with a discrete recurrent policy, without observation transforms"""
+    agent = make_agent(nav_goal_seg_channels=1, num_environments=num_environments)
+    agent.actor_critic = DeterministicActorCritic()
+    agent.hidden_size = 3
+    agent.continuous_actions = False
+    agent.actions_dim = 1
+    agent.obs_transforms = []
+    agent.show_rl_obs = False
+    agent.skill_actions = ["stop", "move_forward", "turn_left", "turn_right"]
+    agent.terminate_condition = "discrete_stop"
+    agent.reset_vectorized()
+    return agent
+
+
+def test_act_vectorized_matches_single_env_agents():
+    agent = make_acting_agent(num_environments=3)
+    single_agents = [make_acting_agent(num_environments=1) for _ in range(3)]
+    # Environments act together, in subsets in any order, and restart separately
+    for step, env_ids in enumerate([[0, 1, 2], [2, 0], [1], [0, 2], [2, 1], [0, 1, 2]]):
+        if step == 3:
+            agent.reset_vectorized_for_env(1)
+            single_agents[1].reset_vectorized()
+        obs_list = [make_obs(10 * step + e) for e in env_ids]
+        outputs = agent.act_vectorized(obs_list, [{} for _ in env_ids], env_ids)
+        for e, (action, _, terminate) in zip(env_ids, outputs):
+            expected_action, _, expected_terminate = single_agents[e].act(
+                make_obs(10 * step + e), {}
+            )
+            assert action == expected_action, (step, e)
+            assert terminate == expected_terminate, (step, e)
+
+        for e, single_agent in enumerate(single_agents):
+            assert torch.equal(
+                agent.test_recurrent_hidden_states[e],
+                single_agent.test_recurrent_hidden_states[0],
+            )
+            assert torch.equal(agent.prev_actions[e], single_agent.prev_actions[0])
+            assert torch.equal(agent.not_done_masks[e], single_agent.not_done_masks[0])
+            assert np.array_equal(
+                agent.skill_start_gps[e], single_agent.skill_start_gps[0]
+            )
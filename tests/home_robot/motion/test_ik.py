@@ -8,7 +8,9 @@ import numpy as np
 import pytest
 from scipy.spatial.transform import Rotation as R
 
-from home_robot.motion.pinocchio_ik_solver import PositionIKOptimizer
+from home_robot.motion.analytic_ik_solver import StretchAnalyticIKSolver
+from home_robot.motion.ik_solver_base import IKSolverBase
+from home_robot.motion.pinocchio_ik_solver import CEM, PositionIKOptimizer
 from home_robot.motion.stretch import (
     STRETCH_GRASP_OFFSET,
     STRETCH_HOME_Q,
@@ -121,6 +123,15 @@ def pin_robot():
     )
 
 
+@pytest.fixture
+def analytic_robot():
+    return HelloStretchKinematics(
+        urdf_path=URDF_ABS_PATH,
+        visualize=DEBUG,
+        ik_type="analytic",
+    )
+
+
 @pytest.fixture
 def pin_optimize_robot():
     return HelloStretchKinematics(
@@ -158,13 +169,28 @@ def pin_ik_optimizer(pin_robot):
 
 
 @pytest.fixture(
-    params=["pybullet", "pinocchio", "pybullet_optimize", "pinocchio_optimize"]
+    params=[
+        "pybullet",
+        "pinocchio",
+        "analytic",
+        "pybullet_optimize",
+        "pinocchio_optimize",
+    ]
 )
-def robot(request, pb_robot, pin_robot, pb_optimize_robot, pin_optimize_robot):
+def robot(
+    request,
+    pb_robot,
+    pin_robot,
+    analytic_robot,
+    pb_optimize_robot,
+    pin_optimize_robot,
+):
     if request.param == "pybullet":
         return pb_robot
     elif request.param == "pinocchio":
         return pin_robot
+    elif request.param == "analytic":
+        return analytic_robot
     elif request.param == "pybullet_optimize":
         return pb_optimize_robot
     elif request.param == "pinocchio_optimize":
@@ -342,6 +368,131 @@ def test_pybullet_ik_optimization(pb_robot, pb_ik_optimizer, test_pose):
     assert success
 
 
+def test_analytic_ik_solutions(analytic_robot):
+    solver = analytic_robot.manip_ik_solver
+    assert isinstance(solver, StretchAnalyticIKSolver)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        q = rng.uniform(solver._lower, solver._upper)
+        q[0] = rng.uniform(-1.0, 1.0)
+        q[2:6] = q[2]  # telescoping arm joints share the extension
+        pos, quat = solver.compute_fk(q)
+
+        solutions = solver.compute_all_ik(pos, quat)
+        assert any(np.allclose(sol, q, atol=1e-6) for sol in solutions)
+        for sol in solutions:
+            pos_out, quat_out = solver.compute_fk(sol)
+            assert compute_err(pos_out, pos) < POS_ERROR_TOL
+            assert quaternion_distance(quat_out, quat) < ORI_ERROR_TOL
+
+        # Closest solution to the initial configuration is returned
+        q_out, success, debug_info = solver.compute_ik(pos, quat, q_init=q)
+        assert success and debug_info["analytic"]
+        assert np.allclose(q_out, q, atol=1e-6)
+
+
+def test_ik_cache(test_pose):
+    robot = HelloStretchKinematics(
+        urdf_path=URDF_ABS_PATH,
+        visualize=DEBUG,
+        ik_type="pinocchio",
+        ik_cache_size=4,
+    )
+    pos, quat = test_pose
+    q1, success1, _ = robot.manip_ik((pos, quat), q0=None)
+    # Nearly identical query hits the cache
+    q2, success2, _ = robot.manip_ik((pos + 1e-5, quat), q0=None)
+    assert success1 and success2
+    assert np.allclose(q1, q2)
+    stats = robot.get_ik_cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == pytest.approx(0.5)
+
+    # Least recently used entries are evicted
+    for dz in range(1, 6):
+        robot.manip_ik((pos + np.array([0, 0, 0.01 * dz]), quat), q0=None)
+    assert len(robot.ik_cache) == 4
+    robot.manip_ik((pos, quat), q0=None)
+    assert robot.get_ik_cache_stats()["misses"] == 7
+
+
+def test_pinocchio_ik_optimization_threaded(pin_robot, test_pose):
+    np.random.seed(0)
+    pos_desired = np.array(test_pose[0])
+    quat_desired = np.array(test_pose[1])
+
+    optimizer = PositionIKOptimizer(
+        pin_robot.manip_ik_solver,
+        pos_error_tol=CEM_POS_ERROR_TOL,
+        ori_error_range=np.array([0.0, 0.0, CEM_YAW_ERROR_TOL]),
+        cem_params={"num_workers": 4, "early_exit_patience": 5},
+    )
+    q_result, success, debug_info = optimizer.compute_ik(pos_desired, quat_desired)
+    pos_out, _ = pin_robot.manip_ik_solver.compute_fk(q_result)
+    assert success
+    assert np.linalg.norm(pos_out - pos_desired) <= CEM_POS_ERROR_TOL
+    assert debug_info["best_cost"] <= CEM_POS_ERROR_TOL
+
+
+def test_cem_batched_and_warm_start():
+    np.random.seed(0)
+    target = np.array([0.3, -0.2, 0.1])
+    opt = CEM(
+        max_iterations=50,
+        num_samples=100,
+        num_top=10,
+        tol=1e-3,
+        sigma0=np.ones(3),
+    )
+
+    # Batched cost: the whole sample array is evaluated in a single call
+    def batched_cost(x_arr, warm_starts):
+        assert len(warm_starts) == len(x_arr)
+        costs = np.linalg.norm(x_arr - target, axis=-1)
+        return costs, list(x_arr)
+
+    cost, x_best, num_iters, _, success = opt.optimize(
+        batched_cost, x0=np.zeros(3), batched=True, warm_start=True
+    )
+    assert success
+    assert cost <= 1e-3
+    assert np.linalg.norm(x_best - target) <= 1e-3
+
+    # Early exit stops on a cost that can never reach the tolerance
+    opt.early_exit_patience = 3
+    cost, _, num_iters, _, success = opt.optimize(lambda x: (1.0, None), x0=np.zeros(3))
+    assert not success
+    assert num_iters == 4
+
+
+class FailingIKSolver(IKSolverBase):
+    """IK solver without solutions, whose forward kinematics must not be called"""
+
+    def get_dof(self) -> int:
+        return 3
+
+    def compute_ik(self, pos_desired, quat_desired, q_init=None, **kwargs):
+        return None, False, {}
+
+    def compute_fk(self, q):
+        raise AssertionError("compute_fk called without IK solution")
+
+
+def test_ik_optimization_without_solution(test_pose):
+    opt = PositionIKOptimizer(
+        FailingIKSolver(),
+        pos_error_tol=CEM_POS_ERROR_TOL,
+        ori_error_range=np.array([0.0, 0.0, CEM_YAW_ERROR_TOL]),
+        cem_params={"max_iterations": 3, "num_samples": 10, "num_top": 2},
+    )
+    q, success, debug_info = opt.compute_ik(
+        np.array(test_pose[0]), np.array(test_pose[1])
+    )
+    assert q is None
+    assert not success
+    assert debug_info["best_cost"] == np.inf
+
+
 def test_ros_to_pin(pin_robot, test_joints):
     pin_pose = pin_robot._ros_pose_to_pinocchio(test_joints[0])
     assert len(pin_pose) == len(test_joints[1])
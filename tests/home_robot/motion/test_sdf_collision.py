@@ -0,0 +1,66 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import os
+
+import numpy as np
+import pytest
+
+from home_robot.motion.sdf_collision import SignedDistanceField
+from home_robot.motion.stretch import (
+    STRETCH_HOME_Q,
+    HelloStretchIdx,
+    HelloStretchKinematics,
+)
+from home_robot.utils.path import REPO_ROOT_PATH
+
+URDF_ABS_PATH = os.path.join(REPO_ROOT_PATH, "assets/hab_stretch/urdf/")
+BLOCK_POS = np.array([0.0, -0.5, 0.6])
+
+
+def box_points(lower, upper, step=0.005):
+    """dense point cloud filling an axis-aligned box"""
+    axes = [np.arange(lo, hi + 1e-9, step) for lo, hi in zip(lower, upper)]
+    return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+@pytest.fixture
+def robot():
+    return HelloStretchKinematics(urdf_path=URDF_ABS_PATH)
+
+
+def test_signed_distance_field():
+    sdf = SignedDistanceField.from_points(
+        box_points([-0.1, -0.1, -0.1], [0.1, 0.1, 0.1]), resolution=0.01
+    )
+    distances = sdf.query(np.array([[0.0, 0.0, 0.0], [0.3, 0.0, 0.0], [5.0, 0, 0]]))
+    assert distances[0] < -0.05
+    assert distances[1] == pytest.approx(0.2, abs=0.02)
+    assert np.isinf(distances[2])
+
+
+def test_sdf_collision_checker_against_pybullet(robot):
+    # Same obstacle in pybullet and as a distance field
+    block = robot.backend.add_object(
+        "block", os.path.join(REPO_ROOT_PATH, "assets/red_block.urdf")
+    )
+    block.set_pose(BLOCK_POS, [0, 0, 0, 1])
+    lower, upper = block.get_aabb()
+    sdf = SignedDistanceField.from_points(box_points(lower, upper), resolution=0.01)
+
+    rng = np.random.default_rng(0)
+    qs = np.tile(STRETCH_HOME_Q, (100, 1))
+    qs[:, HelloStretchIdx.LIFT] = rng.uniform(0.3, 0.95, 100)
+    qs[:, HelloStretchIdx.ARM] = rng.uniform(0.0, 0.7, 100)
+    qs[:, HelloStretchIdx.WRIST_YAW] = rng.uniform(-1.5, 3.5, 100)
+    qs[:, HelloStretchIdx.WRIST_PITCH] = rng.uniform(-1.5, 0.5, 100)
+    pb_valid = np.array([robot.validate(q) for q in qs])
+
+    robot.create_collision_checker(sdf)
+    sdf_valid = robot.validate_batch(qs)
+    assert not np.all(pb_valid)
+    # Spheres are conservative: every pybullet collision must be detected
+    assert not np.any(sdf_valid & ~pb_valid)
+    assert np.mean(sdf_valid == pb_valid) > 0.9
+    assert robot.validate(qs[0]) == sdf_valid[0]
@@ -0,0 +1,50 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+import pytest
+
+from home_robot.motion.time_parameterization import TrapezoidalTimeParameterization
+
+MAX_VELOCITY = np.array([1.0, 0.5, np.inf])
+MAX_ACCELERATION = np.array([2.0, 1.0, np.inf])
+
+
+@pytest.fixture
+def time_parameterization():
+    return TrapezoidalTimeParameterization(MAX_VELOCITY, MAX_ACCELERATION)
+
+
+def test_single_segment(time_parameterization):
+    # Second joint is the bottleneck: accelerate for 0.5s (0.125), cruise 1.5s, decelerate 0.5s
+    waypoints = [np.zeros(3), np.array([0.5, 1.0, 10.0])]
+    times, qs, dqs = time_parameterization.parameterize(waypoints)
+    assert times[-1] == pytest.approx(2.5)
+    assert np.allclose(qs, waypoints)
+    assert np.allclose(dqs, 0)
+
+
+def test_does_not_stop_at_waypoints(time_parameterization):
+    # Collinear waypoints should take as long as the single segment
+    waypoints = [np.array([0.0, t, 0.0]) for t in np.linspace(0, 1, 11)]
+    times, qs, dqs = time_parameterization.parameterize(waypoints)
+    assert times[-1] == pytest.approx(2.5)
+    assert np.all(np.abs(dqs[1:-1, 1]) > 0)
+    assert np.all(np.diff(times) > 0)
+
+    # Resampled trajectory respects limits and integrates back to the positions
+    times, qs, dqs = time_parameterization.parameterize(waypoints, dt=0.01)
+    assert np.all(np.abs(dqs) <= MAX_VELOCITY + 1e-9)
+    ddqs = np.diff(dqs, axis=0) / np.diff(times)[:, None]
+    assert np.all(np.abs(ddqs) <= MAX_ACCELERATION + 1e-6)
+    assert np.allclose(qs[-1], waypoints[-1])
+    integrated = np.sum((dqs[1:] + dqs[:-1]) / 2 * np.diff(times)[:, None], axis=0)
+    assert np.allclose(integrated, waypoints[-1] - waypoints[0], atol=1e-3)
+
+
+def test_repeated_waypoints(time_parameterization):
+    waypoints = [np.ones(3), np.ones(3)]
+    times, qs, _ = time_parameterization.parameterize(waypoints)
+    assert len(times) == 1
+    assert np.allclose(qs[0], np.ones(3))
@@ -0,0 +1,91 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import os
+from argparse import Namespace
+
+import numpy as np
+
+from home_robot.core.abstract_perception import PerceptionModule
+from home_robot.core.interfaces import Observations
+from home_robot.perception.cached_perception import CachedPerception, get_model_id
+from home_robot.perception.detection.deferred_visualization import get_visualization
+
+
+class FakeSegmentation(PerceptionModule):
+    def __init__(self):
+        self.metadata = Namespace(thing_classes=["chair", "table"])
+        self.num_calls = 0
+
+    def predict(self, obs, depth_threshold=None, draw_instance_predictions=True):
+        self.num_calls += 1
+        instance_map = -np.ones(obs.rgb.shape[:2])
+        instance_map[obs.rgb[..., 0] > 127] = 0
+        obs.semantic = (instance_map + 1).astype(int)
+        obs.task_observations["instance_map"] = instance_map
+        obs.task_observations["instance_classes"] = np.array([1])
+        obs.task_observations["instance_scores"] = np.array([0.9], dtype=np.float32)
+        obs.task_observations["semantic_frame"] = obs.rgb.copy()
+        return obs
+
+
+def make_obs(seed: int) -> Observations:
+    rgb = np.random.RandomState(seed).randint(0, 255, (12, 16, 3)).astype(np.uint8)
+    return Observations(
+        gps=np.zeros(2),
+        compass=np.zeros(1),
+        rgb=rgb,
+        depth=np.ones((12, 16)),
+        task_observations={},
+    )
+
+
+def test_cached_perception(tmp_path):
+    model = FakeSegmentation()
+    cached = CachedPerception(model, tmp_path)
+    expected = model.predict(make_obs(0))
+    model.num_calls = 0
+
+    cached.predict(make_obs(0))
+    obs = cached.predict(make_obs(0))
+    assert model.num_calls == 1
+    assert cached.get_stats()["hits"] == 1
+    assert np.array_equal(obs.semantic, expected.semantic)
+    for k in ["instance_map", "instance_classes", "instance_scores"]:
+        assert np.array_equal(obs.task_observations[k], expected.task_observations[k])
+        assert obs.task_observations[k].dtype == expected.task_observations[k].dtype
+    assert get_visualization(obs.task_observations["semantic_frame"]).shape == (
+        12,
+        16,
+        3,
+    )
+
+    # Other frames, vocabularies, models and arguments are cache misses
+    cached.predict(make_obs(1))
+    cached.predict(make_obs(0), depth_threshold=0.5)
+    model.metadata.thing_classes = ["chair"]
+    cached.predict(make_obs(0))
+    CachedPerception(model, tmp_path, model_id="other").predict(make_obs(0))
+    assert model.num_calls == 5
+
+    # Entries persist across instances
+    model.metadata.thing_classes = ["chair", "table"]
+    CachedPerception(model, tmp_path).predict_batch([make_obs(0), make_obs(1)])
+    assert model.num_calls == 5
+
+
+def test_model_id(tmp_path):
+    checkpoint = tmp_path / "model.pth"
+    checkpoint.write_bytes(b"weights")
+    model_id = get_model_id("detic", "THRESH: 0.5", [str(checkpoint), None])
+    assert model_id.startswith("detic:")
+    assert get_model_id("detic", "THRESH: 0.5", [str(checkpoint)]) == model_id
+    # Same file name, but a different config or checkpoint
+    assert get_model_id("detic", "THRESH: 0.3", [str(checkpoint)]) != model_id
+    checkpoint.write_bytes(b"new weights")
+    assert get_model_id("detic", "THRESH: 0.5", [str(checkpoint)]) != model_id
+    os.utime(checkpoint, ns=(0, 0))
+    modified_id = get_model_id("detic", "THRESH: 0.5", [str(checkpoint)])
+    os.utime(checkpoint, ns=(10**9, 10**9))
+    assert get_model_id("detic", "THRESH: 0.5", [str(checkpoint)]) != modified_id
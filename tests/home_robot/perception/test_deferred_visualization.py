@@ -0,0 +1,56 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import functools
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from home_robot.perception.detection.deferred_visualization import (
+    DeferredVisualization,
+    get_visualization,
+)
+
+
+def render() -> np.ndarray:
+    return np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+
+
+def test_pickle_before_rendering():
+    frame = DeferredVisualization(functools.partial(render))
+    info = {"semantic_frame": frame}
+    unpickled = pickle.loads(pickle.dumps(info))
+    # Pickling does not render; the receiver renders when reading
+    assert frame._image is None
+    assert unpickled["semantic_frame"]._image is None
+    assert np.array_equal(get_visualization(unpickled["semantic_frame"]), render())
+    assert np.array_equal(get_visualization(frame), render())
+
+
+@pytest.mark.parametrize("with_executor", [False, True])
+def test_pickle_after_rendering(with_executor):
+    executor = ThreadPoolExecutor(1) if with_executor else None
+    frame = DeferredVisualization(lambda: render(), executor)
+    if executor is None:
+        frame.get()
+    else:
+        executor.shutdown(wait=True)
+    # Rendered images are pickled, even with renderers which cannot be pickled
+    unpickled = pickle.loads(pickle.dumps({"semantic_frame": frame}))
+    assert np.array_equal(get_visualization(unpickled["semantic_frame"]), render())
+    assert np.array_equal(unpickled["semantic_frame"][1:3], render()[1:3])
+
+
+def test_array_copy():
+    frame = DeferredVisualization(render)
+    image = frame.get()
+    assert np.asarray(frame) is image
+    assert np.array(frame, copy=False) is image
+    copied = np.array(frame, copy=True)
+    assert copied is not image and np.array_equal(copied, image)
+    assert np.asarray(frame, dtype=np.float32).dtype == np.float32
+    with pytest.raises(ValueError):
+        np.array(frame, dtype=np.float32, copy=False)
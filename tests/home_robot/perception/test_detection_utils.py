@@ -0,0 +1,171 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+import pytest
+import torch
+
+from home_robot.perception.detection.coco_maskrcnn.coco_categories import (
+    coco_categories,
+    coco_categories_mapping,
+)
+from home_robot.perception.detection.utils import (
+    add_masks_to_one_hot,
+    filter_depth,
+    filter_depth_batch,
+    get_category_lookup,
+    get_model_inputs,
+    lookup_categories,
+    masked_medians,
+    overlay_masks,
+)
+
+
+def overlay_masks_loop(masks, class_idcs, shape):
+    """one mask at a time, from largest to smallest"""
+    mask_sizes = [np.sum(mask) for mask in masks]
+    sorted_mask_idcs = np.argsort(mask_sizes, kind="stable")
+    semantic_mask = np.zeros(shape)
+    instance_mask = -np.ones(shape)
+    for i_mask in sorted_mask_idcs[::-1]:
+        semantic_mask[masks[i_mask].astype(bool)] = class_idcs[i_mask]
+        instance_mask[masks[i_mask].astype(bool)] = i_mask
+    return semantic_mask, instance_mask
+
+
+def filter_depth_loop(mask, depth, depth_threshold=None):
+    """one mask at a time, with np.median"""
+    md = np.median(depth[mask == 1])
+    if md == 0:
+        filter_mask = np.ones_like(mask, dtype=bool)
+    elif depth_threshold is not None:
+        filter_mask = (depth >= md + depth_threshold) | (depth <= md - depth_threshold)
+    else:
+        filter_mask = np.zeros_like(mask, dtype=bool)
+    mask_out = mask.copy()
+    mask_out[filter_mask] = 0.0
+    return mask_out
+
+
+def make_masks(seed: int, num_masks: int, shape=(30, 40)) -> np.ndarray:
+    """overlapping rectangles of distinct sizes"""
+    rng = np.random.RandomState(seed)
+    masks = np.zeros((num_masks, *shape), dtype=bool)
+    for i in range(num_masks):
+        top, left = rng.randint(0, 10, 2)
+        masks[i, top : top + 5 + 2 * i, left : left + 7 + 3 * i] = True
+    return masks[rng.permutation(num_masks)]
+
+
+def make_depth(seed: int, shape=(30, 40)) -> np.ndarray:
+    rng = np.random.RandomState(seed)
+    depth = rng.uniform(0.5, 3.0, shape)
+    depth[rng.rand(*shape) < 0.2] = 0
+    return depth
+
+
+@pytest.mark.parametrize("num_masks", [0, 1, 6])
+def test_overlay_masks(num_masks):
+    masks = make_masks(num_masks, num_masks)
+    class_idcs = np.arange(num_masks) + 3
+    semantic, instances = overlay_masks(masks, class_idcs, (30, 40))
+    expected_semantic, expected_instances = overlay_masks_loop(
+        masks, class_idcs, (30, 40)
+    )
+    assert np.array_equal(semantic, expected_semantic)
+    assert np.array_equal(instances, expected_instances)
+    assert semantic.dtype == expected_semantic.dtype
+    assert instances.dtype == expected_instances.dtype
+
+
+@pytest.mark.parametrize("num_masks", [0, 1, 6])
+@pytest.mark.parametrize("depth_threshold", [None, 0.5])
+def test_filter_depth_batch(num_masks, depth_threshold):
+    masks = make_masks(num_masks, num_masks)
+    depth = make_depth(num_masks)
+    # A mask whose median depth is invalid is removed
+    if num_masks > 0:
+        depth[masks[0]] = 0
+
+    filtered = filter_depth_batch(masks, depth, depth_threshold)
+    assert filtered.shape == masks.shape
+    assert filtered.dtype == masks.dtype
+    for mask, filtered_mask in zip(masks, filtered):
+        expected = filter_depth_loop(mask, depth, depth_threshold)
+        assert np.array_equal(filtered_mask, expected)
+        assert np.array_equal(filter_depth(mask, depth, depth_threshold), expected)
+    if num_masks > 0:
+        assert not filtered[0].any()
+
+
+def test_filter_depth_float_masks():
+    masks = make_masks(0, 3).astype(np.float32)
+    depth = make_depth(1)
+    filtered = filter_depth_batch(masks, depth, 0.3)
+    assert filtered.dtype == np.float32
+    for mask, filtered_mask in zip(masks, filtered):
+        assert np.array_equal(filtered_mask, filter_depth_loop(mask, depth, 0.3))
+
+
+def coco_one_hot_loop(class_idcs, masks, depth, num_categories):
+    """COCOMaskRCNN one-hot predictions of an image, one instance at a time"""
+    one_hot = np.zeros((*depth.shape, num_categories))
+    for j, class_idx in enumerate(class_idcs):
+        if class_idx in list(coco_categories_mapping.keys()):
+            idx = coco_categories_mapping[class_idx]
+            obj_mask = masks[j] * 1.0
+            md = np.median(depth[obj_mask == 1])
+            if md == 0:
+                filter_mask = np.ones_like(obj_mask, dtype=bool)
+            else:
+                filter_mask = (depth >= md + 50) | (depth <= md - 50)
+            obj_mask[filter_mask] = 0.0
+            one_hot[:, :, idx] += obj_mask
+    return one_hot
+
+
+def test_masked_medians():
+    masks = make_masks(2, 5)
+    masks[3] = False
+    values = np.random.RandomState(0).rand(30, 40)
+    medians = masked_medians(masks, values)
+    for mask, median in zip(masks[[0, 1, 2, 4]], medians[[0, 1, 2, 4]]):
+        assert median == np.median(values[mask])
+    assert np.isnan(medians[3])
+    assert masked_medians(masks[:0], values).shape == (0,)
+
+
+@pytest.mark.parametrize("class_idcs", [[], [56, 0, 61, 56, 90, 200], [1, 2]])
+def test_coco_one_hot(class_idcs):
+    class_idcs = np.array(class_idcs, dtype=np.int64)
+    masks = make_masks(len(class_idcs), len(class_idcs))
+    depth = make_depth(3) * 100
+    if len(class_idcs) > 0:
+        depth[masks[0]] = 0
+    num_categories = len(coco_categories)
+
+    category_lookup = get_category_lookup(coco_categories_mapping)
+    category_idcs = lookup_categories(category_lookup, class_idcs)
+    for class_idx, category_idx in zip(class_idcs, category_idcs):
+        assert category_idx == coco_categories_mapping.get(class_idx, -1)
+
+    one_hot = np.zeros((30, 40, num_categories))
+    keep = category_idcs >= 0
+    obj_masks = filter_depth_batch(masks[keep], depth, 50)
+    add_masks_to_one_hot(one_hot, obj_masks, category_idcs[keep])
+    expected = coco_one_hot_loop(class_idcs, masks, depth, num_categories)
+    assert np.array_equal(one_hot, expected)
+
+
+@pytest.mark.parametrize("input_format", ["BGR", "RGB"])
+def test_get_model_inputs(input_format):
+    images = np.random.RandomState(0).randint(0, 255, (3, 12, 16, 3)).astype(np.uint8)
+    inputs = get_model_inputs(images, input_format)
+    assert len(inputs) == 3
+    for original_image, model_input in zip(images, inputs):
+        if input_format == "RGB":
+            original_image = original_image[:, :, ::-1]
+        expected = torch.as_tensor(original_image.astype("float32").transpose(2, 0, 1))
+        assert torch.equal(model_input["image"], expected)
+        assert (model_input["height"], model_input["width"]) == (12, 16)
@@ -0,0 +1,56 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.nn as nn
+
+from home_robot.perception.detection.exported_backbone import (
+    export_backbone,
+    load_exported_backbone,
+)
+
+
+class ToyBackbone(nn.Module):
+    """patch embedding followed by an MLP, with the interface of detectron2 backbones"""
+
+    size_divisibility = 32
+
+    def __init__(self):
+        super().__init__()
+        self.patch_embed = nn.Conv2d(3, 16, 4, 4)
+        self.mlp = nn.Sequential(nn.Linear(16, 64), nn.GELU(), nn.Linear(64, 16))
+
+    def forward(self, x):
+        features = self.mlp(self.patch_embed(x).permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
+        return {"p2": features, "p3": features[:, :, ::2, ::2]}
+
+    def output_shape(self):
+        return {"p2": None, "p3": None}
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_export_backbone(tmp_path, quantize):
+    torch.manual_seed(0)
+    model = SimpleNamespace(backbone=ToyBackbone().eval())
+    x = torch.randn(2, 3, 64, 96)
+    with torch.no_grad():
+        expected = model.backbone(x)
+        path = str(tmp_path / "backbone.pt")
+        export_backbone(model, x[:1], path, quantize=quantize)
+        load_exported_backbone(model, path)
+        features = model.backbone(x)
+
+        assert list(features.keys()) == ["p2", "p3"]
+        for name, feature in features.items():
+            assert feature.shape == expected[name].shape
+            assert torch.allclose(
+                feature, expected[name], atol=0.05 if quantize else 1e-5
+            )
+
+        # Other input sizes fall back to the eager backbone
+        assert model.backbone(torch.randn(1, 3, 32, 32))["p2"].shape == (1, 16, 8, 8)
+        assert model.backbone.size_divisibility == 32
@@ -0,0 +1,82 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+import pytest
+
+import home_robot.utils.depth as du
+from home_robot.core.interfaces import Observations
+from home_robot.perception.keyframe_segmentation import (
+    KeyframeSegmentation,
+    warp_to_view,
+)
+
+HEIGHT, WIDTH, HFOV = 48, 64, 60
+CAMERA_MATRIX = du.get_camera_matrix(WIDTH, HEIGHT, HFOV)
+
+
+def make_obs(y: float = 0.0, theta: float = 0.0) -> Observations:
+    # Textured wall 2m in front of the camera
+    rgb = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    rgb[:, ::4] = 255
+    return Observations(
+        gps=np.array([0.0, y]),
+        compass=np.array([theta]),
+        rgb=rgb,
+        depth=np.full((HEIGHT, WIDTH), 2.0),
+        task_observations={},
+    )
+
+
+def segment(obs: Observations) -> Observations:
+    semantic = np.zeros((HEIGHT, WIDTH), dtype=np.int64)
+    semantic[:, WIDTH // 2 :] = 1
+    obs.semantic = semantic
+    obs.task_observations["instance_map"] = semantic - 1
+    return obs
+
+
+def test_warp_identity():
+    layer = np.arange(HEIGHT * WIDTH).reshape(HEIGHT, WIDTH)
+    depth = np.full((HEIGHT, WIDTH), 2.0)
+    pose = np.array([1.0, 2.0, 0.5])
+    (warped,), valid = warp_to_view(
+        [layer], [-1], depth, pose, 0.3, pose, 0.3, CAMERA_MATRIX, new_depth=depth
+    )
+    assert np.all(valid)
+    assert np.array_equal(warped, layer)
+
+
+def test_warp_sideways():
+    # Moving right (negative y in the world frame) shifts the image left
+    layer = np.zeros((HEIGHT, WIDTH), dtype=np.int64)
+    layer[:, WIDTH // 2 :] = 1
+    depth = np.full((HEIGHT, WIDTH), 2.0)
+    shift = 0.2 * CAMERA_MATRIX.f / 2.0
+    (warped,), valid = warp_to_view(
+        [layer], [-1], depth, np.zeros(3), 0, np.array([0, -0.2, 0]), 0, CAMERA_MATRIX
+    )
+    edge = int(np.argmax(warped[HEIGHT // 2] == 1))
+    assert edge == pytest.approx(WIDTH // 2 - shift, abs=1)
+    assert not np.all(valid[:, -int(shift) + 2 :])
+
+
+def test_keyframe_interval():
+    calls = []
+    keyframes = KeyframeSegmentation(
+        lambda obs: calls.append(1) or segment(obs),
+        CAMERA_MATRIX,
+        keyframe_interval=3,
+        max_hole_fraction=1.0,
+    )
+    for _ in range(6):
+        obs = keyframes(make_obs())
+        assert obs.semantic.sum() == HEIGHT * WIDTH // 2
+        assert np.array_equal(obs.task_observations["instance_map"], obs.semantic - 1)
+    assert len(calls) == 2
+    assert keyframes.get_stats()["keyframe_ratio"] == pytest.approx(1 / 3)
+
+    # Large motion triggers a new keyframe
+    keyframes(make_obs(theta=np.pi / 2))
+    assert len(calls) == 3
@@ -0,0 +1,139 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+import pytest
+import torch
+
+from home_robot.core.interfaces import (
+    ContinuousFullBodyAction,
+    ContinuousNavigationAction,
+    DiscreteNavigationAction,
+    Observations,
+)
+from home_robot.perception.detection.deferred_visualization import (
+    DeferredVisualization,
+)
+from home_robot.utils.binary_transport import (
+    RemoteEnvClient,
+    RemoteEnvServer,
+    decode,
+    encode,
+    get_array_codecs,
+)
+
+
+def make_obs(seed: int) -> Observations:
+    rng = np.random.RandomState(seed)
+    rgb = np.zeros((24, 32, 3), dtype=np.uint8)
+    rgb[:, 16:] = rng.randint(0, 255, 3)
+    return Observations(
+        gps=rng.rand(2),
+        compass=rng.rand(1).astype(np.float32),
+        rgb=rgb,
+        depth=rng.rand(24, 32).astype(np.float32),
+        semantic=rng.randint(0, 5, (24, 32)),
+        task_observations={
+            "goal_name": "cup",
+            "object_goal": np.int64(3),
+            "instance_scores": np.array([0.5], dtype=np.float32),
+        },
+    )
+
+
+class FakeEnv:
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.number_of_episodes = 2
+        self.num_steps = 0
+
+    def reset(self):
+        self.num_steps = 0
+        return make_obs(self.seed)
+
+    def apply_action(self, action, info=None):
+        if action == DiscreteNavigationAction.STOP:
+            raise ValueError("episode is over")
+        self.num_steps += 1
+        return make_obs(self.seed + self.num_steps), self.num_steps == 2, info
+
+
+def test_encode_decode():
+    obs = make_obs(0)
+    decoded = decode(encode(obs))
+    assert decoded.task_observations["goal_name"] == "cup"
+    assert decoded.task_observations["object_goal"] == np.int64(3)
+    assert decoded.xyz is None
+    for k in ["gps", "compass", "rgb", "depth", "semantic"]:
+        assert np.array_equal(getattr(decoded, k), getattr(obs, k))
+        assert getattr(decoded, k).dtype == getattr(obs, k).dtype
+    decoded.depth[0, 0] = 1.0
+
+    # JPEG RGB frames are lossy
+    decoded = decode(encode(obs, get_array_codecs("JPEG")))
+    assert decoded.rgb.shape == obs.rgb.shape
+    assert np.abs(decoded.rgb.astype(int) - obs.rgb).mean() < 8
+
+    # Empty arrays, whatever their codec
+    for codec in ["RAW", "ZLIB", "JPEG"]:
+        empty = {
+            "depth": np.zeros((0, 3), np.float32),
+            "rgb": np.zeros((0, 4, 3), np.uint8),
+        }
+        decoded = decode(encode(empty, get_array_codecs(codec)))
+        for k, v in empty.items():
+            assert decoded[k].shape == v.shape
+            assert decoded[k].dtype == v.dtype
+
+    values = [
+        DiscreteNavigationAction.TURN_LEFT,
+        {"x": (1, 2.5, None, True)},
+        b"bytes",
+        {1, 2},
+    ]
+    assert decode(encode(values)) == values
+    action = decode(encode(ContinuousFullBodyAction(np.ones(10), np.zeros(3))))
+    assert np.array_equal(action.joints, np.ones(10))
+    assert np.array_equal(action.xyt, np.zeros(3))
+    action = decode(encode(ContinuousNavigationAction(np.arange(3))))
+    assert np.array_equal(action.xyt, np.arange(3))
+
+
+def test_remote_envs():
+    server = RemoteEnvServer([FakeEnv(0), FakeEnv(10)])
+    num_messages = []
+
+    def send(method, message):
+        num_messages.append(method)
+        return server.handle(method, message)
+
+    envs = RemoteEnvClient(send, num_envs=2, array_codecs=get_array_codecs("JPEG"))
+    assert envs.number_of_episodes == [2, 2]
+    obs = envs.call(["reset"] * 2)
+    assert np.array_equal(obs[1].depth, make_obs(10).depth)
+    outputs = envs.call(
+        ["apply_action"] * 2,
+        [
+            {"action": DiscreteNavigationAction.MOVE_FORWARD, "info": {"e": e}}
+            for e in [0, 1]
+        ],
+    )
+    assert [output[2] for output in outputs] == [{"e": 0}, {"e": 1}]
+    assert np.array_equal(outputs[0][0].semantic, make_obs(1).semantic)
+    assert len(num_messages) == 3
+
+    with pytest.raises(RuntimeError, match="episode is over"):
+        envs.call_at(1, "apply_action", {"action": DiscreteNavigationAction.STOP})
+
+
+def test_encode_array_likes():
+    image = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+    info = {
+        "semantic_frame": DeferredVisualization(lambda: image),
+        "timestep": torch.tensor([3]),
+    }
+    decoded = decode(encode(info))
+    assert type(decoded["semantic_frame"]) is np.ndarray
+    assert np.array_equal(decoded["semantic_frame"], image)
+    assert torch.equal(decoded["timestep"], torch.tensor([3]))
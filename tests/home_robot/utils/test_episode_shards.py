@@ -0,0 +1,63 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import os
+
+import pytest
+
+from home_robot.utils.episode_shards import (
+    EpisodeResultsLog,
+    in_shard,
+    merge_results_logs,
+    parse_shard,
+)
+
+
+def test_parse_shard():
+    assert parse_shard(None) is None
+    assert parse_shard("2/4") == (2, 4)
+    for shard in ["4/4", "-1/4", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+def test_shards_partition_episodes():
+    keys = [f"scene{i % 7}_{i}" for i in range(200)]
+    shards = [[k for k in keys if in_shard(k, (i, 3))] for i in range(3)]
+    assert sorted(sum(shards, [])) == sorted(keys)
+    assert all(len(shard) > 0 for shard in shards)
+
+
+def test_results_logs(tmp_path):
+    log = EpisodeResultsLog(str(tmp_path), (0, 2))
+    log.append("a_1", {"END.success": 1.0})
+    log.append("a_2", {"END.success": 0.0})
+    # Line being written when the evaluation stopped
+    with open(log.path, "a") as f:
+        f.write('{"episode": "a_3", "met')
+    log = EpisodeResultsLog(str(tmp_path), (0, 2))
+    log.append("a_3", {"END.success": 1.0})
+    assert log.load() == {
+        "a_1": {"END.success": 1.0},
+        "a_2": {"END.success": 0.0},
+        "a_3": {"END.success": 1.0},
+    }
+
+    EpisodeResultsLog(str(tmp_path), (1, 2)).append("b_1", {"END.success": 1.0})
+    assert sorted(merge_results_logs(str(tmp_path))) == ["a_1", "a_2", "a_3", "b_1"]
+
+
+def test_results_log_start(tmp_path):
+    log = EpisodeResultsLog(str(tmp_path))
+    assert log.start(resume=False) == {}
+    log.append("a_1", {"END.success": 1.0})
+    assert log.start(resume=True) == {"a_1": {"END.success": 1.0}}
+
+    # A new evaluation keeps the previous log aside, out of merged results
+    with pytest.warns(UserWarning, match="Not resuming from the 1 episodes"):
+        assert log.start(resume=False) == {}
+    log.append("a_2", {"END.success": 0.0})
+    assert log.load() == {"a_2": {"END.success": 0.0}}
+    assert os.path.exists(log.path + ".old")
+    assert sorted(merge_results_logs(str(tmp_path))) == ["a_2"]
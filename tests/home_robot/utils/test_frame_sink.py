@@ -0,0 +1,97 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from home_robot.utils import frame_sink
+from home_robot.utils.frame_sink import FrameSink, get_video_path
+
+
+def make_frame(i: int) -> np.ndarray:
+    return np.full((48, 64, 3), 10 * i, dtype=np.uint8)
+
+
+def test_images(tmp_path):
+    sink = FrameSink(num_workers=2)
+    for i in range(5):
+        assert sink.add_frame(str(tmp_path / f"snapshot_{i:03d}.png"), make_frame(i))
+    sink.flush()
+    assert np.array_equal(cv2.imread(str(tmp_path / "snapshot_004.png")), make_frame(4))
+    sink.close()
+
+
+def test_videos(tmp_path):
+    assert get_video_path("a/planner_snapshot_12.png") == "a/planner_snapshot.mp4"
+    sink = FrameSink(video=True)
+    for i in range(6):
+        sink.add_frame(str(tmp_path / f"snapshot_{i:03d}.png"), make_frame(i))
+        sink.add_frame(
+            str(tmp_path / f"planner_snapshot_{i}.png"), make_frame(i)[..., 0]
+        )
+    sink.close_videos(str(tmp_path))
+    sink.close()
+    assert sorted(os.listdir(tmp_path)) == ["planner_snapshot.mp4", "snapshot.mp4"]
+    video = cv2.VideoCapture(str(tmp_path / "snapshot.mp4"))
+    assert int(video.get(cv2.CAP_PROP_FRAME_COUNT)) == 6
+
+
+def test_drops_frames_when_behind(tmp_path, monkeypatch):
+    unblock = threading.Event()
+    imwrite = cv2.imwrite
+    monkeypatch.setattr(
+        frame_sink.cv2, "imwrite", lambda *args: unblock.wait() and imwrite(*args)
+    )
+    sink = FrameSink(num_workers=1, max_queued_frames=2)
+    added = [
+        sink.add_frame(str(tmp_path / f"snapshot_{i:03d}.png"), make_frame(i))
+        for i in range(10)
+    ]
+    # One frame being written, two queued
+    assert sum(added) <= 3
+    assert sink.get_stats()["dropped"] == 10 - sum(added)
+    unblock.set()
+    sink.close()
+    assert len(os.listdir(tmp_path)) == sum(added)
+
+
+def test_close_videos_does_not_wait(tmp_path, monkeypatch):
+    unblock = threading.Event()
+    write = frame_sink._Worker.write_video_frame
+    monkeypatch.setattr(
+        frame_sink._Worker,
+        "write_video_frame",
+        lambda *args: unblock.wait() and write(*args),
+    )
+    sink = FrameSink(video=True, num_workers=1, max_queued_frames=2)
+    added = [
+        sink.add_frame(str(tmp_path / f"snapshot_{i:03d}.png"), make_frame(i))
+        for i in range(4)
+    ]
+    assert not all(added)
+    # Returns while the worker is full, and still finishes the video afterwards
+    closing = threading.Thread(target=sink.close_videos, args=(str(tmp_path),))
+    closing.start()
+    closing.join(timeout=5)
+    assert not closing.is_alive()
+    unblock.set()
+    sink.flush()
+    video = cv2.VideoCapture(str(tmp_path / "snapshot.mp4"))
+    assert int(video.get(cv2.CAP_PROP_FRAME_COUNT)) == sum(added)
+    sink.close()
+
+
+def test_evicted_videos_are_continued(tmp_path):
+    sink = FrameSink(video=True, num_workers=1, max_open_videos=1)
+    for name, num_frames in [("a", 3), ("b", 2), ("a", 4)]:
+        for i in range(num_frames):
+            sink.add_frame(str(tmp_path / f"{name}_{i}.png"), make_frame(i))
+    sink.close()
+    assert sorted(os.listdir(tmp_path)) == ["a.1.mp4", "a.mp4", "b.mp4"]
+    for filename, num_frames in [("a.mp4", 3), ("b.mp4", 2), ("a.1.mp4", 4)]:
+        video = cv2.VideoCapture(str(tmp_path / filename))
+        assert int(video.get(cv2.CAP_PROP_FRAME_COUNT)) == num_frames
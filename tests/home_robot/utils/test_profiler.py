@@ -0,0 +1,42 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import json
+import time
+
+from home_robot.utils.profiler import Profiler
+
+
+def test_profiler(tmp_path):
+    profiler = Profiler()
+
+    @profiler.profile("planning")
+    def plan(x):
+        time.sleep(0.002)
+        return x + 1
+
+    # Nothing is recorded while disabled
+    with profiler.span("mapping"):
+        assert plan(1) == 2
+    assert profiler.get_histograms() == {}
+
+    profiler.enable(cuda_sync=False)
+    for _ in range(3):
+        with profiler.span("mapping"):
+            plan(1)
+    histograms = profiler.get_histograms()
+    assert histograms["mapping"]["count"] == 3
+    assert histograms["planning"]["count"] == 3
+    assert sum(histograms["planning"]["counts"]) == 3
+    assert histograms["mapping"]["mean_ms"] >= histograms["planning"]["mean_ms"] >= 2
+
+    profiler.write(str(tmp_path), "scene_1")
+    with open(tmp_path / "profile" / "scene_1.trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [event["name"] for event in events] == ["planning", "mapping"] * 3
+    assert json.loads((tmp_path / "profile" / "scene_1.json").read_text()).keys() == {
+        "mapping",
+        "planning",
+    }
+    assert profiler.get_histograms() == {}
@@ -0,0 +1,137 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+import pytest
+
+pytest.importorskip("habitat")
+
+from home_robot.utils.constants import (  # noqa: E402
+    MAX_DEPTH_REPLACEMENT_VALUE,
+    MIN_DEPTH_REPLACEMENT_VALUE,
+)
+from home_robot_sim.env.habitat_ovmm_env.habitat_ovmm_env import (  # noqa: E402
+    HabitatOpenVocabManipEnv,
+)
+
+NUM_RECEPTACLES = 21
+
+
+def make_env() -> HabitatOpenVocabManipEnv:
+    """environment with only the attributes used to preprocess observations"""
+    env = HabitatOpenVocabManipEnv.__new__(HabitatOpenVocabManipEnv)
+    env.min_depth = 0.5
+    env.max_depth = 5.0
+    env.ground_truth_semantics = 1
+    env.visualize = False
+    env._obj_id_to_name_mapping = {0: "cup", 1: "bowl"}
+    env._rec_name_to_id_mapping = {f"rec{i}": i for i in range(NUM_RECEPTACLES)}
+    env._rec_id_to_name_mapping = {i: f"rec{i}" for i in range(NUM_RECEPTACLES)}
+    env._buffers = {}
+    return env
+
+
+def make_habitat_obs(seed: int, height: int = 40, width: int = 30) -> dict:
+    rng = np.random.RandomState(seed)
+    depth = rng.rand(height, width, 1).astype(np.float32)
+    depth[rng.rand(height, width, 1) < 0.1] = 0.0
+    depth[rng.rand(height, width, 1) < 0.1] = 1.0
+    receptacles = rng.randint(0, NUM_RECEPTACLES + 1, (height, width, 1))
+    receptacles[rng.rand(height, width, 1) < 0.5] = 0
+    return {
+        "robot_head_depth": depth,
+        "robot_head_rgb": rng.randint(0, 255, (height, width, 3)).astype(np.uint8),
+        "object_segmentation": (rng.rand(height, width, 1) < 0.1).astype(np.int32),
+        "receptacle_segmentation": receptacles.astype(np.int32),
+        "robot_start_compass": rng.rand(1),
+        "robot_start_gps": rng.rand(2),
+        "object_embedding": rng.rand(8),
+        "object_category": np.array([seed % 2]),
+        "start_receptacle": np.array([seed % NUM_RECEPTACLES]),
+        "goal_receptacle": np.array([(seed + 1) % NUM_RECEPTACLES]),
+        "is_holding": np.array([0.0]),
+        "joint": rng.rand(10),
+        "relative_resting_position": rng.rand(3),
+        "camera_pose": rng.rand(4, 4),
+    }
+
+
+def preprocess_depth_reference(env, depth):
+    rescaled_depth = env.min_depth + depth * (env.max_depth - env.min_depth)
+    rescaled_depth[depth == 0.0] = MIN_DEPTH_REPLACEMENT_VALUE
+    rescaled_depth[depth == 1.0] = MAX_DEPTH_REPLACEMENT_VALUE
+    return rescaled_depth[:, :, -1]
+
+
+def preprocess_semantic_reference(env, habitat_obs):
+    semantic = habitat_obs["object_segmentation"].squeeze(-1).astype(np.int64)
+    recep_seg = habitat_obs["receptacle_segmentation"].squeeze(-1).astype(np.int64)
+    recep_seg[recep_seg != 0] += 1
+    semantic = semantic + recep_seg
+    semantic[semantic == 0] = len(env._rec_id_to_name_mapping) + 2
+    return semantic
+
+
+def convert_pose_reference(hab_pose):
+    hab_pose = hab_pose.copy()
+    hab_pose[[0, 1, 2]] = hab_pose[[2, 0, 1]]
+    hab_pose[:, [0, 1, 2]] = hab_pose[:, [2, 0, 1]]
+    return hab_pose
+
+
+def copy_frames(habitat_obs_list):
+    return [
+        {k: v.copy() if isinstance(v, np.ndarray) else v for k, v in obs.items()}
+        for obs in habitat_obs_list
+    ]
+
+
+def preprocess(env, habitat_obs_list):
+    if len(habitat_obs_list) == 1:
+        return [env._preprocess_obs(habitat_obs_list[0])]
+    return env._preprocess_obs_batch(habitat_obs_list)
+
+
+def check_obs(env, obs_list, habitat_obs_list):
+    assert len(obs_list) == len(habitat_obs_list)
+    for obs, habitat_obs in zip(obs_list, habitat_obs_list):
+        depth = preprocess_depth_reference(env, habitat_obs["robot_head_depth"].copy())
+        assert obs.depth.dtype == depth.dtype
+        assert np.array_equal(obs.depth, depth)
+        assert np.array_equal(
+            obs.semantic, preprocess_semantic_reference(env, habitat_obs)
+        )
+        assert np.array_equal(
+            obs.camera_pose, convert_pose_reference(habitat_obs["camera_pose"])
+        )
+        assert np.array_equal(obs.rgb, habitat_obs["robot_head_rgb"])
+        assert obs.task_observations["semantic_max_val"] == NUM_RECEPTACLES + 2
+        assert (
+            obs.task_observations["start_recep_goal"]
+            == habitat_obs["start_receptacle"][0] + 2
+        )
+
+
+@pytest.mark.parametrize("num_envs", [1, 3])
+def test_preprocess_obs_batch(num_envs):
+    env = make_env()
+    first_habitat_obs = [make_habitat_obs(seed) for seed in range(num_envs)]
+    # Depth frames are rescaled in place, so keep the original ones to compare
+    first_obs = preprocess(env, copy_frames(first_habitat_obs))
+    check_obs(env, first_obs, first_habitat_obs)
+
+    # Intermediate buffers are reused at the next step, without changing observations
+    # kept by agents
+    next_habitat_obs = [make_habitat_obs(seed) for seed in range(10, 10 + num_envs)]
+    next_obs = preprocess(env, copy_frames(next_habitat_obs))
+    check_obs(env, next_obs, next_habitat_obs)
+    check_obs(env, first_obs, first_habitat_obs)
+
+
+def test_preprocess_read_only_depth():
+    env = make_env()
+    habitat_obs = make_habitat_obs(0)
+    expected = preprocess_depth_reference(env, habitat_obs["robot_head_depth"].copy())
+    habitat_obs["robot_head_depth"].flags.writeable = False
+    assert np.array_equal(env._preprocess_obs(habitat_obs).depth, expected)